@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from page.functions.calculator_func import Calc_Logic
+from page.functions.utils import PREVIEW_ROWS, UPLOAD_TYPES, read_upload
 
 # Set page config
 # st.set_page_config(page_title='py50: Calculation', page_icon='🧮', layout='wide')
@@ -50,21 +51,21 @@ calc = Calc_Logic()
 # Data input
 if option == 'Upload CSV File':
     # Upload the CSV file
-    uploaded_file = st.file_uploader('Upload .csv file')
+    uploaded_file = st.file_uploader('Upload .csv or .parquet file', type=UPLOAD_TYPES)
 
     # Check if a CSV file has been uploaded
     if uploaded_file is not None:
-        # Read the CSV file into a DataFrame
-        data = pd.read_csv(uploaded_file)
+        # Read the first rows for column selection. The calculator reads the selected columns from the file itself
+        data = read_upload(uploaded_file, nrows=PREVIEW_ROWS)
         st.write('## Input Table')
         st.data_editor(data, num_rows='dynamic')  # visualize dataframe in streamlit app
     else:
         # Display a message if no CSV file has been uploaded
-        st.warning('Please upload a .csv file.')
+        st.warning('Please upload a .csv or .parquet file.')
 
     # Select columns for calculation
     if uploaded_file is not None:  # nested in if/else to remove initial traceback error
-        calc.calculator_program(df=data, paste=False)
+        calc.calculator_program(df=data, paste=False, file=uploaded_file)
 
 # Editable DataFrame
 elif option == 'Paste Data':
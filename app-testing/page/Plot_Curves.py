@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from page.functions.curve_func import Plot_Logic
+from page.functions.utils import UPLOAD_TYPES, read_upload
 
 # # Set page config
 # st.set_page_config(page_title='py50: Plot Curves', page_icon='📈', layout='centered')
@@ -55,19 +56,21 @@ program = Plot_Logic()
 
 if option == "Upload CSV File":
     # Upload the CSV file
-    uploaded_file = st.file_uploader("Upload .csv file")
+    uploaded_file = st.file_uploader(
+        "Upload .csv or .parquet file", type=UPLOAD_TYPES
+    )
 
     # Check if a CSV file has been uploaded
     if uploaded_file is not None:
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(uploaded_file)
+        # Read the CSV or Parquet file into a DataFrame
+        df = read_upload(uploaded_file)
         st.write("## Input Table")
         st.data_editor(
             df, num_rows="dynamic"
         )  # visualize dataframe in streamlit app
     else:
         # Display a message if no CSV file has been uploaded
-        st.warning("Please upload a .csv file.")
+        st.warning("Please upload a .csv or .parquet file.")
 
     # Select columns for calculation
     if uploaded_file is not None:  # nested in if/else to remove initial traceback error
@@ -2,8 +2,32 @@
 Functions for Calculator
 """
 
+import io
 import streamlit as st
 from py50_streamlit_support import Calculator
+from page.functions.utils import (
+    fit_cache,
+    read_columns,
+    upload_digest,
+    PARQUET,
+    PREVIEW_ROWS,
+)
+
+# Named st.experimental_fragment before Streamlit 1.37
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+@fragment(run_every=0.5)
+def job_progress(job):
+    """
+    Progress bar of a running FitJob. The fragment runs again on its own every half second, so the script thread is
+    not blocked while the job runs. The whole page runs again once the job is done.
+    """
+    if job.done():
+        st.rerun()
+    st.progress(
+        job.progress, text=f"Fitting curves... {job.completed}/{job.total} drugs"
+    )
 
 
 class Calc_Logic:
@@ -11,19 +35,91 @@ class Calc_Logic:
         pass
 
     # todo create button in the utils script
-    # Set up download button for csv files
+    # Set up download buttons for csv and parquet files
     def download_button(self, df, file_name=None):
         csv = df.to_csv(index=False).encode("utf-8")
         st.download_button(
             "Download table as CSV", data=csv, file_name=file_name, mime="text/csv"
         )
+        if not PARQUET:
+            return
+        parquet = io.BytesIO()
+        df.to_parquet(parquet, index=False)
+        st.download_button(
+            "Download table as Parquet",
+            data=parquet.getvalue(),
+            file_name=file_name.rsplit(".", 1)[0] + ".parquet",
+            mime="application/vnd.apache.parquet",
+        )
+
+    def absolute_results(
+        self,
+        df_calc,
+        drug_name,
+        compound_conc,
+        ave_response,
+        units,
+        model="4PL",
+        prescreen=False,
+        drop_outliers=False,
+        source=None,
+    ):
+        """
+        Absolute IC50 table for the filtered data. The Calculator is kept in the session. The first calculation runs as
+        a background job with a progress bar (see job_progress()), and a rerun while it is running picks up the same
+        job. After that, edits to the table go through Calculator.update(), which only refits the drugs that changed.
+        Selecting other columns, units, curve model, or fitting options, or uploading another file, cancels the old job
+        and starts a new one.
+
+        :param source: Name, size, and digest of the uploaded file, or None for pasted data
+        :return: DataFrame, or None while the job is running
+        """
+        key = (
+            source,
+            drug_name,
+            compound_conc,
+            ave_response,
+            units,
+            model,
+            prescreen,
+            drop_outliers,
+        )
+        previous = st.session_state.get("calculator")
+        if previous is not None and previous["key"] == key:
+            data, job = previous["calculator"], previous["job"]
+            if data.calculation is not None:
+                return data.update(df_calc)
+        else:
+            if previous is not None:
+                previous["job"].cancel()
+            data = Calculator(df_calc, cache=fit_cache())
+            job = data.submit(
+                name_col=drug_name,
+                concentration_col=compound_conc,
+                response_col=ave_response,
+                input_units=units,
+                model=model,
+                prescreen=prescreen,
+                drop_outliers=drop_outliers,
+            )
+            st.session_state["calculator"] = {"key": key, "calculator": data, "job": job}
+
+        if not job.done():
+            job_progress(job)
+            return None
+        data.calculation = job.result()
 
-    def calculator_program(self, df=None, paste=True):
+        # The table may have been edited while the job was running
+        return data.update(df_calc)
+
+    def calculator_program(self, df=None, paste=True, file=None):
         """
         Program to run calculations. It must include nested if/else depending
         on whether the input dataframe is pasted or a csv file.
 
         :param df: Input dataframe
+        :param file: Uploaded csv file. If given, df is only a preview used to select columns and the selected
+            columns are read from the file in chunks.
         :return: editable dataframe
         """
         st.sidebar.markdown(":green[**Calculator Options:**]")
@@ -64,6 +160,22 @@ class Calc_Logic:
             options=["nM", "µM", "pM"],
             captions=["Nanomolor", "Micromolar", "Picomolar"],
         )
+        model = st.sidebar.selectbox(
+            "Curve Model",
+            options=["4PL", "auto", "5PL", "3PL", "constant"],
+            help="auto fits every model and keeps the best one for each drug by AIC. "
+            "5PL fits asymmetric curves. 3PL fixes the minimum at 0.",
+        )
+        prescreen = st.sidebar.checkbox(
+            "Skip Inactive Compounds",
+            help="Flat compounds are flagged as inactive without fitting a curve. "
+            "Speeds up screening data where most compounds are inactive.",
+        )
+        drop_outliers = st.sidebar.checkbox(
+            "Drop Outliers",
+            help="Replicate wells far from the other replicates and single-point spikes "
+            "are left out of the fit.",
+        )
 
         # Set conditions for calculations
         conditions = {drug_name, compound_conc, ave_response}
@@ -71,25 +183,46 @@ class Calc_Logic:
             st.write("### :red[Select Drug, Concentration, and Response Columns!]")
         else:
             st.write("## Filtered Table")
-            df_calc = drug_query.filter(
-                items=(drug_name, compound_conc, ave_response), axis=1
-            )
-            # Ensure columns are float
-            df_calc[compound_conc] = df_calc[compound_conc].astype(float)
-            df_calc[ave_response] = df_calc[ave_response].astype(float)
-
-            # Output filtered table for calculation
-            st.data_editor(df_calc, num_rows="dynamic")
+            source = None
+            if file is not None:
+                # Only the selected columns are read, once per file and column selection
+                source = (file.name, file.size, upload_digest(file))
+                df_calc = read_columns(
+                    file, source[2], drug_name, compound_conc, ave_response
+                )
+            else:
+                df_calc = drug_query.filter(
+                    items=(drug_name, compound_conc, ave_response), axis=1
+                )
+                # Ensure columns are float
+                df_calc[compound_conc] = df_calc[compound_conc].astype(float)
+                df_calc[ave_response] = df_calc[ave_response].astype(float)
 
-            # Calculate IC50
-            data = Calculator(df_calc)
+            # Output filtered table for calculation. Edits to a pasted table are used in the calculation
+            if file is not None:
+                st.data_editor(df_calc.head(PREVIEW_ROWS), num_rows="dynamic")
+            else:
+                df_calc = st.data_editor(df_calc, num_rows="dynamic")
+                # Rows added in the editor start out empty
+                df_calc = df_calc.dropna(subset=[drug_name, compound_conc])
+                df_calc[compound_conc] = df_calc[compound_conc].astype(float)
+                df_calc[ave_response] = df_calc[ave_response].astype(float)
 
-            absolute = data.calculate_absolute_ic50(
-                name_col=drug_name,
-                concentration_col=compound_conc,
-                response_col=ave_response,
-                input_units=units,
+            # Calculate IC50. Only drugs changed since the last run are fit again
+            absolute = self.absolute_results(
+                df_calc,
+                drug_name,
+                compound_conc,
+                ave_response,
+                units,
+                model,
+                prescreen,
+                drop_outliers,
+                source,
             )
+            if absolute is None:
+                return
+            data = Calculator(df_calc, cache=fit_cache())
 
             st.markdown("## Calculated Results")
 
@@ -97,6 +230,11 @@ class Calc_Logic:
             st.data_editor(absolute, num_rows="dynamic")
             self.download_button(absolute, file_name="py50_ic50.csv")
 
+            if drop_outliers:
+                dropped = st.session_state["calculator"]["calculator"].dropped_points
+                with st.expander(f"Dropped Points ({len(dropped)})"):
+                    st.dataframe(dropped)
+
             # output unit message
             st.markdown(f"Calculated Results are in {units}")
 
@@ -109,6 +247,9 @@ class Calc_Logic:
                     concentration_col=compound_conc,
                     response_col=ave_response,
                     input_units=units,
+                    model=model,
+                    prescreen=prescreen,
+                    drop_outliers=drop_outliers,
                 )
                 # Output pIC50 table
                 st.data_editor(conversion, num_rows="dynamic")
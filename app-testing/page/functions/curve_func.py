@@ -8,6 +8,7 @@ import pandas as pd
 from matplotlib import pyplot as plt
 from py50_streamlit_support.plotcurve import PlotCurve
 from py50_streamlit_support.plotcurve import CBMARKERS, CBPALETTE
+from page.functions.utils import fit_cache
 
 
 class Plot_Logic:
@@ -307,7 +308,7 @@ class Plot_Logic:
         )
         st.data_editor(df_calc, num_rows="dynamic")
 
-        plot_data = PlotCurve(drug_query)
+        plot_data = PlotCurve(drug_query, cache=fit_cache())
 
         if len(conditions) != 3:
             pass
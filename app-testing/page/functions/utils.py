@@ -4,6 +4,60 @@ Utility functions
 
 import streamlit as st
 import io
+import hashlib
+import importlib.util
+import pandas as pd
+from py50_streamlit_support import Calculator, FitCache
+
+# Number of rows shown for uploaded tables. Large files are not loaded into the table widgets in full
+PREVIEW_ROWS = 1000
+
+# Parquet upload and download need the optional pyarrow package
+PARQUET = importlib.util.find_spec("pyarrow") is not None
+UPLOAD_TYPES = ["csv", "parquet"] if PARQUET else ["csv"]
+
+
+@st.cache_resource
+def fit_cache():
+    """Curve fit cache shared by the Calculator and Plot Curves pages. Fits are keyed by the data, not the session."""
+    return FitCache()
+
+
+def read_upload(file, nrows=None):
+    """Read an uploaded .csv or .parquet file. With nrows only the first rows are read, batch by batch for Parquet."""
+    file.seek(0)
+    if file.name.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Reading .parquet files requires pyarrow. Install it with: pip install pyarrow"
+            )
+        if nrows is None:
+            return pq.read_table(file).to_pandas()
+        batch = next(pq.ParquetFile(file).iter_batches(batch_size=nrows), None)
+        return pq.read_table(file).to_pandas() if batch is None else batch.to_pandas()
+    return pd.read_csv(file, nrows=nrows)
+
+
+def upload_digest(file):
+    """Hash of the contents of an uploaded file. Tells apart uploads with the same name."""
+    return hashlib.sha256(file.getbuffer()).hexdigest()
+
+
+@st.cache_data(max_entries=4)
+def read_columns(_file, digest, name_col, concentration_col, response_col):
+    """
+    Selected columns of an uploaded .csv or .parquet file, with drug names stored as categories. The file itself is
+    not hashed by Streamlit; the cache is keyed on its digest (see upload_digest()), so reruns of the page do not read
+    the file again.
+    """
+    _file.seek(0)
+    if _file.name.endswith(".parquet"):
+        read = Calculator.from_parquet
+    else:
+        read = Calculator.from_csv
+    return read(_file, name_col, concentration_col, response_col).data
 
 
 class Fig_Buttons:
@@ -0,0 +1,117 @@
+"""
+Count the solver iterations that the starting parameters save. Every screen is fit twice on the same drugs:
+
+- once from fitting.estimate_initial_guess() and once from the old guess, which used the plateaus, a response value
+  as the ic50, and a hill slope of 1.
+- as a re-test with new noise, warm started from the results of the first screen with prior=..., and cold from the
+  data. Calculator.fit_stats reports both counts with compare_cold=True.
+
+Run from the py50_support_module directory:
+
+    python -m benchmarks.fit_iterations --compounds 1000 --screens 2
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from py50_streamlit_support import Calculator
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+def synthetic_screen(
+    n_drugs: int, n_doses: int = 10, noise: float = 3.0, seed: int = 0
+):
+    """
+    Dose-response screen with rising and falling 4PL curves and normal noise.
+
+    :return: DataFrame with "compound", "concentration", and "response" columns
+    """
+    rng = np.random.default_rng(seed)
+    concentration = np.logspace(-1, 4, n_doses)
+    ic50 = 10 ** rng.uniform(0, 3, n_drugs)
+    hill_slope = rng.uniform(0.5, 2.0, n_drugs) * rng.choice([-1, 1], n_drugs)
+    maximum = rng.uniform(80, 110, n_drugs)
+    minimum = rng.uniform(-10, 10, n_drugs)
+    curve = minimum[:, None] + (maximum - minimum)[:, None] / (
+        1 + (ic50[:, None] / concentration) ** hill_slope[:, None]
+    )
+    return pd.DataFrame(
+        {
+            "compound": np.repeat([f"D{i:05d}" for i in range(n_drugs)], n_doses),
+            "concentration": np.tile(concentration, n_drugs),
+            "response": curve.ravel() + rng.normal(0, noise, curve.size),
+        }
+    )
+
+
+def midpoint_guess(groups):
+    """
+    The starting parameters used before fitting.estimate_initial_guess(), in the warm start format of
+    Calculator._prior_guess().
+    """
+    _, response, mask = groups.padded()
+    maximum = np.max(np.where(mask, response, -np.inf), axis=1)
+    minimum = np.min(np.where(mask, response, np.inf), axis=1)
+    params = np.column_stack(
+        [maximum, minimum, 0.5 * (maximum + minimum), np.ones(len(groups))]
+    )
+    return {"params": params, "start": np.zeros(len(groups), dtype=int)}
+
+
+def count_evaluations(data: pd.DataFrame, batch: bool = False):
+    """
+    Fit every drug from both starting points.
+
+    :return: Tuple of the total model evaluations from the old guess and from the data-based guess
+    """
+    calculator = Calculator(data)
+    groups = calculator._grouped(*COLUMNS)
+    # The old guess often starts far from the curve, where the 4PL overflows
+    with np.errstate(all="ignore"):
+        old = calculator._fit_groups(groups, batch=batch, prior=midpoint_guess(groups))
+    new = calculator._fit_groups(groups, batch=batch)
+    return int(old["nfev"].sum()), int(new["nfev"].sum())
+
+
+def warm_start_stats(data: pd.DataFrame, batch: bool = False, seed: int = 0):
+    """
+    Fit the screen, then a re-test of the same drugs with new noise warm started from the first results.
+
+    :return: Calculator.fit_stats of the re-test, with its "cold_nfev", "warm_nfev", and "saved_nfev"
+    """
+    first = Calculator(data).calculate_absolute_ic50(*COLUMNS, batch=batch)
+    rng = np.random.default_rng(seed)
+    retest = data.assign(response=data["response"] + rng.normal(0, 1, len(data)))
+    calculator = Calculator(retest)
+    calculator.calculate_absolute_ic50(
+        *COLUMNS, batch=batch, prior=first, compare_cold=True
+    )
+    return calculator.fit_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--compounds", type=int, default=1000)
+    parser.add_argument("--screens", type=int, default=2)
+    args = parser.parse_args()
+
+    for seed in range(args.screens):
+        data = synthetic_screen(args.compounds, seed=seed)
+        for batch in (False, True):
+            old, new = count_evaluations(data, batch)
+            print(
+                f"screen {seed} {'batch' if batch else 'curve_fit':9s} "
+                f"old guess {old:7d}  data guess {new:7d}  saved {1 - new / old:.0%}"
+            )
+        for batch in (False, True):
+            stats = warm_start_stats(data, batch, seed)
+            cold, warm = stats["cold_nfev"], stats["warm_nfev"]
+            print(
+                f"screen {seed} {'batch' if batch else 'curve_fit':9s} "
+                f"cold start {cold:6d}  warm start {warm:6d}  saved {1 - warm / cold:.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,18 @@ Calculate and draw IC50 curves.
 
 """
 
+from .cache import *
 from .calculator import *
+from .fitting import *
+from .dataset import *
+from .jobs import *
+from .options import *
 from .plot_settings import *
 from .plotcurve import *
+from .qc import *
+from .results import *
 from .stats import *
+from .store import *
 from .utils import *
 
 __author__: "Tony E. Lin"
@@ -0,0 +1,112 @@
+"""
+Cache for curve fit results. Fits are keyed by a hash of the drug's concentration and response arrays and the model
+used to fit them, so the same curve is never fit twice. Unit conversion happens after fitting, so changing the output
+units reuses the cached fit.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+__all__ = ["FitCache", "fit_key"]
+
+
+def fit_key(concentration, response, model: str = "4PL", sigma=None):
+    """
+    Content hash for a single drug's dose-response data.
+
+    :param concentration: np.ndarray
+        Concentrations sorted in ascending order.
+    :param response: np.ndarray
+        Responses in the same order as concentration.
+    :param model: str
+        Name of the model and fitting options. Fits with different options are cached separately.
+    :param sigma: np.ndarray
+        Optional standard errors used to weight the fit.
+
+    :return: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model.encode())
+    digest.update(np.int64(len(concentration)).tobytes())
+    digest.update(np.ascontiguousarray(concentration, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(response, dtype=float).tobytes())
+    if sigma is not None:
+        digest.update(np.ascontiguousarray(sigma, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class FitCache:
+    """
+    Thread-safe least recently used (LRU) cache of curve fit results. One cache can be shared by several Calculator and
+    PlotCurve objects.
+
+    :param maxsize: int
+        Maximum number of fits to hold. The least recently used fit is dropped when the cache is full.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key: str):
+        """
+        Look up a fit and mark it as recently used.
+
+        :param key: str
+            Key from fit_key().
+
+        :return: Cached value, or None if the key is not in the cache.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value):
+        """
+        Add a fit to the cache, dropping the least recently used fits if the cache is full.
+
+        :param key: str
+            Key from fit_key().
+        :param value:
+            Fit result to store.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all fits and reset the hit and miss counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Cache statistics.
+
+        :return: Dictionary with hits, misses, current size, and maxsize.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
@@ -1,19 +1,360 @@
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from scipy.optimize import curve_fit
-from scipy.interpolate import interp1d
-from py50_streamlit_support.plot_settings import CurveSettings
+from scipy.stats import norm
+from py50_streamlit_support.fitting import (
+    FitBudget,
+    batch_fit,
+    bootstrap_fit,
+    curve_direction,
+    fit_models,
+    fourpl_bounds,
+    fourpl_covariance,
+    estimate_initial_guess,
+    fourpl_jacobian,
+    global_covariance,
+    global_fit,
+    inverse_fourpl,
+    logistic_midpoint,
+    screen_activity,
+)
+from py50_streamlit_support.dataset import (
+    GroupedData,
+    as_dataframe,
+    iter_csv_groups,
+    read_parquet,
+    response_columns,
+)
+from py50_streamlit_support.cache import FitCache, fit_key
+from py50_streamlit_support.jobs import FitJob
+from py50_streamlit_support.options import FitOptions
+from py50_streamlit_support.qc import normalize_plates, outlier_mask
+from py50_streamlit_support.results import FitResults
+from py50_streamlit_support.store import FitResultStore
 
 __all__ = ["Calculator"]
 
 
 class Calculator:
-    # Will accept input DataFrame and output said DataFrame for double checking.
-    def __init__(self, data):
-        if not isinstance(data, pd.DataFrame):
-            raise ValueError("Input must be a DataFrame")
-        self.data = data
+    # Will accept input DataFrame and output said DataFrame for double checking. pyarrow Tables are converted to a
+    # DataFrame. Use from_parquet() to read only the needed columns of a Parquet file.
+    # Fits are stored in the cache and reused by later calculations on the same data. Pass the same FitCache to
+    # several Calculator or PlotCurve objects to share fits between them.
+    def __init__(self, data, cache: FitCache = None):
+        self.data = as_dataframe(data)
         self.calculation = None
+        self.cache = cache if cache is not None else FitCache()
+        self.fit_stats = None
+        self.dropped_points = None
+        self.plate_stats = None
+        self._groups = {}
+        self._last_call = None
+
+    @classmethod
+    def from_csv(
+        cls,
+        path,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+        chunksize: int = 100000,
+        cache: FitCache = None,
+        **kwargs,
+    ):
+        """
+        Build a Calculator from a CSV file without loading the whole table. The file is read in chunks and only the
+        name, concentration, and response columns are kept. Drug names are stored as a categorical column, so repeated
+        names take one small integer per row. Use stream_csv() to get results while the file is still being read.
+
+        :param path: str or file-like
+            CSV file to read.
+        :param name_col: str
+            Name column from the file.
+        :param concentration_col: str
+            Concentration column from the file.
+        :param response_col: str or list
+            Response column from the file. A list of columns holds one replicate per column.
+        :param chunksize: int
+            Number of rows to parse at a time.
+        :param cache: FitCache
+            Optional fit cache to share with other Calculator or PlotCurve objects.
+        :param kwargs:
+            Passed on to pd.read_csv().
+
+        :return: Calculator
+        """
+        value_cols = [concentration_col] + response_columns(response_col)
+        reader = pd.read_csv(
+            path,
+            usecols=[name_col] + value_cols,
+            dtype={name_col: "category", **dict.fromkeys(value_cols, float)},
+            chunksize=chunksize,
+            **kwargs,
+        )
+        # Every chunk is copied into one buffer as it is read, so the parsed chunks are not held until the end. Each
+        # chunk has its own categories, so they are mapped onto one set of codes in order of first appearance
+        names = {}
+        rows = 0
+        codes = np.empty(chunksize, dtype=np.int32)
+        values = np.empty((chunksize, len(value_cols)))
+        for chunk in reader:
+            end = rows + len(chunk)
+            if end > len(codes):
+                # resize() reallocates in place where it can, so the rows read so far are not held twice
+                capacity = max(end, 2 * len(codes))
+                codes.resize(capacity, refcheck=False)
+                values.resize((capacity, len(value_cols)), refcheck=False)
+            categories = chunk[name_col].cat
+            lookup = [
+                names.setdefault(name, len(names)) for name in categories.categories
+            ]
+            # Missing names have code -1, which picks the -1 appended to the lookup
+            lookup = np.array(lookup + [-1], dtype=np.int32)
+            codes[rows:end] = lookup[categories.codes.to_numpy()]
+            values[rows:end] = chunk[value_cols].to_numpy()
+            rows = end
+
+        codes.resize(rows, refcheck=False)
+        values.resize((rows, len(value_cols)), refcheck=False)
+        # The value columns share the buffer as one block, so pandas does not copy them
+        data = pd.DataFrame(values, columns=value_cols, copy=False)
+        data.insert(
+            0, name_col, pd.Categorical.from_codes(codes, categories=list(names))
+        )
+        return cls(data, cache=cache)
+
+    @classmethod
+    def from_parquet(
+        cls,
+        path,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+        names=None,
+        cache: FitCache = None,
+        **kwargs,
+    ):
+        """
+        Build a Calculator from a Parquet file. Only the name, concentration, and response columns are read, and with
+        names only the rows of those drugs. See dataset.read_parquet(). Requires pyarrow.
+
+        :param path: str or file-like
+            Parquet file, or a folder of Parquet files.
+        :param name_col: str
+            Name column from the file.
+        :param concentration_col: str
+            Concentration column from the file.
+        :param response_col: str or list
+            Response column from the file. A list of columns holds one replicate per column.
+        :param names: list
+            Optional drug names to read. If None, every drug is read.
+        :param cache: FitCache
+            Optional fit cache to share with other Calculator or PlotCurve objects.
+        :param kwargs:
+            Passed on to pyarrow.parquet.read_table().
+
+        :return: Calculator
+        """
+        data = read_parquet(
+            path, name_col, concentration_col, response_col, names=names, **kwargs
+        )
+        return cls(data, cache=cache)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        name,
+        concentration,
+        response,
+        cache: FitCache = None,
+        name_col: str = "compound_name",
+        concentration_col: str = "concentration",
+        response_col: str = "response",
+    ):
+        """
+        Build a Calculator straight from arrays, for example the output of a normalization step. The grouped view is
+        built from the arrays without a DataFrame, and self.data is left as an empty DataFrame with the column names.
+        Pass the same column names to the calculate methods.
+
+        :param name: array-like
+            Drug name of every row.
+        :param concentration: array-like
+            Concentration of every row.
+        :param response: array-like
+            Response of every row. A 2-D array holds one replicate per column.
+        :param cache: FitCache
+            Optional fit cache to share with other Calculator or PlotCurve objects.
+        :param name_col: str
+            Name to use for the drug name column.
+        :param concentration_col: str
+            Name to use for the concentration column.
+        :param response_col: str
+            Name to use for the response column.
+
+        :return: Calculator
+        """
+        return cls._from_groups(
+            GroupedData.from_arrays(name, concentration, response),
+            cache,
+            name_col,
+            concentration_col,
+            response_col,
+        )
+
+    @classmethod
+    def from_store(
+        cls,
+        path,
+        cache: FitCache = None,
+        name_col: str = "compound_name",
+        concentration_col: str = "concentration",
+        response_col: str = "response",
+    ):
+        """
+        Open a store written by save_store() or GroupedData.save(). The data is memory-mapped with np.load instead of
+        parsed, so repeat analyses of the same campaign with other units or models start at once. Worker processes
+        started with n_jobs or executor map the same files, so they share the pages instead of receiving copies. As
+        with from_arrays(), self.data is left empty and the column names are passed to the calculate methods.
+
+        :param path: str
+            Folder of the store.
+        :param cache: FitCache
+            Optional fit cache to share with other Calculator or PlotCurve objects.
+        :param name_col: str
+            Name to use for the drug name column.
+        :param concentration_col: str
+            Name to use for the concentration column.
+        :param response_col: str
+            Name to use for the response column.
+
+        :return: Calculator
+        """
+        return cls._from_groups(
+            GroupedData.load(path), cache, name_col, concentration_col, response_col
+        )
+
+    @classmethod
+    def _from_groups(
+        cls,
+        groups,
+        cache: FitCache = None,
+        name_col: str = "compound_name",
+        concentration_col: str = "concentration",
+        response_col: str = "response",
+    ):
+        """
+        Calculator around a grouped view that was not built from a DataFrame. The view is stored as the result of
+        _grouped() for the given column names.
+
+        :return: Calculator
+        """
+        calculator = cls(
+            pd.DataFrame(columns=[name_col, concentration_col, response_col]),
+            cache=cache,
+        )
+        key = (name_col, concentration_col, tuple(response_columns(response_col)))
+        calculator._groups[key] = groups
+        return calculator
+
+    def save_store(
+        self,
+        path,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+    ):
+        """
+        Save the grouped data of the given columns as a store for from_store(). Replicates are saved already reduced,
+        with their weights and wells, so the store gives the same results as the DataFrame.
+
+        :param path: str
+            Folder to write.
+        :param name_col: str
+            Name column from DataFrame.
+        :param concentration_col: str
+            Concentration column from DataFrame.
+        :param response_col: str or list
+            Response column from DataFrame. A list of columns holds one replicate per column.
+        """
+        self._grouped(name_col, concentration_col, response_col).save(path)
+
+    @classmethod
+    def from_plates(
+        cls,
+        name,
+        concentration,
+        plate,
+        signal,
+        positive,
+        negative,
+        min_z_prime: float = None,
+        cache: FitCache = None,
+    ):
+        """
+        Normalize raw plate signals to percent inhibition with qc.normalize_plates() and build a Calculator from the
+        sample wells with from_arrays(). Control wells and wells without a concentration (such as empty or solvent
+        wells) are left out of the fit. The Z'-factor and signal window of
+        every plate are stored in self.plate_stats. Use the default column names of from_arrays() with the calculate
+        methods.
+
+        :param name: array-like
+            Drug name of every well. Ignored for control wells.
+        :param concentration: array-like
+            Concentration of every well. Ignored for control wells.
+        :param plate: array-like
+            Plate label of every well.
+        :param signal: array-like
+            Raw signal of every well.
+        :param positive: array-like
+            Boolean array, True for the positive (full inhibition) control wells.
+        :param negative: array-like
+            Boolean array, True for the negative (no inhibition) control wells.
+        :param min_z_prime: float
+            Leave out the sample wells of plates with a lower Z'-factor, for example 0.5. Plates whose Z'-factor
+            could not be calculated are left out as well. If None, every plate is used.
+        :param cache: FitCache
+            Optional fit cache to share with other Calculator or PlotCurve objects.
+
+        :return: Calculator
+        """
+        inhibition, stats = normalize_plates(plate, signal, positive, negative)
+        concentration = np.asarray(concentration, dtype=float)
+        controls = np.asarray(positive, dtype=bool) | np.asarray(negative, dtype=bool)
+        keep = ~controls & np.isfinite(concentration)
+        stats["passed"] = np.ones(len(stats["plate"]), dtype=bool)
+        if min_z_prime is not None:
+            stats["passed"] = stats["z_prime"] >= min_z_prime
+            position = pd.Index(stats["plate"]).get_indexer(np.asarray(plate))
+            keep &= stats["passed"][position]
+
+        calculator = cls.from_arrays(
+            np.asarray(name)[keep],
+            concentration[keep],
+            inhibition[keep],
+            cache=cache,
+        )
+        calculator.plate_stats = pd.DataFrame(stats)
+        return calculator
+
+    def to_parquet(self, path, **kwargs):
+        """
+        Write the last calculation to a Parquet file. Requires pyarrow.
+
+        :param path: str or file-like
+            File to write.
+        :param kwargs:
+            Passed on to pyarrow.parquet.write_table(), for example compression.
+        """
+        if self.calculation is None:
+            raise ValueError("Run a calculation before calling to_parquet()")
+        results = self.calculation
+        if isinstance(results, pd.DataFrame):
+            results = FitResults.from_pandas(results)
+        results.to_parquet(path, **kwargs)
 
     def show(self, rows: int = None):
         """
@@ -42,6 +383,99 @@ class Calculator:
             raise ValueError("Column not found")
         return self.data[key]
 
+    def _grouped(
+        self,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+        drop_outliers=False,
+    ):
+        """
+        Return the grouped view of the input DataFrame for the given columns. The view is built once with a single
+        sort and reused by every calculation on this Calculator.
+
+        :param name_col: str
+            Name column from DataFrame.
+        :param concentration_col: str
+            Concentration column from DataFrame.
+        :param response_col: str or list
+            Response column from DataFrame. A list of columns holds one replicate per column.
+        :param drop_outliers: bool or dict
+            Return the view without the outliers found by qc.outlier_mask(), and list them in self.dropped_points. A
+            dict is passed on to outlier_mask() as thresholds.
+
+        :return: GroupedData
+        """
+        key = (name_col, concentration_col, tuple(response_columns(response_col)))
+        if key not in self._groups:
+            self._groups[key] = GroupedData.from_frame(
+                self.data, name_col, concentration_col, response_col
+            )
+        if not drop_outliers:
+            return self._groups[key]
+
+        thresholds = {} if drop_outliers is True else dict(drop_outliers)
+        clean_key = key + (tuple(sorted(thresholds.items())),)
+        if clean_key not in self._groups:
+            self._groups[clean_key] = self._drop_outliers(
+                self._groups[key], thresholds
+            )
+        groups, self.dropped_points = self._groups[clean_key]
+        return groups
+
+    @staticmethod
+    def _drop_outliers(groups, thresholds: dict = None):
+        """
+        Remove the replicate outliers and spikes found by qc.outlier_mask() from a grouped view.
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame.
+        :param thresholds: dict
+            Keyword arguments for outlier_mask().
+
+        :return: Tuple of the cleaned GroupedData and a DataFrame of the dropped points, with the drug name,
+            concentration, response, and the reason ("replicate outlier" or "spike"). A spike is reported with the
+            mean response of its dose.
+        """
+        conc_pad, resp_pad, mask = groups.padded()
+        flags = outlier_mask(
+            conc_pad, resp_pad, mask, groups.padded_wells(), **(thresholds or {})
+        )
+        spikes = flags["spikes"][mask]
+        wells = None if flags["wells"] is None else flags["wells"][mask]
+
+        names = np.repeat(groups.names, groups.lengths)
+        rows = np.flatnonzero(spikes)
+        parts = [
+            pd.DataFrame(
+                {
+                    "compound_name": names[rows],
+                    "concentration": groups.concentration[rows],
+                    "response": groups.response[rows],
+                    "reason": "spike",
+                }
+            )
+        ]
+        if wells is not None:
+            rows, replicate = np.nonzero(wells & ~spikes[:, None])
+            parts.append(
+                pd.DataFrame(
+                    {
+                        "compound_name": names[rows],
+                        "concentration": groups.concentration[rows],
+                        "response": groups.wells[rows, replicate],
+                        "reason": "replicate outlier",
+                    }
+                )
+            )
+        report = pd.concat(parts, ignore_index=True)
+        report = report.sort_values(
+            ["compound_name", "concentration"], kind="stable", ignore_index=True
+        )
+        # Reduced again even if nothing was dropped. The replicates are then summed in the same order whether or not
+        # other drugs in the table had outliers, so a drug's result does not depend on the rest of the table
+        return groups.without(spikes, wells), report
+
     """Functions for calculations below"""
 
     def calculate_ic50(
@@ -51,6 +485,8 @@ class Calculator:
         response_col: str = None,
         input_units: str = None,
         verbose: bool = None,
+        as_frame: bool = True,
+        **fit_options,
     ):
         """
         Calculations previously performed in relative_calculation(). The dictionary results are converted into into a
@@ -60,24 +496,34 @@ class Calculator:
             Name column from DataFrame
         :param concentration_col: str
             Concentration column from DataFrame
-        :param response_col: str
-            Response column from DataFrame
+        :param response_col: str or list
+            Response column from DataFrame. Replicates can be given as repeated rows with the same drug and
+            concentration, or as a list of response columns. They are reduced to their mean and weighted by their
+            standard error.
         :param input_units: str
             Units of input dataset. Default is nM.
         :param verbose: bool
             Output drug concentration units.
+        :param as_frame: bool
+            Return a pandas DataFrame. If False, return the FitResults container, which skips building the DataFrame.
+        :param fit_options:
+            Fitting options such as model, batch, standard_errors, prescreen, or drop_outliers. See options.FitOptions.
+            The bootstrap options and store are only available for the absolute IC50 and pIC50.
 
         :return: DataFrame generated from the list from the relative_calculation method
         """
+        options = FitOptions(**fit_options)
+        options.check("relative", "calculate_ic50()")
+        self._remember("calculate_ic50", locals())
 
-        # Set variables from function and convert name_col to np array
-        values = self._relative_calculation(
-            name_col, concentration_col, response_col, input_units, verbose
+        groups = self._grouped(
+            name_col, concentration_col, response_col, options.drop_outliers
+        )
+        values = self._calculate_groups(
+            groups, "relative", input_units, verbose, options=options, name_col=name_col
         )
 
-        result_df = pd.DataFrame(values)
-
-        self.calculation = result_df
+        self.calculation = values.to_pandas() if as_frame else values
         return self.calculation
 
     def calculate_absolute_ic50(
@@ -87,6 +533,9 @@ class Calculator:
         response_col: str = None,
         input_units: str = None,
         verbose: bool = None,
+        target: float = 50,
+        as_frame: bool = True,
+        **fit_options,
     ):
         """
         Calculations previously performed in absolute_calculation(). The dictionary results are converted into a
@@ -96,26 +545,44 @@ class Calculator:
             Name column from DataFrame
         :param concentration_col: str
             Concentration column from DataFrame
-        :param response_col: str
-            Response column from DataFrame
+        :param response_col: str or list
+            Response column from DataFrame. Replicates can be given as repeated rows with the same drug and
+            concentration, or as a list of response columns. They are reduced to their mean and weighted by their
+            standard error.
         :param input_units: str
             Units of input dataset. Default is nM.
         :param verbose: bool
             Output drug concentration units.
-
-        :return: DataFrame generated from the list from the absolute_calculation method
+        :param target: float
+            Response used for the absolute IC value. Default is 50 for the absolute IC50. Other values give the
+            absolute IC-X, for example target=90 for the absolute IC90.
+        :param as_frame: bool
+            Return a pandas DataFrame. If False, return the FitResults container, which skips building the DataFrame.
+        :param fit_options:
+            Fitting options such as model, batch, standard_errors, bootstrap, prescreen, drop_outliers, or store. See
+            options.FitOptions.
+
+        :return: DataFrame generated from the list from the absolute_calculation method. The "target reached" column
+            is False for drugs whose fitted curve never crosses the target response. Their absolute IC50 is NaN.
         """
+        options = FitOptions(**fit_options)
+        options.check("absolute", "calculate_absolute_ic50()")
+        self._remember("calculate_absolute_ic50", locals())
 
-        values = self._absolute_calculation(
+        groups = self._grouped(
+            name_col, concentration_col, response_col, options.drop_outliers
+        )
+        values = self._calculate_groups(
+            groups,
+            "absolute",
+            input_units,
+            verbose,
+            target,
+            options=options,
             name_col=name_col,
-            concentration_col=concentration_col,
-            response_col=response_col,
-            input_units=input_units,
-            verbose=verbose,
         )
-        result_df = pd.DataFrame(values)
 
-        self.calculation = result_df
+        self.calculation = values.to_pandas() if as_frame else values
         return self.calculation
 
     def calculate_pic50(
@@ -125,6 +592,8 @@ class Calculator:
         response_col: str = None,
         input_units: str = None,
         verbose: bool = None,
+        as_frame: bool = True,
+        **fit_options,
     ):
         """
         Convert IC50 into pIC50 values. Calculation is performed using the absolute_calculation. As such, two columns
@@ -135,50 +604,480 @@ class Calculator:
             Name column from DataFrame
         :param concentration_col: str
             Concentration column from DataFrame
-        :param response_col: str
-            Response column from DataFrame
+        :param response_col: str or list
+            Response column from DataFrame. Replicates can be given as repeated rows with the same drug and
+            concentration, or as a list of response columns. They are reduced to their mean and weighted by their
+            standard error.
         :param input_units: str
             Units of input dataset. Default is nM.
         :param verbose: bool
             Output drug concentration units.
+        :param as_frame: bool
+            Return a pandas DataFrame. If False, return the FitResults container, which skips building the DataFrame.
+        :param fit_options:
+            Fitting options, as for calculate_absolute_ic50(). See options.FitOptions.
 
         :return: DataFrame from calculate_absolute_ic50 along with the pIC50 values
         """
-        values = self._absolute_calculation(
-            name_col=name_col,
-            concentration_col=concentration_col,
-            response_col=response_col,
-            input_units=input_units,
-            verbose=verbose,
+        options = FitOptions(**fit_options)
+        options.check("pic50", "calculate_pic50()")
+        self._remember("calculate_pic50", locals())
+
+        groups = self._grouped(
+            name_col, concentration_col, response_col, options.drop_outliers
+        )
+        values = self._calculate_groups(
+            groups, "pic50", input_units, verbose, options=options, name_col=name_col
         )
-        result_df = pd.DataFrame(values)
+        values = self._pic50_columns(values, input_units)
 
-        if input_units is None or input_units == "nM":
-            result_df["relative pIC50"] = -np.log10(
-                result_df["relative ic50 (nM)"] * 1e-9
+        self.calculation = values.to_pandas() if as_frame else values
+        return self.calculation
+
+    def submit(
+        self,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+        input_units: str = None,
+        verbose: bool = None,
+        calculation: str = "absolute",
+        target: float = 50,
+        chunk_size: int = None,
+        callback=None,
+        **fit_options,
+    ):
+        """
+        Run a calculation in the background. Drugs are fit in chunks on a worker thread and the returned FitJob can
+        report progress, return the rows finished so far, or cancel the rest of the work. Fits are added to the cache
+        as each chunk finishes, so a cancelled job is not wasted.
+
+        :param name_col: str
+            Name column from DataFrame
+        :param concentration_col: str
+            Concentration column from DataFrame
+        :param response_col: str or list
+            Response column from DataFrame. Replicates can be given as repeated rows with the same drug and
+            concentration, or as a list of response columns. They are reduced to their mean and weighted by their
+            standard error.
+        :param input_units: str
+            Units of input dataset. Default is nM.
+        :param verbose: bool
+            Output drug concentration units.
+        :param calculation: str
+            "relative" for calculate_ic50(), "absolute" for calculate_absolute_ic50(), or "pic50" for
+            calculate_pic50(). Default is "absolute".
+        :param target: float
+            Response used for the absolute IC value. Ignored for "relative" and "pic50".
+        :param chunk_size: int
+            Number of drugs fit between progress updates. Default splits the drugs into 20 chunks.
+        :param callback: callable
+            Called as callback(completed, total) after every chunk. Runs on the worker thread.
+        :param fit_options:
+            Fitting options of the matching calculate method, see options.FitOptions. Raises ValueError for shared,
+            group_col, and store (FitOptions.CHUNKED), which cannot be split into chunks.
+
+        :return: FitJob. FitJob.result() gives the same DataFrame as the matching calculate method. Store it in
+            self.calculation to use update() afterward. self.fit_stats adds up the chunks finished so far.
+        """
+        options = FitOptions(**fit_options)
+        options.check(calculation, "submit()", FitOptions.CHUNKED)
+        method = {
+            "relative": "calculate_ic50",
+            "absolute": "calculate_absolute_ic50",
+            "pic50": "calculate_pic50",
+        }[calculation]
+        arguments = dict(locals())
+        if calculation != "absolute":
+            arguments.pop("target")
+        for name in ("calculation", "chunk_size", "callback", "method"):
+            arguments.pop(name)
+        self._remember(method, arguments)
+
+        groups = self._grouped(
+            name_col, concentration_col, response_col, options.drop_outliers
+        )
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(groups) // 20))
+        chunks = [
+            groups.subset(start, min(start + chunk_size, len(groups)))
+            for start in range(0, len(groups), chunk_size)
+        ]
+
+        # Every chunk is fit by its own Calculator on the shared cache, and its statistics are added to self.fit_stats
+        # under the lock, so a read on another thread sees the chunks finished so far
+        self.fit_stats = {
+            "compounds": 0,
+            "cache_hits": 0,
+            "fits": 0,
+            "nfev": 0,
+            "njev": 0,
+        }
+        lock = threading.Lock()
+
+        def fit_chunk(chunk):
+            worker = Calculator(self.data, cache=self.cache)
+            values = worker._calculate_groups(
+                chunk, calculation, input_units, verbose, target, options=options
             )
-            result_df["absolute pIC50"] = -np.log10(
-                result_df["absolute ic50 (nM)"] * 1e-9
+            with lock:
+                stats = dict(self.fit_stats)
+                for field, count in worker.fit_stats.items():
+                    stats[field] = stats.get(field, 0) + count
+                self.fit_stats = stats
+            return values
+
+        def build(parts):
+            return self._build_frame(parts, calculation, input_units)
+
+        job = FitJob(len(groups), callback=callback)
+        job._start(chunks, fit_chunk, build)
+        return job
+
+    def update(self, data: pd.DataFrame):
+        """
+        Repeat the last calculation on an edited copy of the input DataFrame. Drugs are compared with the previous
+        data by content hash (see GroupedData.content_hashes()) and only the drugs that were added or changed are
+        calculated again, with the same options. Their rows are merged into self.calculation, so unchanged drugs keep
+        their results, including any bootstrap intervals. Drugs no longer in the data are dropped. Global fits with
+        shared parameters are always calculated again. The result is the same as repeating the calculation on the
+        whole table, and self.fit_stats covers every drug, with unchanged drugs that were fit counted as cache hits.
+
+        :param data: pd.DataFrame or pyarrow.Table
+            Edited input DataFrame with the same columns as before.
+
+        :return: DataFrame, or FitResults if the last calculation returned FitResults, sorted by drug name.
+        """
+        data = as_dataframe(data)
+        if self._last_call is None:
+            raise ValueError("Run a calculation before calling update()")
+
+        method, options = self._last_call
+        name_col = options["name_col"]
+        columns = (name_col, options["concentration_col"], options["response_col"])
+        old = self._grouped(*columns)
+        previous = self.calculation
+
+        self.data = data
+        self._groups = {}
+        new = self._grouped(*columns)
+        # A global fit couples the drugs, so any edit changes every drug that shares parameters with it
+        if previous is None or len(previous) != len(old) or options.get("shared"):
+            return getattr(self, method)(**options)
+
+        old_hashes = dict(zip(old.names, old.content_hashes()))
+        changed = [
+            name
+            for name, content in zip(new.names, new.content_hashes())
+            if old_hashes.get(name) != content
+        ]
+
+        as_frame = isinstance(previous, pd.DataFrame)
+        if as_frame:
+            previous = FitResults.from_pandas(previous)
+        unchanged = set(new.names) - set(changed)
+        kept = previous.take([name in unchanged for name in previous.names])
+        if changed:
+            calculator = Calculator(
+                data[data[name_col].isin(changed)], cache=self.cache
             )
-        elif input_units == "µM":
-            result_df["relative pIC50"] = -np.log10(
-                result_df["relative ic50 (µM)"] * 1e-6
+            rows = getattr(calculator, method)(**{**options, "as_frame": False})
+            stats = dict(calculator.fit_stats)
+            kept = FitResults.concat([kept, rows])
+        else:
+            stats = {"compounds": 0, "cache_hits": 0, "fits": 0, "nfev": 0, "njev": 0}
+
+        # Outliers of unchanged drugs are kept, and the changed drugs were screened again
+        if options.get("drop_outliers"):
+            report = self.dropped_points
+            parts = [report[report["compound_name"].isin(unchanged)]]
+            if changed:
+                parts.append(calculator.dropped_points)
+            self.dropped_points = pd.concat(parts, ignore_index=True).sort_values(
+                ["compound_name", "concentration"], kind="stable", ignore_index=True
             )
-            result_df["absolute pIC50"] = -np.log10(
-                result_df["absolute ic50 (µM)"] * 1e-6
+
+        merged = kept.take(pd.Index(kept.names).get_indexer(new.names))
+        # The statistics cover the whole table. Unchanged drugs keep their fits and count as cache hits, except the
+        # inactive ones, which were never fit
+        reused = ~pd.Index(new.names).isin(changed)
+        if options.get("prescreen"):
+            inactive = np.asarray(merged["activity"]) == "inactive"
+            stats["inactive"] = int(inactive.sum())
+            reused &= ~inactive
+        stats["compounds"] = len(new)
+        stats["cache_hits"] += int(reused.sum())
+        self.fit_stats = stats
+        self.calculation = merged.to_pandas() if as_frame else merged
+        return self.calculation
+
+    @classmethod
+    def stream_csv(
+        cls,
+        path,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+        input_units: str = None,
+        verbose: bool = None,
+        calculation: str = "absolute",
+        target: float = 50,
+        chunksize: int = 100000,
+        cache: FitCache = None,
+        **kwargs,
+    ):
+        """
+        Calculate while a large CSV file is being read. The file is parsed in chunks and every chunk of complete drugs
+        is fit and returned before the next chunk is read, so the first results arrive early and only one chunk is
+        held in memory. The rows of each drug must be next to each other in the file. See dataset.iter_csv_groups().
+
+        :param path: str or file-like
+            CSV file to read.
+        :param name_col: str
+            Name column from the file
+        :param concentration_col: str
+            Concentration column from the file
+        :param response_col: str or list
+            Response column from the file. See calculate_ic50() for replicates.
+        :param input_units: str
+            Units of input dataset. Default is nM.
+        :param verbose: bool
+            Output drug concentration units.
+        :param calculation: str
+            "relative", "absolute", or "pic50". See submit().
+        :param target: float
+            Response used for the absolute IC value. Ignored for "relative" and "pic50".
+        :param chunksize: int
+            Number of rows to parse at a time.
+        :param cache: FitCache
+            Optional fit cache to share with other Calculator or PlotCurve objects.
+        :param kwargs:
+            Fitting options of the matching calculate method, see options.FitOptions. Raises ValueError for the options
+            that submit() does not support, and for drop_outliers, whose dropped points could not be reported. Other
+            keyword arguments are passed on to pd.read_csv().
+
+        :return: Generator of DataFrames, one per chunk, in the same format as the matching calculate method.
+        """
+        fit_options = {
+            name: kwargs.pop(name)
+            for name in list(kwargs)
+            if name in FitOptions.DEFAULTS
+        }
+        options = FitOptions(**fit_options)
+        options.check(
+            calculation, "stream_csv()", FitOptions.CHUNKED + ("drop_outliers",)
+        )
+        return cls._stream_csv(
+            path,
+            name_col,
+            concentration_col,
+            response_col,
+            input_units,
+            verbose,
+            calculation,
+            target,
+            chunksize,
+            cache,
+            options,
+            kwargs,
+        )
+
+    @classmethod
+    def _stream_csv(
+        cls,
+        path,
+        name_col,
+        concentration_col,
+        response_col,
+        input_units,
+        verbose,
+        calculation,
+        target,
+        chunksize,
+        cache,
+        options,
+        kwargs,
+    ):
+        """Generator behind stream_csv(), so invalid options raise when stream_csv() is called, not on the first chunk"""
+        calculator = cls(pd.DataFrame(), cache=cache)
+        for groups in iter_csv_groups(
+            path, name_col, concentration_col, response_col, chunksize, **kwargs
+        ):
+            values = calculator._calculate_groups(
+                groups, calculation, input_units, verbose, target, options=options
             )
-        elif input_units == "pM":
-            result_df["relative pIC50"] = -np.log10(
-                result_df["relative ic50 (pM)"] * 1e-12
+            yield calculator._build_frame([values], calculation, input_units)
+
+    """Support functions below"""
+
+    def _remember(self, method: str, arguments: dict):
+        """
+        Store the calculate method and its arguments, so update() can repeat the calculation. The fitting options are
+        stored as keyword arguments of their own.
+        """
+        arguments = dict(arguments)
+        for name in ("self", "options"):
+            arguments.pop(name, None)
+        arguments.update(arguments.pop("fit_options", {}))
+        self._last_call = (method, arguments)
+
+    def _calculate_groups(
+        self,
+        groups,
+        calculation: str = "absolute",
+        input_units: str = None,
+        verbose: bool = None,
+        target: float = 50,
+        options: FitOptions = None,
+        name_col: str = None,
+    ):
+        """
+        Fit a grouped view through the cache and build its output rows. Used by the calculate methods for the whole
+        table, and by submit() and stream_csv() for one chunk of drugs at a time.
+
+        :param groups: GroupedData
+            Drugs to fit.
+        :param calculation: str
+            "relative", "absolute", or "pic50". The pIC50 columns are added later by _pic50_columns().
+        :param input_units: str
+            Concentration units for tested drug. By default, units given will be in nM.
+        :param verbose: bool
+            Output drug concentration units.
+        :param target: float
+            Response used for the absolute IC value. Ignored for "relative" and "pic50".
+        :param options: FitOptions
+            Checked fitting options. Default is FitOptions().
+        :param name_col: str
+            Name column from DataFrame. Only needed with options.group_col.
+
+        :return: FitResults with one row per drug
+        """
+        options = FitOptions() if options is None else options
+        fits = self._cached_fit_groups(
+            groups,
+            n_jobs=options.n_jobs,
+            executor=options.executor,
+            batch=options.batch,
+            max_nfev=options.max_nfev,
+            time_budget=options.time_budget,
+            model=options.model,
+            criterion=options.criterion,
+            prescreen=options.prescreen,
+            prior=options.prior,
+            compare_cold=options.compare_cold,
+            store=options.store,
+        )
+        if options.shared:
+            fits = self._global_fits(
+                groups,
+                fits,
+                options.shared,
+                name_col,
+                options.group_col,
+                min(200, options.max_nfev),
             )
-            result_df["absolute pIC50"] = -np.log10(
-                result_df["absolute ic50 (pM)"] * 1e-12
+        errors = None
+        if options.standard_errors:
+            errors = self._parameter_errors(
+                groups, fits, model=options.model, shared=options.shared
+            )
+        if calculation == "relative":
+            return self._relative_values(
+                groups, fits, input_units, verbose, errors, options.model
             )
 
-        self.calculation = result_df
-        return self.calculation
+        if calculation == "pic50":
+            target = 50
+        intervals = None
+        if options.bootstrap:
+            intervals = self._bootstrap_intervals(
+                groups,
+                fits,
+                options.bootstrap,
+                options.resample,
+                options.confidence,
+                options.seed,
+                target,
+                options.model,
+                options.shared,
+            )
+        values = self._absolute_values(
+            groups, fits, input_units, verbose, target, intervals, errors, options.model
+        )
+        if options.store is not None:
+            options.store.record(
+                values,
+                self._fit_keys(
+                    groups,
+                    options.batch,
+                    options.max_nfev,
+                    options.time_budget,
+                    options.model,
+                    options.criterion,
+                ),
+                {
+                    "input_units": input_units,
+                    "target": target,
+                    **{
+                        name: getattr(options, name)
+                        for name in (
+                            "model",
+                            "criterion",
+                            "batch",
+                            "max_nfev",
+                            "time_budget",
+                            "shared",
+                            "group_col",
+                            "prescreen",
+                            "drop_outliers",
+                            "bootstrap",
+                        )
+                    },
+                },
+            )
+        return values
 
-    """Support functions below"""
+    def _build_frame(
+        self, parts, calculation: str = "absolute", input_units: str = None
+    ):
+        """
+        Join the FitResults from _calculate_groups() into the output DataFrame.
+
+        :return: DataFrame
+        """
+        results = FitResults.concat(parts)
+        if calculation == "pic50":
+            results = self._pic50_columns(results, input_units)
+        return results.to_pandas()
+
+    def _pic50_columns(self, results, input_units: str = None):
+        """
+        Append the relative and absolute pIC50 columns to the absolute IC50 output of _calculate_groups().
+
+        :param results: FitResults
+            Output columns from _calculate_groups().
+        :param input_units: str
+            Units of input dataset. Default is nM.
+
+        :return: FitResults with the pIC50 columns
+        """
+        if len(results) == 0:
+            return results
+
+        if input_units is None or input_units == "nM":
+            results["relative pIC50"] = -np.log10(results["relative ic50 (nM)"] * 1e-9)
+            results["absolute pIC50"] = -np.log10(results["absolute ic50 (nM)"] * 1e-9)
+        elif input_units == "µM":
+            results["relative pIC50"] = -np.log10(results["relative ic50 (µM)"] * 1e-6)
+            results["absolute pIC50"] = -np.log10(results["absolute ic50 (µM)"] * 1e-6)
+        elif input_units == "pM":
+            results["relative pIC50"] = -np.log10(
+                results["relative ic50 (pM)"] * 1e-12
+            )
+            results["absolute pIC50"] = -np.log10(
+                results["absolute ic50 (pM)"] * 1e-12
+            )
+        return results
 
     """Define the 4-parameter logistic (4PL) equation"""
 
@@ -218,6 +1117,24 @@ class Calculator:
             1 + (concentration / ic50) ** -hill_slope
         )
 
+    @staticmethod
+    def _fourpl_jacobian(concentration, minimum, maximum, ic50, hill_slope):
+        """
+        Analytic Jacobian of _fourpl(). Passed to curve_fit so it does not need finite differences.
+
+        :return: Array of shape (len(concentration), 4)
+        """
+        return fourpl_jacobian(concentration, [minimum, maximum, ic50, hill_slope], 1)
+
+    @staticmethod
+    def _reverse_fourpl_jacobian(concentration, minimum, maximum, ic50, hill_slope):
+        """
+        Analytic Jacobian of _reverse_fourpl(). Passed to curve_fit so it does not need finite differences.
+
+        :return: Array of shape (len(concentration), 4)
+        """
+        return fourpl_jacobian(concentration, [minimum, maximum, ic50, hill_slope], -1)
+
     def _verbose_calculation(
         self, drug: str = None, input_units: str = None, verbose: bool = True
     ):
@@ -251,263 +1168,1391 @@ class Calculator:
 
     # This method will be used to reduce the functions in the calculating methods below.
     # This will loop through each drug item.
-    def _relative_calculation(
+    def _relative_values(
         self,
-        name_col: str = None,
-        concentration_col: str = None,
-        response_col: str = None,
+        groups,
+        fits,
         input_units: str = None,
         verbose: bool = None,
+        errors: dict = None,
+        model: str = "4PL",
     ):
         """
-        Calculate relative IC50 values for a given drug. Output will be a dictionary that will be converted into a
-        pandas dataframe using the calculate_ic50() function.
+        Build the relative IC50 output columns from the fits of _cached_fit_groups().
 
-        :param name_col: str
-            Name column from DataFrame.
-        :param concentration_col: str
-            Concentration column from DataFrame.
-        :param response_col: str
-            Response column from DataFrame.
+        :param groups: GroupedData
+            Grouped view of the fitted drugs.
+        :param fits: dict
+            Per-drug fit arrays in the order of groups.names.
         :param input_units: str
             Concentration units for tested drug. By default, units given will be in nM.
         :param verbose: bool
             Output drug concentration units.
+        :param errors: dict
+            Optional standard errors from _parameter_errors(), added as standard error and confidence interval columns.
+        :param model: str
+            Model option of the calculation. Any model other than "4PL" adds an asymmetry column.
 
-        :return: A dictionary containing drug name, maximum response, minimum response, IC50 (relative) and hill slope.
+        :return: FitResults with one row per drug
         """
-        # Set variables from function and convert name_col to np array
-        global params, conc_unit
-        name_col = name_col
-        name = self.data[name_col].values
-
-        drug_name = np.unique(name)
-
-        values = []
-
-        # Loop through each drug name and perform calculation
-        for drug in drug_name:
-            drug_query = self.data[self.data[name_col] == drug]
-            concentration = drug_query[concentration_col]
-            response = drug_query[response_col]
-
-            # Set initial guess for 4PL equation
-            initial_guess = [
-                max(response),
-                min(response),
-                0.5 * (max(response) + min(response)),
-                1.0,
-            ]  # Max, Min, ic50, and hill_slope
-
-            # set a new coy of the DataFrame to avoid warnings
-            query = drug_query.copy()
-            query.sort_values(by=concentration_col, inplace=True)
-
-            # todo Calculate standard deviations from the covariance matrix
-            # std_dev = np.sqrt(np.diag(covariance))
-
-            # tag response col to determine direction of fourpl equation and fit to 4PL equation
-            reverse, params, covariance = self._calc_logic(
-                data=query,
-                concentration=concentration,
-                response_col=response_col,
-                initial_guess=initial_guess,
-                response=response,
-            )
-
-            # If verbose, output info
+        # If verbose, output info
+        for drug in groups.names:
             self._verbose_calculation(drug, input_units, verbose)
 
-            # Extract parameter values
-            maximum, minimum, ic50, hill_slope = params
-            # print(drug, ' IC50: ', ic50, f'{input_units}') # For checking
+        # Extract parameter values
+        maximum, minimum, ic50, hill_slope = self._reported_params(fits, model).T
 
-            # Confirm ic50 unit output
-            # x_intersection is not needed for relative ic50
-            ic50, x_intersection, input_units = self._unit_convert(
-                ic50, x_intersection=None, input_units=input_units
-            )
-
-            # Logic to append concentration units to output DataFrame
-            if input_units is None:
-                conc_unit = "nM"
-            elif input_units == "nM":
-                conc_unit = "nM"
-            elif input_units == "uM" or input_units == "µM":
-                conc_unit = "µM"
-            elif input_units == "pM" or input_units == "pm":
-                conc_unit = "pM"
+        # Confirm ic50 unit output
+        # x_intersection is not needed for relative ic50
+        ic50, x_intersection, input_units = self._unit_convert(
+            ic50, x_intersection=None, input_units=input_units
+        )
 
-            # Generate DataFrame from parameters
-            values.append(
-                {
-                    "compound_name": drug,
-                    "maximum": maximum,
-                    "minimum": minimum,
-                    f"ic50 ({conc_unit})": ic50,
-                    "hill_slope": hill_slope,
-                }
+        # Logic to append concentration units to output DataFrame
+        if input_units is None:
+            conc_unit = "nM"
+        elif input_units == "nM" or input_units == "nm":
+            conc_unit = "nM"
+        elif input_units == "uM" or input_units == "µM" or input_units == "um":
+            conc_unit = "µM"
+        elif input_units == "pM" or input_units == "pm":
+            conc_unit = "pM"
+
+        # Generate output columns from parameters
+        results = FitResults(
+            {
+                "compound_name": groups.names,
+                "maximum": maximum,
+                "minimum": minimum,
+                f"ic50 ({conc_unit})": ic50,
+                "hill_slope": hill_slope,
+            }
+        )
+        if model != "4PL":
+            results["asymmetry"] = fits["asymmetry"]
+        if errors is not None:
+            self._error_columns(
+                results, errors, np.zeros(len(groups)), "ic50", conc_unit, input_units
             )
-        return values
+        if "activity" in fits:
+            results["activity"] = fits["activity"]
+        results["model"] = fits["model"]
+        results["fit status"] = fits["status"]
+        return results
 
-    def _absolute_calculation(
+    def _bootstrap_intervals(
         self,
-        name_col: str = None,
-        concentration_col: str = None,
-        response_col: str = None,
+        groups,
+        fits,
+        bootstrap: int = 1000,
+        resample: str = "residuals",
+        confidence: float = 0.95,
+        seed: int = None,
+        target: float = 50,
+        model: str = "4PL",
+        shared: list = None,
+    ):
+        """
+        Percentile bootstrap confidence intervals from fitting.bootstrap_fit(). All resamples of all drugs are refit
+        in batches, starting from the fits of _cached_fit_groups(). Resamples whose refit fails are left out.
+
+        :param groups: GroupedData
+            Grouped view of the fitted drugs.
+        :param fits: dict
+            Per-drug fit arrays in the order of groups.names.
+        :param bootstrap: int
+            Number of resamples for each drug.
+        :param resample: str
+            "residuals" or "replicates".
+        :param confidence: float
+            Confidence level of the intervals.
+        :param seed: int
+            Seed for the resampling. Each drug's draws are keyed by its content hash (see bootstrap_fit()).
+        :param target: float
+            Response used for the absolute IC value.
+        :param model: str
+            Model option of the calculation. Any model other than "4PL" refits the 5PL equation with the parameters
+            each drug's model does not use held fixed.
+        :param shared: list
+            Parameters shared across drugs. Each resample is refit globally, with the groups in fits["group"].
+
+        :return: Dictionary with the confidence level, the number of successful refits of each drug, and (drugs, 2)
+            arrays of lower and upper limits for "relative", "absolute", and "hill_slope". Limits are in input units and
+            NaN for drugs without successful refits.
+        """
+        conc_pad, resp_pad, mask = groups.padded()
+        direction = np.where(fits["reverse"] == 1, -1, 1)
+        params, free = fits["params"], None
+        if model != "4PL":
+            params = np.column_stack([params, fits["asymmetry"]])
+            free = self._free_parameters(fits)
+        boot = bootstrap_fit(
+            conc_pad,
+            resp_pad,
+            mask,
+            params,
+            direction,
+            bootstrap,
+            resample=resample,
+            sigma=groups.padded_sigma(),
+            wells=groups.padded_wells() if resample == "replicates" else None,
+            seed=seed,
+            free=free,
+            shared=FitOptions.shared_positions(shared) or None,
+            groups=fits.get("group"),
+            keys=groups.content_hashes(),
+        )
+        stacked = boot.reshape(-1, params.shape[1])
+        if model == "4PL":
+            relative = boot[:, :, 2]
+            absolute, _ = inverse_fourpl(stacked, np.tile(direction, bootstrap), target)
+        else:
+            relative = logistic_midpoint(
+                stacked, np.tile(direction, bootstrap), stacked[:, 4]
+            ).reshape(bootstrap, len(groups))
+            absolute, _ = inverse_fourpl(
+                stacked[:, :4],
+                np.tile(direction, bootstrap),
+                target,
+                asymmetry=stacked[:, 4],
+            )
+        # Hill slopes of falling curves are reported as negative numbers
+        samples = {
+            "relative": relative,
+            "absolute": absolute.reshape(bootstrap, len(groups)),
+            "hill_slope": boot[:, :, 3] * np.where(direction == -1, -1, 1),
+        }
+
+        tail = 50 * (1 - confidence)
+        intervals = {
+            "confidence": confidence,
+            "fits": np.sum(np.isfinite(boot[:, :, 2]), axis=0),
+        }
+        for field, values in samples.items():
+            limits = np.full((len(groups), 2), np.nan)
+            has_value = np.isfinite(values).any(axis=0)
+            if has_value.any():
+                limits[has_value] = np.nanpercentile(
+                    values[:, has_value], [tail, 100 - tail], axis=0
+                ).T
+            intervals[field] = limits
+        return intervals
+
+    def _absolute_values(
+        self,
+        groups,
+        fits,
         input_units: str = None,
         verbose: bool = None,
+        target: float = 50,
+        intervals: dict = None,
+        errors: dict = None,
+        model: str = "4PL",
     ):
         """
-        Calculate relative IC50 values for a given drug. Output will be a dictionary that will be converted into a
-        pandas dataframe using the calculate_absolute_ic50() function.
+        Build the absolute IC50 output columns from the fits of _cached_fit_groups().
 
-        :param name_col: str
-            Name column from DataFrame.
-        :param concentration_col: str
-            Concentration column from DataFrame.
-        :param response_col: str
-            Response column from DataFrame.
+        :param groups: GroupedData
+            Grouped view of the fitted drugs.
+        :param fits: dict
+            Per-drug fit arrays in the order of groups.names.
         :param input_units: str
             Concentration units for tested drug. By default, units given will be in nM.
         :param verbose: bool
             Output drug concentration units.
-
-        :return: A dictionary containing drug name, maximum response, minimum response, relative IC50,
-         absolute IC50, and hill slope.
+        :param target: float
+            Response used for the absolute IC value.
+        :param intervals: dict
+            Optional bootstrap intervals from _bootstrap_intervals(), added as confidence interval columns.
+        :param errors: dict
+            Optional standard errors from _parameter_errors(), added as standard error and confidence interval columns.
+        :param model: str
+            Model option of the calculation. Any model other than "4PL" adds an asymmetry column.
+
+        :return: FitResults with one row per drug
         """
+        fit_reverse = fits["reverse"]
+
+        # Solve the 4PL equation for the concentration at the target response. This is exact and is not limited to
+        # a fixed concentration range
+        x_intersection, reached = inverse_fourpl(
+            fits["params"],
+            np.where(fit_reverse == 1, -1, 1),
+            target,
+            asymmetry=None if model == "4PL" else fits["asymmetry"],
+        )
+        if target == 50:
+            absolute_label = "absolute ic50"
+        else:
+            absolute_label = f"absolute ic{target:g}"
 
-        # Set variables from function and convert name_col to np array
-        global params, conc_unit
-        name_col = name_col
-        name = self.data[name_col].values
-
-        drug_name = np.unique(name)
-
-        values = []
-
-        # Loop through each drug name and perform calculation
-        for drug in drug_name:
-            drug_query = self.data[self.data[name_col] == drug]
-            concentration = drug_query[concentration_col]
-            response = drug_query[response_col]
+        # If verbose, output info
+        for drug in groups.names:
+            self._verbose_calculation(drug, input_units, verbose)
 
-            # Set initial guess for 4PL equation
-            initial_guess = [
-                max(response),
-                min(response),
-                0.5 * (max(response) + min(response)),
-                1.0,
-            ]  # Max, Min, ic50, and hill_slope
+        # Extract parameter values
+        maximum, minimum, ic50, hill_slope = self._reported_params(fits, model).T
+        # ensure hill_slope is negative
+        hill_slope = np.where(fit_reverse == 1, -1 * hill_slope, hill_slope)
 
-            # set a new coy of the DataFrame to avoid warnings
-            query = drug_query.copy()
-            query.sort_values(by=concentration_col, ascending=True, inplace=True)
+        # Confirm ic50 unit output
+        ic50, x_intersection, input_units = self._unit_convert(
+            ic50, x_intersection, input_units
+        )
 
-            reverse, params, covariance = self._calc_logic(
-                data=query,
-                concentration=concentration,
-                response_col=response_col,
-                initial_guess=initial_guess,
-                response=response,
+        # Logic to append concentration units to output DataFrame
+        if input_units is None:
+            conc_unit = "nM"
+        elif input_units == "nM" or input_units == "nm":
+            conc_unit = "nM"
+        elif input_units == "uM" or input_units == "µM" or input_units == "um":
+            conc_unit = "µM"
+        elif input_units == "pM" or input_units == "pm":
+            conc_unit = "pM"
+
+        # Generate output columns from parameters
+        results = FitResults(
+            {
+                "compound_name": groups.names,
+                "maximum": maximum,
+                "minimum": minimum,
+                f"relative ic50 ({conc_unit})": ic50,
+                f"{absolute_label} ({conc_unit})": x_intersection,
+                "hill_slope": hill_slope,
+            }
+        )
+        if model != "4PL":
+            results["asymmetry"] = fits["asymmetry"]
+        if errors is not None:
+            self._error_columns(
+                results, errors, fit_reverse, "relative ic50", conc_unit, input_units
             )
 
-            # If verbose, output info
-            # self.verbose_calculation(drug, input_units, verbose)
-
-            # Extract parameter values
-            maximum, minimum, ic50, hill_slope = params
-            # print(drug, ' IC50: ', ic50, 'nM') # For checking
-
-            # Obtain x_fit. Because calculator does not require xscale_ticks, it is set to None
-            # If verbose, more info will be printed
-            x_fit, input_units = CurveSettings().scale_units(
-                drug_name=drug,
-                xscale_unit=input_units,
-                xscale_ticks=None,
-                verbose=verbose,
+        if intervals is not None:
+            level = f"{intervals['confidence'] * 100:g}% CI"
+            relative_ci, absolute_ci, _ = self._unit_convert(
+                intervals["relative"], intervals["absolute"], input_units
             )
-
-            hill_slope, ic50, input_units, x_intersection, y_fit = (
-                self._reverse_absolute_calculation(
-                    hill_slope,
-                    ic50,
-                    input_units,
-                    maximum,
-                    minimum,
-                    params,
-                    reverse,
-                    x_fit,
-                )
+            results[f"relative ic50 {level} low ({conc_unit})"] = relative_ci[:, 0]
+            results[f"relative ic50 {level} high ({conc_unit})"] = relative_ci[:, 1]
+            results[f"{absolute_label} {level} low ({conc_unit})"] = absolute_ci[:, 0]
+            results[f"{absolute_label} {level} high ({conc_unit})"] = absolute_ci[:, 1]
+            results[f"hill_slope {level} low"] = intervals["hill_slope"][:, 0]
+            results[f"hill_slope {level} high"] = intervals["hill_slope"][:, 1]
+            results["bootstrap fits"] = intervals["fits"]
+
+        results["target reached"] = reached
+        if "activity" in fits:
+            results["activity"] = fits["activity"]
+        results["model"] = fits["model"]
+        results["fit status"] = fits["status"]
+        return results
+
+    def _parameter_errors(
+        self,
+        groups,
+        fits,
+        warn_condition: float = 1e6,
+        model: str = "4PL",
+        shared: list = None,
+    ):
+        """
+        Standard errors and 95% Wald confidence intervals of the fitted parameters. The covariance matrix of every
+        drug comes from fitting.fourpl_covariance() at the cached fit, so it matches the covariance returned by
+        curve_fit without fitting again. The ic50 interval is taken on the log scale, so its limits stay positive.
+        For a 5PL fit the reported ic50 is the curve midpoint, and its standard error is propagated from the ic50,
+        hill slope, and asymmetry parameters with the delta method. Global fits use fitting.global_covariance().
+
+        Issues a RuntimeWarning for drugs whose condition number is above warn_condition. Their parameters are not well
+        determined by the data and their standard errors should not be trusted.
+
+        :param groups: GroupedData
+            Grouped view of the fitted drugs.
+        :param fits: dict
+            Per-drug fit arrays in the order of groups.names.
+        :param warn_condition: float
+            Condition number above which a fit is flagged as ill-conditioned.
+        :param model: str
+            Model option of the calculation. Any model other than "4PL" adds the asymmetry as a fifth parameter.
+        :param shared: list
+            Parameters shared across drugs in a global fit.
+
+        :return: Dictionary of (drugs, 4) arrays "se", "low", and "high" in the order maximum, minimum, ic50, and
+            hill_slope (plus asymmetry for models other than "4PL"), the "condition" number and the "ill-conditioned"
+            flag of each drug. Values are NaN for drugs that did not converge and for parameters that were not fit.
+        """
+        direction = np.where(fits["reverse"] == 1, -1, 1)
+        if shared:
+            params = fits["params"]
+            covariance, condition = global_covariance(
+                *groups.padded(),
+                params,
+                direction,
+                FitOptions.shared_positions(shared),
+                groups=fits["group"],
+                sigma=groups.padded_sigma(),
+            )
+        elif model == "4PL":
+            params = fits["params"]
+            covariance, condition = fourpl_covariance(
+                *groups.padded(),
+                params,
+                direction,
+                sigma=groups.padded_sigma(),
+                fixed_hill=fits["status"] == "fixed hill",
+            )
+        else:
+            covariance, condition = fourpl_covariance(
+                *groups.padded(),
+                np.column_stack([fits["params"], fits["asymmetry"]]),
+                direction,
+                sigma=groups.padded_sigma(),
+                free=self._free_parameters(fits),
+            )
+            params = np.column_stack(
+                [self._reported_params(fits, model), fits["asymmetry"]]
             )
 
-            # Logic to append concentration units to output DataFrame
-            if input_units is None:
-                conc_unit = "nM"
-            elif input_units == "nM":
-                conc_unit = "nM"
-            elif input_units == "uM" or input_units == "µM":
-                conc_unit = "µM"
-            elif input_units == "pM" or input_units == "pm":
-                conc_unit = "pM"
-
-            # Generate DataFrame from parameters
-            values.append(
-                {
-                    "compound_name": drug,
-                    "maximum": maximum,
-                    "minimum": minimum,
-                    f"relative ic50 ({conc_unit})": ic50,
-                    f"absolute ic50 ({conc_unit})": x_intersection,
-                    "hill_slope": hill_slope,
-                }
+        with np.errstate(all="ignore"):
+            se = np.sqrt(np.diagonal(covariance, axis1=1, axis2=2))
+            if model != "4PL":
+                # Gradient of the midpoint with respect to ic50, hill slope, and asymmetry
+                fitted, midpoint = fits["params"], params[:, 2]
+                asymmetry = fits["asymmetry"]
+                base = 2 ** (1 / asymmetry) - 1
+                exponent = direction * fitted[:, 3]
+                gradient = np.column_stack(
+                    [
+                        midpoint / fitted[:, 2],
+                        -midpoint * np.log(base) / (exponent * fitted[:, 3]),
+                        -midpoint
+                        * 2 ** (1 / asymmetry)
+                        * np.log(2)
+                        / (exponent * base * asymmetry**2),
+                    ]
+                )
+                block = covariance[:, 2:, 2:]
+                delta = np.sqrt(np.einsum("ni,nij,nj->n", gradient, block, gradient))
+                se[:, 2] = np.where(fits["model"] == "5PL", delta, se[:, 2])
+            z = norm.ppf(0.975)
+            low, high = params - z * se, params + z * se
+            spread = np.exp(z * se[:, 2] / params[:, 2])
+            low[:, 2], high[:, 2] = params[:, 2] / spread, params[:, 2] * spread
+
+        ill_conditioned = condition > warn_condition
+        if ill_conditioned.any():
+            warnings.warn(
+                f"{ill_conditioned.sum()} fit(s) are ill-conditioned (condition number above "
+                f"{warn_condition:g}). Their standard errors are not reliable: "
+                f"{', '.join(map(str, groups.names[ill_conditioned]))}",
+                RuntimeWarning,
             )
-        return values
+        return {
+            "se": se,
+            "low": low,
+            "high": high,
+            "condition": condition,
+            "ill-conditioned": ill_conditioned,
+        }
+
+    def _error_columns(
+        self,
+        results,
+        errors,
+        reverse,
+        ic50_label: str = "ic50",
+        conc_unit: str = "nM",
+        input_units: str = None,
+    ):
+        """
+        Add the standard error columns from _parameter_errors() to the output.
+
+        :param results: FitResults
+            Output columns to add to.
+        :param errors: dict
+            Standard errors from _parameter_errors().
+        :param reverse: np.ndarray
+            Direction tag of every drug. The hill slope of a falling curve is reported as negative, so its limits are
+            negated. Pass zeros to keep the fitted sign.
+        :param ic50_label: str
+            Name of the ic50 column, "ic50" or "relative ic50".
+        :param conc_unit: str
+            Concentration unit shown in the ic50 column names.
+        :param input_units: str
+            Units of input dataset, used to convert the ic50 values.
+        """
+        labels = ["maximum", "minimum", ic50_label, "hill_slope", "asymmetry"]
+        for j, label in enumerate(labels[: errors["se"].shape[1]]):
+            se, low, high = (errors[key][:, j] for key in ("se", "low", "high"))
+            unit = ""
+            if j == 2:
+                se, _, _ = self._unit_convert(se, None, input_units)
+                low, high, _ = self._unit_convert(low, high, input_units)
+                unit = f" ({conc_unit})"
+            elif j == 3:
+                falling = reverse == 1
+                low, high = np.where(falling, -high, low), np.where(falling, -low, high)
+            results[f"{label} SE{unit}"] = se
+            results[f"{label} 95% Wald CI low{unit}"] = low
+            results[f"{label} 95% Wald CI high{unit}"] = high
+        results["condition number"] = errors["condition"]
+        results["ill-conditioned"] = errors["ill-conditioned"]
 
     def _reverse_absolute_calculation(
         self, hill_slope, ic50, input_units, maximum, minimum, params, reverse, x_fit
     ):
         """
-        Support function to condense code. Script will allow the generation of reverse curves.
+        Support function to condense code. Script will allow the generation of reverse curves. The absolute IC50 is
+        solved directly from the 4PL equation, x_fit is only used to draw the curve.
         """
         # Calculate from parameters 4PL equation
         if reverse == 1:
             y_fit = self._reverse_fourpl(x_fit, maximum, minimum, ic50, hill_slope)
-            y_intersection = 50
-            interpretation = interp1d(
-                y_fit, x_fit, kind="linear", fill_value="extrapolate"
-            )
-            x_intersection = np.round(
-                interpretation(y_intersection), 3
-            )  # give results and round to 3 sig figs
+            x_intersection = inverse_fourpl(params, -1)[0][0]
             hill_slope = (
                 -1 * hill_slope
             )  # ensure hill_slope is negative # may not be needed if fixed
         else:
             y_fit = self._fourpl(x_fit, *params)
-            y_intersection = 50
-            x_intersection = np.interp(y_intersection, y_fit, x_fit)
+            x_intersection = inverse_fourpl(params, 1)[0][0]
         # Confirm ic50 unit output
         ic50, x_intersection, input_units = self._unit_convert(
             ic50, x_intersection, input_units
         )
         return hill_slope, ic50, input_units, x_intersection, y_fit
 
+    def _cached_fit_groups(
+        self,
+        groups,
+        batch: bool = False,
+        n_jobs: int = None,
+        executor=None,
+        max_nfev: int = 1000,
+        time_budget: float = None,
+        model: str = "4PL",
+        criterion: str = "aic",
+        prescreen=False,
+        store: FitResultStore = None,
+        prior=None,
+        compare_cold: bool = False,
+    ):
+        """
+        Look up every drug in the fit cache and only fit the drugs that are missing. New fits are added to the cache,
+        so later calls such as calculate_pic50() after calculate_absolute_ic50() do not refit the same curves.
+        Statistics for the fits that were run are stored in self.fit_stats.
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame from _grouped().
+        :param batch: bool
+            Fit missing drugs with the vectorized solver.
+        :param n_jobs: int
+            Number of worker processes for the missing drugs.
+        :param executor: concurrent.futures.Executor
+            Optional executor for the missing drugs.
+        :param max_nfev: int
+            Maximum number of model evaluations for each fitting stage.
+        :param time_budget: float
+            Seconds allowed for fitting each drug.
+        :param model: str
+            Model to fit, or "auto" to choose one for each drug. See _model_fits().
+        :param criterion: str
+            "aic" or "bic".
+        :param prescreen: bool or dict
+            Classify the drugs with fitting.screen_activity() first and only fit the active drugs. A dict is passed on
+            to screen_activity() as thresholds.
+        :param store: FitResultStore
+            Optional persistent store. Drugs missing from the cache are looked up in the store before fitting, and new
+            fits are saved to it. self.fit_stats counts the drugs found in the store under "store_hits".
+        :param prior: pd.DataFrame
+            Earlier results to start the missing drugs from. See _prior_guess(). Drugs found in the cache or the store
+            are not fit again, with or without a warm start.
+        :param compare_cold: bool
+            Also fit the warm started drugs without the prior and count the evaluations in self.fit_stats under
+            "cold_nfev" and "saved_nfev". The cold fits are not cached or returned.
+
+        :return: Dictionary of per-drug arrays in the order of groups.names. See _serial_calculation() and
+            _model_fits(). With prescreen, an "activity" key holds the class of every drug.
+        """
+        if prescreen:
+            return self._screened_fit_groups(
+                groups,
+                {} if prescreen is True else prescreen,
+                batch=batch,
+                n_jobs=n_jobs,
+                executor=executor,
+                max_nfev=max_nfev,
+                time_budget=time_budget,
+                model=model,
+                criterion=criterion,
+                store=store,
+                prior=prior,
+                compare_cold=compare_cold,
+            )
+        keys = self._fit_keys(groups, batch, max_nfev, time_budget, model, criterion)
+
+        fits = [self.cache.get(key) for key in keys]
+        missing = [i for i, fit in enumerate(fits) if fit is None]
+        if store is not None:
+            stored = store.get_many([keys[i] for i in missing])
+            for i in missing:
+                if keys[i] in stored:
+                    fits[i] = stored[keys[i]]
+                    self.cache.put(keys[i], fits[i])
+            store_hits = len(missing)
+            missing = [i for i in missing if fits[i] is None]
+            store_hits -= len(missing)
+
+        pending = groups.take(missing)
+        guess = None if prior is None else self._prior_guess(pending, prior)
+        new = self._fit_groups(
+            pending,
+            batch=batch,
+            n_jobs=n_jobs,
+            executor=executor,
+            max_nfev=max_nfev,
+            time_budget=time_budget,
+            prior=guess,
+        )
+        new = self._model_fits(
+            pending, new, model, criterion, max_iter=min(200, max_nfev)
+        )
+        for position, i in enumerate(missing):
+            fits[i] = {field: values[position] for field, values in new.items()}
+            self.cache.put(keys[i], fits[i])
+
+        self.fit_stats = {
+            "compounds": len(groups),
+            "cache_hits": len(groups) - len(missing),
+            "fits": len(missing),
+            "nfev": int(new["nfev"].sum()),
+            "njev": int(new["njev"].sum()),
+        }
+        if store is not None:
+            store.put_many({keys[i]: fits[i] for i in missing})
+            self.fit_stats["cache_hits"] -= store_hits
+            self.fit_stats["store_hits"] = store_hits
+        if guess is not None:
+            warm = np.isfinite(guess["params"]).all(axis=1)
+            self.fit_stats["warm_starts"] = int(warm.sum())
+            self.fit_stats["warm_nfev"] = int(new["nfev"][warm].sum())
+            if compare_cold:
+                # Same fits from the data-based guess, to count what the warm start saved
+                cold_groups = pending.take(np.flatnonzero(warm))
+                cold = self._fit_groups(
+                    cold_groups,
+                    batch=batch,
+                    n_jobs=n_jobs,
+                    executor=executor,
+                    max_nfev=max_nfev,
+                    time_budget=time_budget,
+                )
+                cold = self._model_fits(
+                    cold_groups, cold, model, criterion, max_iter=min(200, max_nfev)
+                )
+                self.fit_stats["cold_nfev"] = int(cold["nfev"].sum())
+                self.fit_stats["saved_nfev"] = (
+                    self.fit_stats["cold_nfev"] - self.fit_stats["warm_nfev"]
+                )
+
+        if not fits:
+            return new
+        # Text fields stay object arrays, so later stages can set longer labels such as "not converged"
+        return {
+            field: np.array(
+                [fit[field] for fit in fits],
+                dtype=object if field in ("status", "model") else None,
+            )
+            for field in new
+        }
+
+    @staticmethod
+    def _fit_keys(
+        groups,
+        batch: bool = False,
+        max_nfev: int = 1000,
+        time_budget: float = None,
+        model: str = "4PL",
+        criterion: str = "aic",
+    ):
+        """
+        Content hash of every drug for the fit cache and the fit store. The fitting options are part of the hash, so
+        fits with different options are kept apart. See cache.fit_key().
+
+        :return: list of str in the order of groups.names
+        """
+        settings = f"{'batch' if batch else 'curve_fit'}:{max_nfev}:{time_budget}"
+        if model == "4PL":
+            settings = f"4PL:{settings}"
+        else:
+            settings = f"{model}:{criterion}:{settings}"
+        return [
+            fit_key(*groups.group(i), model=settings, sigma=groups.group_sigma(i))
+            for i in range(len(groups))
+        ]
+
+    @staticmethod
+    def _prior_guess(groups, prior):
+        """
+        Warm start for every drug from earlier results of the same drugs. The relative IC50 is converted back from
+        the output units, and the hill slope is taken as its absolute value, since the absolute IC50 output reports a
+        negative hill slope for falling curves while the fitted hill slope is positive in both directions. Drugs whose
+        earlier fit needed the "bounded" or "fixed hill" stage of _fit_with_fallback() start at that stage, so the
+        stages that failed before do not use up max_nfev again.
+
+        :param groups: GroupedData
+            Drugs to fit.
+        :param prior: pd.DataFrame
+            Output of calculate_ic50(), calculate_absolute_ic50(), or calculate_pic50() with its "compound_name",
+            "maximum", "minimum", "ic50 (<units>)" or "relative ic50 (<units>)", and "hill_slope" columns, or the
+            output of FitResultStore.history() or latest(). A FitResults object or a pyarrow Table is also accepted.
+            If a drug is listed more than once, its last row is used.
+
+        :return: Dictionary of arrays in the order of groups.names. "params" has shape (drugs, 4), in the order
+            maximum, minimum, ic50, and hill_slope, with NaN rows for drugs that are not in prior or whose earlier fit
+            has no finite, positive ic50. "start" is the first fitting stage of every drug.
+        """
+        if isinstance(prior, FitResults):
+            prior = prior.to_pandas()
+        prior = as_dataframe(prior)
+
+        if "relative_ic50" in prior.columns:
+            # Rows saved by FitResultStore, with the units of every row in their own column
+            names, ic50 = prior["compound"], prior["relative_ic50"]
+            units, status = prior["units"], prior["status"]
+        else:
+            labels = [
+                column
+                for column in prior.columns
+                if str(column).startswith(("relative ic50 (", "ic50 ("))
+            ]
+            if "compound_name" not in prior.columns or not labels:
+                raise ValueError(
+                    "Prior must have compound_name, maximum, minimum, ic50, and hill_slope columns"
+                )
+            names, ic50 = prior["compound_name"], prior[labels[0]]
+            units = labels[0][labels[0].rindex("(") + 1 : -1]
+            status = prior.get("fit status", pd.Series("", index=prior.index))
+        scale = pd.Series(units, index=prior.index).map(
+            {"nM": 1.0, "µM": 1e3, "pM": 1e-3}
+        )
+
+        params = pd.DataFrame(
+            {
+                "maximum": prior["maximum"].to_numpy(dtype=float),
+                "minimum": prior["minimum"].to_numpy(dtype=float),
+                "ic50": ic50.to_numpy(dtype=float) * scale.to_numpy(dtype=float),
+                "hill_slope": np.abs(prior["hill_slope"].to_numpy(dtype=float)),
+                "start": status.map({"bounded": 1, "fixed hill": 2}).to_numpy(),
+            },
+            index=np.asarray(names),
+        )
+        params = params[~params.index.duplicated(keep="last")].reindex(groups.names)
+        guess = params.iloc[:, :4].to_numpy(dtype=float)
+        guess[~(guess[:, 2] > 0)] = np.nan
+        start = params["start"].fillna(0).to_numpy(dtype=int)
+        start[np.isnan(guess).any(axis=1)] = 0
+        return {"params": guess, "start": start}
+
+    def _screened_fit_groups(self, groups, thresholds: dict = None, **options):
+        """
+        Fit only the drugs that fitting.screen_activity() finds active. The inactive drugs are given the constant
+        model, with the mean response as maximum and minimum and NaN for the ic50 and hill slope, without calling the
+        solver.
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame from _grouped().
+        :param thresholds: dict
+            Keyword arguments for screen_activity().
+        :param options:
+            Passed on to _cached_fit_groups().
+
+        :return: Dictionary of per-drug arrays in the order of groups.names, with an "activity" key. self.fit_stats
+            counts the inactive drugs under "inactive".
+        """
+        conc_pad, resp_pad, mask = groups.padded()
+        screen = screen_activity(conc_pad, resp_pad, mask, **(thresholds or {}))
+        activity = screen["activity"]
+        inactive = activity == "inactive"
+        active = self._cached_fit_groups(
+            groups.take(np.flatnonzero(~inactive)), **options
+        )
+
+        fits = {}
+        for field, values in active.items():
+            fits[field] = np.zeros((len(groups),) + values.shape[1:], values.dtype)
+            fits[field][~inactive] = values
+        with np.errstate(all="ignore"):
+            mean = np.where(mask, resp_pad, 0).sum(axis=1) / mask.sum(axis=1)
+        fits["params"][inactive] = np.nan
+        fits["params"][inactive, 0] = mean[inactive]
+        fits["params"][inactive, 1] = mean[inactive]
+        direction = curve_direction(conc_pad, resp_pad, mask)
+        fits["reverse"][inactive] = direction[inactive] == -1
+        fits["status"][inactive] = "inactive"
+        fits["model"][inactive] = "constant"
+        fits["asymmetry"][inactive] = np.nan
+        fits["activity"] = activity
+
+        self.fit_stats["compounds"] = len(groups)
+        self.fit_stats["inactive"] = int(inactive.sum())
+        return fits
+
+    def _global_fits(
+        self,
+        groups,
+        fits,
+        shared: list,
+        name_col: str = None,
+        group_col: str = None,
+        max_iter: int = 200,
+    ):
+        """
+        Refit every drug with the shared parameters held in common within each group. The fits of _cached_fit_groups()
+        are the starting point, so only a few global iterations are needed. See fitting.global_fit().
+
+        :param groups: GroupedData
+            Grouped view of the fitted drugs.
+        :param fits: dict
+            Per-drug fit arrays from _cached_fit_groups().
+        :param shared: list
+            Names of the shared parameters.
+        :param name_col: str
+            Name column from DataFrame.
+        :param group_col: str
+            Column with the group of every drug. If None, all drugs form one group.
+        :param max_iter: int
+            Maximum number of iterations for each group.
+
+        :return: fits with the global parameters and a "group" key with the group code of every drug. The status is
+            "global", or "not converged" with NaN params for drugs whose group did not converge or whose parameters
+            left fitting.fourpl_bounds(). Drugs found inactive by the prescreen are left as they are.
+        """
+        if group_col is None:
+            codes = np.zeros(len(groups), dtype=int)
+        else:
+            labels = self.data.groupby(name_col, sort=False)[group_col]
+            if (labels.nunique(dropna=False) > 1).any():
+                raise ValueError(f"Each drug must have a single value in {group_col}")
+            codes = pd.factorize(labels.first().reindex(groups.names))[0]
+            if (codes < 0).any():
+                raise ValueError(f"{group_col} must not have missing values")
+
+        fitted = np.flatnonzero(fits["status"] != "inactive")
+        groups = groups.take(fitted)
+        conc_pad, resp_pad, mask = groups.padded()
+        params = fits["params"][fitted]
+        initial_guess = np.where(np.isfinite(params), params, self._initial_guess(groups))
+        fit = global_fit(
+            conc_pad,
+            resp_pad,
+            mask,
+            initial_guess,
+            np.where(fits["reverse"][fitted] == 1, -1, 1),
+            FitOptions.shared_positions(shared),
+            groups=codes[fitted],
+            max_iter=max_iter,
+            sigma=groups.padded_sigma(),
+        )
+        lower, upper = fourpl_bounds(conc_pad, resp_pad, mask)
+        inside = (fit.params >= lower) & (fit.params <= upper)
+        valid = fit.converged & np.all(inside, axis=1)
+
+        fits = {field: values.copy() for field, values in fits.items()}
+        fits["params"][fitted] = np.where(valid[:, None], fit.params, np.nan)
+        fits["status"][fitted] = np.where(valid, "global", "not converged")
+        fits["group"] = codes
+        fits["nfev"][fitted] += fit.nfev
+        fits["njev"][fitted] += fit.njev
+        self.fit_stats["nfev"] += int(fit.nfev.sum())
+        self.fit_stats["njev"] += int(fit.njev.sum())
+        return fits
+
+    def _model_fits(
+        self,
+        groups,
+        fits,
+        model: str = "4PL",
+        criterion: str = "aic",
+        max_iter: int = 200,
+    ):
+        """
+        Replace the 4PL fits with another model, or with the best model of each drug for model="auto". The 3PL and
+        5PL models of all drugs are fit in one batch, starting from the 4PL fits. See fitting.fit_models().
+
+        :param groups: GroupedData
+            Grouped view of the fitted drugs.
+        :param fits: dict
+            Per-drug 4PL fit arrays from _fit_groups().
+        :param model: str
+            "4PL", "3PL", "5PL", "constant", or "auto".
+        :param criterion: str
+            "aic" or "bic".
+        :param max_iter: int
+            Maximum number of iterations for the 3PL and 5PL fits.
+
+        :return: fits with two more keys, "model" (name of the model used) and "asymmetry" (5PL asymmetry parameter,
+            1 for the 3PL and 4PL models and NaN for the constant model). The "params" of a constant model are the
+            mean response as maximum and minimum, and NaN for the ic50 and hill_slope.
+        """
+        fits = dict(fits)
+        if model == "4PL" or len(groups) == 0:
+            fits["model"] = np.full(len(groups), "4PL", dtype=object)
+            fits["asymmetry"] = np.ones(len(groups))
+            return fits
+
+        # The 4PL fit is always a candidate, listed first so it is kept when no model can be scored
+        models = ("4PL", "3PL", "5PL", "constant") if model == "auto" else (model,)
+        selection = fit_models(
+            *groups.padded(),
+            fits["params"],
+            np.where(fits["reverse"] == 1, -1, 1),
+            models=models,
+            criterion=criterion,
+            sigma=groups.padded_sigma(),
+            max_iter=max_iter,
+        )
+        replaced = selection["model"] != "4PL"
+        status = np.where(selection["valid"], "converged", "not converged")
+        fits["params"] = np.where(
+            replaced[:, None], selection["params"][:, :4], fits["params"]
+        )
+        fits["status"] = np.where(replaced, status, fits["status"]).astype(object)
+        fits["model"] = selection["model"]
+        fits["asymmetry"] = selection["params"][:, 4]
+        fits["nfev"] = fits["nfev"] + selection["nfev"]
+        fits["njev"] = fits["njev"] + selection["njev"]
+        return fits
+
+    @staticmethod
+    def _reported_params(fits, model: str = "4PL"):
+        """
+        Parameters shown in the output. For models other than "4PL", the ic50 column is the concentration halfway
+        between the plateaus (fitting.logistic_midpoint()), which is the ic50 parameter itself unless the curve is
+        asymmetric.
+
+        :return: np.ndarray of shape (drugs, 4)
+        """
+        if model == "4PL":
+            return fits["params"]
+        params = fits["params"].copy()
+        params[:, 2] = logistic_midpoint(
+            params, np.where(fits["reverse"] == 1, -1, 1), fits["asymmetry"]
+        )
+        return params
+
+    @staticmethod
+    def _free_parameters(fits):
+        """
+        Boolean mask of shape (drugs, 5) of the parameters fit for the model of each drug. The asymmetry is only fit
+        by the 5PL model, the minimum is fixed by the 3PL model, and the hill slope is fixed by the "fixed hill"
+        fallback.
+        """
+        free = np.ones((len(fits["model"]), 5), dtype=bool)
+        free[:, 4] = fits["model"] == "5PL"
+        free[fits["model"] == "3PL", 1] = False
+        free[fits["status"] == "fixed hill", 3] = False
+        return free
+
+    def _fit_curve(self, concentration, response):
+        """
+        Fit a single drug through the fit cache. Used by PlotCurve so that replotting the same data does not refit.
+
+        :param concentration: array-like
+            Concentration values for the drug.
+        :param response: array-like
+            Response values for the drug.
+
+        :return: reverse, params. Params are NaN if the fit did not converge.
+        """
+        groups = GroupedData.from_arrays(
+            np.zeros(len(concentration)), concentration, response
+        )
+        fits = self._cached_fit_groups(groups)
+        return fits["reverse"][0], fits["params"][0]
+
+    def _fit_groups(
+        self,
+        groups,
+        batch: bool = False,
+        n_jobs: int = None,
+        executor=None,
+        max_nfev: int = 1000,
+        time_budget: float = None,
+        prior=None,
+    ):
+        """
+        Fit every drug in the grouped view. Drugs are fit one at a time with curve_fit, or all at once with the batch
+        solver. If n_jobs or executor is given, drugs are split into contiguous chunks that are fit in parallel. Chunks
+        are collected in submission order, so the output order is the same as the serial path.
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame from _grouped().
+        :param batch: bool
+            Fit each chunk with the vectorized solver.
+        :param n_jobs: int
+            Number of worker processes. Use -1 for all available cores.
+        :param executor: concurrent.futures.Executor
+            Optional executor to run the chunks on. Takes priority over n_jobs and is not shut down afterward.
+        :param max_nfev: int
+            Maximum number of model evaluations for each fitting stage.
+        :param time_budget: float
+            Seconds allowed for fitting each drug.
+        :param prior: dict
+            Optional warm start from _prior_guess(). See _initial_guess().
+
+        :return: Dictionary of per-drug arrays in the order of groups.names. See _serial_calculation().
+        """
+        if executor is None and (n_jobs is None or n_jobs == 1) or len(groups) == 0:
+            if batch:
+                return self._batch_calculation(groups, max_nfev, time_budget, prior)
+            return self._serial_calculation(groups, max_nfev, time_budget, prior)
+
+        if executor is None:
+            max_workers = os.cpu_count() if n_jobs == -1 else n_jobs
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                return self._fit_groups(
+                    groups,
+                    batch=batch,
+                    n_jobs=max_workers,
+                    executor=pool,
+                    max_nfev=max_nfev,
+                    time_budget=time_budget,
+                    prior=prior,
+                )
+
+        # Several chunks per worker keeps the workers busy when some chunks fit slower than others
+        workers = n_jobs if n_jobs is not None and n_jobs > 0 else os.cpu_count()
+        chunk_size = max(1, -(-len(groups) // (workers * 4)))
+        starts = range(0, len(groups), chunk_size)
+        chunks = [
+            groups.subset(start, min(start + chunk_size, len(groups)))
+            for start in starts
+        ]
+
+        options = [
+            {
+                "batch": batch,
+                "max_nfev": max_nfev,
+                "time_budget": time_budget,
+                "prior": None
+                if prior is None
+                else {
+                    field: values[start : start + chunk_size]
+                    for field, values in prior.items()
+                },
+            }
+            for start in starts
+        ]
+        results = list(executor.map(_fit_chunk, chunks, options))
+        return {
+            field: np.concatenate([result[field] for result in results])
+            for field in results[0]
+        }
+
+    def _initial_guess(self, groups, prior=None):
+        """
+        Starting parameters for every drug, estimated from the data with fitting.estimate_initial_guess(). The ic50
+        guess is a concentration near the midpoint of the response, so the solver starts close to the answer.
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame from _grouped().
+        :param prior: dict
+            Optional warm start from _prior_guess(). Its parameters replace the estimate from the data for every drug
+            with a usable earlier fit.
+
+        :return: np.ndarray of shape (drugs, 4). Order is maximum, minimum, ic50, and hill_slope.
+        """
+        initial_guess = estimate_initial_guess(*groups.padded())
+        if prior is not None:
+            warm = np.isfinite(prior["params"]).all(axis=1)
+            initial_guess[warm] = prior["params"][warm]
+        return initial_guess
+
+    def _serial_calculation(
+        self,
+        groups,
+        max_nfev: int = 1000,
+        time_budget: float = None,
+        prior=None,
+    ):
+        """
+        Fit every drug one at a time with curve_fit, falling back to simpler fits for drugs that do not converge. See
+        _fit_with_fallback().
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame from _grouped().
+        :param max_nfev: int
+            Maximum number of model evaluations for each fitting stage.
+        :param time_budget: float
+            Seconds allowed for fitting each drug.
+        :param prior: dict
+            Optional warm start from _prior_guess(). Drugs start from its parameters and first fitting stage.
+
+        :return: Dictionary of per-drug arrays in the order of groups.names. Keys are "reverse" (direction tag),
+            "params" (maximum, minimum, ic50, hill_slope), "status" (fitting stage that succeeded), "nfev" (model
+            evaluations) and "njev" (Jacobian evaluations).
+        """
+        reverse = np.zeros(len(groups), dtype=int)
+        params = np.zeros((len(groups), 4))
+        status = np.empty(len(groups), dtype=object)
+        nfev = np.zeros(len(groups), dtype=int)
+        njev = np.zeros(len(groups), dtype=int)
+
+        # Set initial guess for 4PL equation. Max, Min, ic50, and hill_slope
+        initial_guess = self._initial_guess(groups, prior)
+
+        for i in range(len(groups)):
+            # Contiguous views sorted by concentration. No DataFrame copy is needed
+            concentration, response = groups.group(i)
+
+            # tag response col to determine direction of fourpl equation and fit to 4PL equation
+            (
+                reverse[i],
+                params[i],
+                status[i],
+                nfev[i],
+                njev[i],
+            ) = self._fit_with_fallback(
+                concentration,
+                response,
+                initial_guess[i],
+                max_nfev=max_nfev,
+                time_budget=time_budget,
+                start=0 if prior is None else prior["start"][i],
+                sigma=groups.group_sigma(i),
+            )
+        return {
+            "reverse": reverse,
+            "params": params,
+            "status": status,
+            "nfev": nfev,
+            "njev": njev,
+        }
+
+    def _batch_calculation(
+        self,
+        groups,
+        max_nfev: int = 1000,
+        time_budget: float = None,
+        prior=None,
+    ):
+        """
+        Fit every drug at once with the vectorized solver from fitting.py. Drugs are stacked into a padded
+        (drugs x concentrations) array sorted by concentration. Any drug that does not converge in the batch, or whose
+        parameters are not determined by its data, goes through the fallback fits of _fit_with_fallback(), starting
+        from the bounded fit.
+
+        :param groups: GroupedData
+            Grouped view of the input DataFrame from _grouped().
+        :param max_nfev: int
+            Maximum number of model evaluations for each fitting stage.
+        :param time_budget: float
+            Seconds allowed for each drug that falls back to the per-drug fits.
+        :param prior: dict
+            Optional warm start from _prior_guess(). Drugs start from its parameters and first fitting stage.
+
+        :return: Dictionary of per-drug arrays in the order of groups.names. See _serial_calculation().
+        """
+        conc_pad, resp_pad, mask = groups.padded()
+
+        # Same initial guess and direction logic as the single drug calculation
+        direction = curve_direction(conc_pad, resp_pad, mask)
+        reverse = (direction == -1).astype(int)
+        initial_guess = self._initial_guess(groups, prior)
+
+        fit = batch_fit(
+            conc_pad,
+            resp_pad,
+            mask,
+            initial_guess,
+            direction,
+            max_iter=min(200, max_nfev),
+            sigma=groups.padded_sigma(),
+        )
+        params, nfev, njev = fit.params, fit.nfev, fit.njev
+        status = np.full(len(groups), "converged", dtype=object)
+
+        # Batch failures already used up the unbounded fit, so they start at the bounded fit. A singular J^T J is the
+        # batch version of the infinite curve_fit covariance, and its condition number is NaN below 4 data points
+        lower, upper = fourpl_bounds(conc_pad, resp_pad, mask)
+        _, condition = fourpl_covariance(
+            conc_pad, resp_pad, mask, params, direction, sigma=groups.padded_sigma()
+        )
+        valid = np.all((params >= lower) & (params <= upper), axis=1)
+        valid &= condition < 1 / np.finfo(float).eps
+        for i in np.flatnonzero(~(fit.converged & valid)):
+            concentration, response = groups.group(i)
+            fallback = self._fit_with_fallback(
+                concentration,
+                response,
+                initial_guess[i],
+                reverse=reverse[i],
+                max_nfev=max_nfev,
+                time_budget=time_budget,
+                start=1 if prior is None else max(1, prior["start"][i]),
+                sigma=groups.group_sigma(i),
+            )
+            params[i], status[i] = fallback[1], fallback[2]
+            nfev[i] += fallback[3]
+            njev[i] += fallback[4]
+
+        return {
+            "reverse": reverse,
+            "params": params,
+            "status": status,
+            "nfev": nfev,
+            "njev": njev,
+        }
+
+    @staticmethod
+    def _single_bounds(concentration, response):
+        """
+        fitting.fourpl_bounds() for a single drug.
+
+        :return: Tuple of lower and upper bounds. Order is maximum, minimum, ic50, and hill_slope.
+        """
+        lower, upper = fourpl_bounds(
+            np.asarray(concentration, dtype=float)[None],
+            np.asarray(response, dtype=float)[None],
+            np.ones((1, len(response)), dtype=bool),
+        )
+        return lower[0], upper[0]
+
+    @staticmethod
+    def _determined(
+        concentration, response, params, reverse, sigma=None, fixed_hill=False
+    ):
+        """
+        Check that the data of a single drug pins down its fitted parameters, i.e. that J^T J at the parameters is not
+        singular. An unbounded curve_fit reports this with an infinite covariance, but a bounded fit that matches the
+        data exactly, such as a flat curve left at its initial guess, returns a zero covariance instead.
+
+        :return: bool
+        """
+        _, condition = fourpl_covariance(
+            np.asarray(concentration, dtype=float)[None],
+            np.asarray(response, dtype=float)[None],
+            np.ones((1, len(response)), dtype=bool),
+            np.asarray(params, dtype=float)[None],
+            np.array([-1 if reverse == 1 else 1]),
+            sigma=None if sigma is None else np.asarray(sigma, dtype=float)[None],
+            fixed_hill=np.array([fixed_hill]),
+        )
+        return bool(condition[0] < 1 / np.finfo(float).eps)
+
+    def _bounded_fit(
+        self,
+        concentration,
+        response,
+        initial_guess,
+        reverse,
+        max_nfev: int = 1000,
+        budget: FitBudget = None,
+        hill_slope: float = None,
+        sigma=None,
+    ):
+        """
+        Fit a single drug with the parameters held inside fitting.fourpl_bounds(). Uses the trust region reflective
+        method of curve_fit, since Levenberg-Marquardt does not support bounds.
+
+        :param concentration: np.ndarray
+            Concentration values for the drug.
+        :param response: np.ndarray
+            Response values for the drug.
+        :param initial_guess: np.ndarray
+            Starting parameters. Values outside the bounds are clipped onto them.
+        :param reverse: int
+            1 to fit _reverse_fourpl, 0 to fit _fourpl.
+        :param max_nfev: int
+            Maximum number of model evaluations.
+        :param budget: FitBudget
+            Time budget and evaluation counter for the fit.
+        :param hill_slope: float
+            If given, the hill slope is fixed to this value and only the other three parameters are fit.
+        :param sigma: np.ndarray
+            Optional standard error of each response, used to weight the fit.
+
+        :return: np.ndarray of maximum, minimum, ic50, and hill_slope, and the covariance of the fitted parameters
+        """
+        if reverse == 1:
+            model, jacobian = self._reverse_fourpl, self._reverse_fourpl_jacobian
+        else:
+            model, jacobian = self._fourpl, self._fourpl_jacobian
+
+        lower, upper = self._single_bounds(concentration, response)
+        p0 = np.clip(initial_guess, lower, upper)
+
+        if hill_slope is not None:
+            fixed_model, fixed_jacobian = model, jacobian
+
+            def model(concentration, maximum, minimum, ic50):
+                return fixed_model(concentration, maximum, minimum, ic50, hill_slope)
+
+            def jacobian(concentration, maximum, minimum, ic50):
+                return fixed_jacobian(
+                    concentration, maximum, minimum, ic50, hill_slope
+                )[:, :3]
+
+            lower, upper, p0 = lower[:3], upper[:3], p0[:3]
+
+        if budget is not None:
+            model, jacobian = budget.model(model), budget.jacobian(jacobian)
+
+        params, covariance = curve_fit(
+            model,
+            concentration,
+            response,
+            p0=p0,
+            jac=jacobian,
+            sigma=sigma,
+            bounds=(lower, upper),
+            method="trf",
+            max_nfev=max_nfev,
+        )
+        if hill_slope is not None:
+            params = np.append(params, hill_slope)
+        return params, covariance
+
+    def _fit_with_fallback(
+        self,
+        concentration,
+        response,
+        initial_guess,
+        reverse: int = None,
+        max_nfev: int = 1000,
+        time_budget: float = None,
+        start: int = 0,
+        sigma=None,
+    ):
+        """
+        Fitting scheduler for a single drug. Flat or noisy drugs can keep the solver busy for a long time, so every
+        stage is limited to max_nfev evaluations and part of the time budget. If a stage fails, the next, simpler
+        stage is tried:
+
+        1. "converged": unbounded 4PL fit with _calc_logic()
+        2. "bounded": 4PL fit with the parameters held inside fitting.fourpl_bounds()
+        3. "fixed hill": bounded fit with the hill slope fixed to 1
+        4. "not converged": all parameters are NaN
+
+        A stage fails if the solver gives up, runs out of time, or returns parameters outside fitting.fourpl_bounds().
+        It also fails if the data does not pin down the parameters: the covariance is not finite or J^T J is singular,
+        as for a flat curve whose solver stays at the initial ic50 and hill slope. See _determined(). Each stage may
+        use half of the time that is left. The last stage may use all of it. Drugs with fewer data points than the 4
+        parameters are not fit.
+
+        :param concentration: np.ndarray
+            Concentration values for the drug, sorted in ascending order.
+        :param response: np.ndarray
+            Response values for the drug.
+        :param initial_guess: np.ndarray
+            Starting parameters. Order is maximum, minimum, ic50, and hill_slope.
+        :param reverse: int
+            Direction tag. If None, it is determined from the data.
+        :param max_nfev: int
+            Maximum number of model evaluations for each stage.
+        :param time_budget: float
+            Seconds allowed for all stages together. If None, only max_nfev limits the fit.
+        :param start: int
+            Position of the first stage to try. Used by the batch path, which has already run the unbounded fit, and by
+            warm starts from an earlier fit that needed a later stage.
+        :param sigma: np.ndarray
+            Optional standard error of each response, used to weight every stage.
+
+        :return: reverse, params, status, nfev, and njev
+        """
+        stages = ["converged", "bounded", "fixed hill"]
+        total = FitBudget(time_budget)
+        lower, upper = self._single_bounds(concentration, response)
+        nfev, njev = 0, 0
+
+        if reverse is None:
+            direction = curve_direction(
+                np.asarray(concentration, dtype=float)[None],
+                np.asarray(response, dtype=float)[None],
+                np.ones((1, len(response)), dtype=bool),
+            )[0]
+            reverse = int(direction == -1)
+
+        if len(response) < 4:
+            return reverse, np.full(4, np.nan), "not converged", nfev, njev
+
+        for stage in range(start, len(stages)):
+            remaining = total.remaining()
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                if stage < len(stages) - 1:
+                    remaining = remaining / 2
+            budget = FitBudget(remaining)
+
+            try:
+                if stage == 0:
+                    _, params, covariance, infodict = self._calc_logic(
+                        concentration=concentration,
+                        initial_guess=initial_guess,
+                        response=response,
+                        max_nfev=max_nfev,
+                        budget=budget,
+                        sigma=sigma,
+                    )
+                elif stage == 1:
+                    params, covariance = self._bounded_fit(
+                        concentration,
+                        response,
+                        initial_guess,
+                        reverse,
+                        max_nfev,
+                        budget,
+                        sigma=sigma,
+                    )
+                else:
+                    params, covariance = self._bounded_fit(
+                        concentration,
+                        response,
+                        initial_guess,
+                        reverse,
+                        max_nfev,
+                        budget,
+                        hill_slope=1.0,
+                        sigma=sigma,
+                    )
+            except (RuntimeError, TimeoutError, ValueError):
+                params = None
+
+            nfev += budget.nfev
+            njev += budget.njev
+            if (
+                params is not None
+                and np.all((params >= lower) & (params <= upper))
+                and np.all(np.isfinite(covariance))
+                and self._determined(
+                    concentration, response, params, reverse, sigma, stage == 2
+                )
+            ):
+                return reverse, params, stages[stage], nfev, njev
+
+        return reverse, np.full(4, np.nan), "not converged", nfev, njev
+
     # When data is reversed, program is not obtaining correct column.
     def _calc_logic(
         self,
-        data: pd.DataFrame,
+        data: pd.DataFrame = None,
         concentration: pd.Series = None,
         initial_guess: list = None,
         response: pd.Series = None,
         response_col: str = None,
+        max_nfev: int = 100000,
+        budget: FitBudget = None,
+        sigma=None,
     ):
         """
         Set logic to determine positive or negative sigmoid curve. This method is called by internally by the
         absolute_calculation() method.
 
         :param data: pd.DataFrame
-            Input DataFrame. Must columns with drug name, tested concentration, and Response
+            Input DataFrame sorted by concentration. Must columns with drug name, tested concentration, and Response.
+            If None, concentration and response must already be sorted by concentration, as they are when taken from
+            the grouped view.
         :param concentration: pd. Series
             The concentration column from input DataFrame.
         :param initial_guess: list
@@ -516,30 +2561,47 @@ class Calculator:
             The response column from the input Dataframe.
         :param response_col: str
             Name of the response column.
-
-        :return: variables for further calculation. This includes: reverse, params, covariance
+        :param max_nfev: int
+            Maximum number of model evaluations.
+        :param budget: FitBudget
+            Optional time budget and evaluation counter for the fit.
+        :param sigma: np.ndarray
+            Optional standard error of each response, used to weight the fit.
+
+        :return: variables for further calculation. This includes: reverse, params, covariance, and the curve_fit
+            infodict (nfev and njev give the number of function and Jacobian evaluations).
         """
-        global reverse, params, covariance
-        if (
-            data[response_col].iloc[0] > data[response_col].iloc[-1]
-        ):  # Sigmoid curve 100% to 0%
-            params, covariance, *_ = curve_fit(
-                self._reverse_fourpl,
-                concentration,
-                response,
-                p0=[initial_guess],
-                maxfev=100000,
-            )
+        if data is not None:
+            response = data[response_col]
+
+        # Direction is set by the first and last response. If they are equal, the trend of the data decides
+        direction = curve_direction(
+            np.asarray(concentration, dtype=float)[None],
+            np.asarray(response, dtype=float)[None],
+            np.ones((1, len(response)), dtype=bool),
+        )[0]
+
+        if direction == -1:  # Sigmoid curve 100% to 0%
+            model, jacobian = self._reverse_fourpl, self._reverse_fourpl_jacobian
             reverse = 1  # Tag direction of sigmoid curve
-
-        elif (
-            data[response_col].iloc[0] < data[response_col].iloc[-1]
-        ):  # sigmoid curve 0% to 100%
-            params, covariance, *_ = curve_fit(
-                self._fourpl, concentration, response, p0=[initial_guess], maxfev=100000
-            )
+        else:  # sigmoid curve 0% to 100%
+            model, jacobian = self._fourpl, self._fourpl_jacobian
             reverse = 0  # Tag direction of sigmoid curve
-        return reverse, params, covariance
+
+        if budget is not None:
+            model, jacobian = budget.model(model), budget.jacobian(jacobian)
+
+        params, covariance, infodict, *_ = curve_fit(
+            model,
+            concentration,
+            response,
+            p0=[initial_guess],
+            sigma=sigma,
+            jac=jacobian,
+            maxfev=max_nfev,
+            full_output=True,
+        )
+        return reverse, params, covariance, infodict
 
     def _unit_convert(
         self, ic50: int = None, x_intersection: int = None, input_units: str = None
@@ -579,6 +2641,14 @@ class Calculator:
             print("Need to be in 'nM' (Nanomolar) or 'µM' (Micromolar) concentrations!")
 
 
+def _fit_chunk(groups, options):
+    """
+    Worker for Calculator._fit_groups(). Defined at module level so it can be sent to a ProcessPoolExecutor. Only the
+    chunk of grouped arrays is pickled, not the full input DataFrame.
+    """
+    return Calculator(pd.DataFrame())._fit_groups(groups, **options)
+
+
 if __name__ == "__main__":
     import doctest
 
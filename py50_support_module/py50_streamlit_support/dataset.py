@@ -0,0 +1,626 @@
+"""
+Grouped views of dose-response data. Rows are sorted once by drug name and concentration and the start of each drug
+is recorded in an offsets array, so every drug can be sliced out as a contiguous NumPy view without scanning or
+copying the input DataFrame. Replicate wells (repeated rows or several response columns) are reduced to one mean per
+concentration in the same pass, and the spread of the replicates is kept as a weight for the fit.
+
+A grouped view can be saved as a store, a folder of .npy files that is opened again with np.load(mmap_mode="r"). No
+parsing or sorting is needed to reopen it, and processes that open the same store share its pages.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from py50_streamlit_support.fitting import pad_groups
+
+__all__ = ["GroupedData", "iter_csv_groups", "read_parquet"]
+
+# Arrays of a store, in the order of the GroupedData arguments. The last three only exist for replicate data
+_STORE_ARRAYS = (
+    "names",
+    "concentration",
+    "response",
+    "offsets",
+    "sigma",
+    "replicates",
+    "wells",
+)
+_STORE_FORMAT = 1
+
+
+class GroupedData:
+    """
+    Dose-response data grouped by drug name. The rows for drug i are found in
+    concentration[offsets[i]:offsets[i + 1]] and response[offsets[i]:offsets[i + 1]], sorted by concentration.
+
+    :param names: np.ndarray
+        Unique drug names in sorted order.
+    :param concentration: np.ndarray
+        Concentrations sorted by drug name and then concentration.
+    :param response: np.ndarray
+        Responses in the same order as concentration.
+    :param offsets: np.ndarray
+        Start position of each drug plus the final end position.
+    :param sigma: np.ndarray
+        Standard error of each response, used to weight the fit. None if the data has no replicates.
+    :param replicates: np.ndarray
+        Number of replicate wells behind each response. None if the data has no replicates.
+    :param wells: np.ndarray
+        Raw replicate responses behind each mean, of shape (rows, most replicates) and padded with NaN. Used to
+        resample replicates for bootstrap intervals. None if the data has no replicates.
+    """
+
+    def __init__(
+        self,
+        names,
+        concentration,
+        response,
+        offsets,
+        sigma=None,
+        replicates=None,
+        wells=None,
+    ):
+        self.names = names
+        self.concentration = concentration
+        self.response = response
+        self.offsets = offsets
+        self.sigma = sigma
+        self.replicates = replicates
+        self.wells = wells
+        self._padded = None
+        # (path, first drug, last drug + 1) when the arrays are memory-mapped from a store. See load()
+        self._source = None
+
+    def __getstate__(self):
+        # Slices of a store are sent to worker processes as a reference, and each worker maps the same files
+        if self._source is not None:
+            return {"_source": self._source}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "_source" in state and len(state) == 1:
+            path, start, stop = state["_source"]
+            state = GroupedData.load(path).subset(start, stop).__dict__
+        self.__dict__.update(state)
+
+    @classmethod
+    def from_arrays(cls, name, concentration, response):
+        """
+        Build the grouped view from flat arrays. Rows with the same drug name and concentration are replicates and
+        are reduced to their mean. Missing (NaN) responses are skipped.
+
+        :param name: array-like
+            Drug name for each row.
+        :param concentration: array-like
+            Concentration for each row.
+        :param response: array-like
+            Response for each row. A 2-D array holds one replicate per column.
+
+        :return: GroupedData
+        """
+        # Hash-based factorize only sorts the unique names, not every row
+        codes, names = pd.factorize(np.asarray(name), sort=True)
+        return cls._from_codes(
+            np.asarray(names), codes.astype(np.int64), concentration, response
+        )
+
+    @classmethod
+    def _from_codes(cls, names, codes, concentration, response):
+        """
+        Build the grouped view from sorted unique names and the position of each row's name in them.
+
+        :return: GroupedData
+        """
+        concentration = np.asarray(concentration, dtype=float)
+        response = np.asarray(response, dtype=float)
+
+        # lexsort is stable, so rows with the same concentration keep their input order
+        order = np.lexsort((concentration, codes))
+        codes, concentration, response = codes[order], concentration[order], response[order]
+
+        # Each run of equal drug and concentration is one dose. Without replicates or missing values every run is a
+        # single row and the sorted arrays are used as they are
+        new_dose = np.r_[
+            True, (codes[1:] != codes[:-1]) | (concentration[1:] != concentration[:-1])
+        ]
+        if response.ndim == 1 and new_dose.all() and not np.isnan(response).any():
+            offsets = np.searchsorted(codes, np.arange(len(names) + 1))
+            return cls(names, concentration, response, offsets)
+        return cls._aggregate(names, codes, concentration, response, new_dose)
+
+    @classmethod
+    def _aggregate(cls, names, codes, concentration, response, new_dose):
+        """
+        Reduce sorted replicate rows to the mean, standard deviation, and count of every dose with np.add.reduceat,
+        so the cost is one pass over the rows no matter how many replicates there are.
+
+        Each mean is weighted by its standard error, sd / sqrt(n). Doses with fewer than two replicates, or whose
+        replicates happen to agree exactly, use the pooled standard deviation of the drug instead. The standard
+        deviation is also kept above 10% of the pooled value, so two replicates that agree by chance do not dominate
+        the fit. Drugs with no replicate spread at all are weighted by the replicate count only.
+
+        :return: GroupedData with one row per dose
+        """
+        if response.ndim == 1:
+            response = response[:, None]
+        starts = np.flatnonzero(new_dose)
+        dose = np.cumsum(new_dose) - 1
+
+        # Count, mean, and sum of squared deviations for each dose
+        present = ~np.isnan(response)
+        values = np.where(present, response, 0.0)
+        count = np.add.reduceat(present.sum(axis=1), starts)
+        with np.errstate(all="ignore"):
+            mean = np.add.reduceat(values.sum(axis=1), starts) / count
+            deviation = np.where(present, response - mean[dose, None], 0.0)
+            squares = np.add.reduceat((deviation**2).sum(axis=1), starts)
+            variance = squares / (count - 1)
+
+        # Rows are sorted by dose, so the present responses of each dose are contiguous in row-major order
+        wells, _ = pad_groups(response[present], np.r_[0, np.cumsum(count)])
+
+        # Doses with no responses at all are dropped
+        keep = count > 0
+        codes, concentration = codes[starts][keep], concentration[starts][keep]
+        mean, variance, count = mean[keep], variance[keep], count[keep]
+        wells = wells[keep]
+        offsets = np.searchsorted(codes, np.arange(len(names) + 1))
+
+        # Pooled variance of every drug from the doses with a usable variance
+        usable = (count > 1) & (variance > 0)
+        pooled_sum = np.bincount(codes, np.where(usable, variance, 0.0), len(names))
+        pooled_count = np.bincount(codes, usable, len(names))
+        with np.errstate(all="ignore"):
+            pooled = np.sqrt(pooled_sum / pooled_count)[codes]
+        pooled = np.where(np.isfinite(pooled), pooled, 1.0)
+
+        sd = np.where(usable, np.sqrt(np.where(usable, variance, 1.0)), pooled)
+        sd = np.maximum(sd, 0.1 * pooled)
+        sigma = sd / np.sqrt(count)
+        return cls(names, concentration, mean, offsets, sigma, count, wells)
+
+    @classmethod
+    def from_frame(
+        cls,
+        data: pd.DataFrame,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+    ):
+        """
+        Build the grouped view from DataFrame columns.
+
+        :param data: pd.DataFrame
+            Input DataFrame.
+        :param name_col: str
+            Name column from DataFrame.
+        :param concentration_col: str
+            Concentration column from DataFrame.
+        :param response_col: str or list
+            Response column from DataFrame. A list of columns holds one replicate per column.
+
+        :return: GroupedData
+        """
+        if not isinstance(response_col, str):
+            response_col = list(response_col)
+        name = data[name_col]
+        concentration = data[concentration_col].to_numpy(dtype=float)
+        response = data[response_col].to_numpy(dtype=float)
+        if not isinstance(name.dtype, pd.CategoricalDtype):
+            return cls.from_arrays(name.to_numpy(), concentration, response)
+
+        # Categorical names are grouped by their integer codes, so the name strings are only sorted once
+        used, codes = np.unique(name.cat.codes.to_numpy(), return_inverse=True)
+        names = name.cat.categories.to_numpy()[used]
+        rank = np.argsort(names, kind="stable")
+        position = np.empty_like(rank)
+        position[rank] = np.arange(len(rank))
+        return cls._from_codes(names[rank], position[codes], concentration, response)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def lengths(self):
+        """Number of rows for each drug"""
+        return np.diff(self.offsets)
+
+    def group(self, i: int):
+        """
+        Concentration and response views for the i-th drug. No data is copied.
+
+        :param i: int
+            Position of the drug in self.names.
+
+        :return: Tuple of concentration and response arrays.
+        """
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.concentration[start:stop], self.response[start:stop]
+
+    def group_sigma(self, i: int):
+        """
+        Standard error view for the i-th drug.
+
+        :param i: int
+            Position of the drug in self.names.
+
+        :return: np.ndarray, or None if the data has no replicates.
+        """
+        if self.sigma is None:
+            return None
+        return self.sigma[self.offsets[i] : self.offsets[i + 1]]
+
+    def subset(self, start: int, stop: int):
+        """
+        Grouped view of drugs start to stop. Arrays are views into this object, so they are only copied if the subset
+        is pickled, for example when it is sent to a worker process.
+
+        :param start: int
+            Position of the first drug.
+        :param stop: int
+            Position after the last drug.
+
+        :return: GroupedData
+        """
+        row_start, row_stop = self.offsets[start], self.offsets[stop]
+        rows = slice(row_start, row_stop)
+        subset = GroupedData(
+            self.names[start:stop],
+            self.concentration[rows],
+            self.response[rows],
+            self.offsets[start : stop + 1] - row_start,
+            None if self.sigma is None else self.sigma[rows],
+            None if self.replicates is None else self.replicates[rows],
+            None if self.wells is None else self.wells[rows],
+        )
+        if self._source is not None:
+            path, first, _ = self._source
+            subset._source = (path, first + start, first + stop)
+        return subset
+
+    def take(self, indices):
+        """
+        Grouped view of the drugs at the given positions. Unlike subset(), the drugs do not need to be contiguous, so
+        the selected rows are copied. A contiguous run of positions is passed on to subset() instead.
+
+        :param indices: array-like
+            Positions of the drugs to keep.
+
+        :return: GroupedData
+        """
+        indices = np.asarray(indices, dtype=int)
+        if len(indices) and (np.diff(indices) == 1).all():
+            return self.subset(indices[0], indices[-1] + 1)
+        lengths = self.lengths[indices]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        rows = np.arange(offsets[-1]) + np.repeat(
+            self.offsets[indices] - offsets[:-1], lengths
+        )
+        return GroupedData(
+            self.names[indices],
+            self.concentration[rows],
+            self.response[rows],
+            offsets,
+            None if self.sigma is None else self.sigma[rows],
+            None if self.replicates is None else self.replicates[rows],
+            None if self.wells is None else self.wells[rows],
+        )
+
+    def without(self, rows, wells=None):
+        """
+        Grouped view without the flagged rows and replicate wells, for example the outliers found by
+        qc.outlier_mask(). Doses with replicates are reduced again from the wells that are left, so their mean and
+        weight only use the kept wells. Doses with no wells left are dropped.
+
+        :param rows: np.ndarray
+            Boolean array with one value per row. True drops the row.
+        :param wells: np.ndarray
+            Optional boolean array of the same shape as self.wells. True drops the well. Ignored if the data has no
+            replicates.
+
+        :return: GroupedData
+        """
+        codes = np.repeat(np.arange(len(self)), self.lengths)
+        if self.wells is None:
+            keep = ~np.asarray(rows, dtype=bool)
+            return GroupedData(
+                self.names,
+                self.concentration[keep],
+                self.response[keep],
+                np.searchsorted(codes[keep], np.arange(len(self) + 1)),
+            )
+
+        dropped = np.asarray(rows, dtype=bool)[:, None]
+        if wells is not None:
+            dropped = dropped | wells
+        response = np.where(dropped, np.nan, self.wells)
+        new_dose = np.ones(len(codes), dtype=bool)
+        return GroupedData._aggregate(
+            self.names, codes, self.concentration, response, new_dose
+        )
+
+    def save(self, path):
+        """
+        Save the grouped view as a store: a folder with one .npy file per array and a store.json file with the
+        format version. The arrays are written as they are, already sorted and grouped, so load() does not parse or
+        sort anything. Drug names are saved as fixed-width strings, because object arrays cannot be memory-mapped.
+
+        :param path: str
+            Folder to write. It is created if needed, and the files of an older store in it are replaced. Stores that
+            are still open keep the old data.
+        """
+        os.makedirs(path, exist_ok=True)
+        names = np.asarray(self.names)
+        if names.dtype == object:
+            names = names.astype(str)
+        arrays = {
+            "names": names,
+            "concentration": self.concentration,
+            "response": self.response,
+            "offsets": self.offsets,
+            "sigma": self.sigma,
+            "replicates": self.replicates,
+            "wells": self.wells,
+        }
+        for field in _STORE_ARRAYS:
+            file = os.path.join(path, f"{field}.npy")
+            if arrays[field] is None:
+                if os.path.exists(file):
+                    os.remove(file)
+                continue
+            # Replace files by renaming, so processes that still map the old store keep reading the old files
+            with open(file + ".tmp", "wb") as handle:
+                np.save(handle, np.ascontiguousarray(arrays[field]))
+            os.replace(file + ".tmp", file)
+        with open(os.path.join(path, "store.json"), "w") as handle:
+            json.dump(
+                {
+                    "format": _STORE_FORMAT,
+                    "drugs": len(self),
+                    "rows": len(self.response),
+                },
+                handle,
+            )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Open a store written by save(). Arrays are memory-mapped read-only, so opening is instant, only the pages a
+        calculation touches are read from disk, and every process that opens the store shares them through the page
+        cache. Contiguous subsets sent to worker processes are pickled as a reference to the store.
+
+        :param path: str
+            Folder written by save().
+
+        :return: GroupedData
+        """
+        info = os.path.join(path, "store.json")
+        if not os.path.exists(info):
+            raise ValueError(f"{path} is not a dose-response store")
+        with open(info) as handle:
+            if json.load(handle).get("format") != _STORE_FORMAT:
+                raise ValueError(f"{path} was written by another version of py50")
+
+        arrays = []
+        for field in _STORE_ARRAYS:
+            file = os.path.join(path, f"{field}.npy")
+            arrays.append(
+                np.load(file, mmap_mode="r") if os.path.exists(file) else None
+            )
+        groups = cls(*arrays)
+        groups._source = (os.path.abspath(path), 0, len(groups))
+        return groups
+
+    def padded(self):
+        """
+        Padded (drugs x concentrations) arrays for the batch solver. Result is built once and reused.
+
+        :return: Tuple of padded concentration, padded response, and a boolean mask of real values.
+        """
+        if self._padded is None:
+            conc_pad, mask = pad_groups(self.concentration, self.offsets)
+            resp_pad, _ = pad_groups(self.response, self.offsets)
+            self._padded = (conc_pad, resp_pad, mask)
+        return self._padded
+
+    def padded_sigma(self):
+        """
+        Padded (drugs x concentrations) standard errors for the batch solver.
+
+        :return: np.ndarray, or None if the data has no replicates.
+        """
+        if self.sigma is None:
+            return None
+        return pad_groups(self.sigma, self.offsets, fill_value=1.0)[0]
+
+    def padded_wells(self):
+        """
+        Padded (drugs x concentrations x replicates) raw replicate responses for bootstrap resampling. Missing wells
+        and padded concentrations are NaN.
+
+        :return: np.ndarray, or None if the data has no replicates.
+        """
+        if self.wells is None:
+            return None
+        _, _, mask = self.padded()
+        padded = np.full(mask.shape + self.wells.shape[1:], np.nan)
+        padded[mask] = self.wells
+        return padded
+
+    def content_hashes(self):
+        """
+        64-bit content hash of every drug's concentrations, responses, and weights. Built from pandas row hashes with
+        one cumulative sum, so all drugs are hashed at once. Used to find the drugs whose data changed between two
+        versions of a table.
+
+        :return: np.ndarray of uint64, one per drug
+        """
+        position = np.arange(len(self.response)) - np.repeat(
+            self.offsets[:-1], self.lengths
+        )
+        columns = [position, self.concentration, self.response]
+        if self.sigma is not None:
+            columns.append(self.sigma)
+        row_hash = np.zeros(len(self.response), dtype=np.uint64)
+        for k, column in enumerate(columns):
+            # Odd multipliers keep the columns from cancelling each other out
+            row_hash ^= pd.util.hash_array(np.asarray(column)) * np.uint64(2 * k + 1)
+        total = np.concatenate([[np.uint64(0)], np.cumsum(row_hash, dtype=np.uint64)])
+        return total[self.offsets[1:]] - total[self.offsets[:-1]]
+
+    def endpoints(self):
+        """
+        Response at the lowest and highest concentration of every drug.
+
+        :return: Tuple of first and last response arrays.
+        """
+        return self.response[self.offsets[:-1]], self.response[self.offsets[1:] - 1]
+
+
+def response_columns(response_col):
+    """
+    Response column names as a list.
+
+    :param response_col: str or list
+        One response column, or a list of replicate columns.
+
+    :return: list
+    """
+    if isinstance(response_col, str):
+        return [response_col]
+    return list(response_col)
+
+
+def as_dataframe(data):
+    """
+    Input data as a DataFrame. pyarrow Tables are converted with to_pandas(), which turns dictionary columns into
+    categorical columns.
+
+    :param data: pd.DataFrame or pyarrow.Table
+        Input data.
+
+    :return: pd.DataFrame
+    """
+    if isinstance(data, pd.DataFrame):
+        return data
+    # Checked by its methods, so pyarrow is not imported for DataFrame input
+    if hasattr(data, "to_pandas") and hasattr(data, "schema"):
+        return data.to_pandas()
+    raise ValueError("Input must be a DataFrame or a pyarrow Table")
+
+
+def read_parquet(
+    path,
+    name_col: str = None,
+    concentration_col: str = None,
+    response_col: str = None,
+    names=None,
+    **kwargs,
+):
+    """
+    Read the name, concentration, and response columns of a Parquet file. Only these columns are read from disk, so
+    the other columns of a wide plate export cost nothing. With names, row groups whose statistics cannot hold any of
+    the drugs are skipped and the remaining rows are filtered while reading. Text drug names are read as a
+    categorical column, like Calculator.from_csv(). Requires pyarrow.
+
+    :param path: str or file-like
+        Parquet file, or a folder of Parquet files.
+    :param name_col: str
+        Name column from the file.
+    :param concentration_col: str
+        Concentration column from the file.
+    :param response_col: str or list
+        Response column from the file. A list of columns holds one replicate per column.
+    :param names: list
+        Optional drug names to read. If None, every drug is read.
+    :param kwargs:
+        Passed on to pyarrow.parquet.read_table().
+
+    :return: pd.DataFrame
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "read_parquet() requires pyarrow. Install it with: pip install pyarrow"
+        )
+    columns = [name_col, concentration_col] + response_columns(response_col)
+    if names is not None:
+        kwargs["filters"] = [(name_col, "in", list(names))]
+    table = pq.read_table(path, columns=columns, **kwargs)
+
+    name = table.column(name_col)
+    if pa.types.is_string(name.type) or pa.types.is_large_string(name.type):
+        position = table.schema.get_field_index(name_col)
+        table = table.set_column(position, name_col, name.dictionary_encode())
+    return table.to_pandas()
+
+
+def iter_csv_groups(
+    path,
+    name_col: str = None,
+    concentration_col: str = None,
+    response_col: str = None,
+    chunksize: int = 100000,
+    **kwargs,
+):
+    """
+    Read a CSV file in chunks and yield the drugs whose rows are complete, so fitting can start while the rest of the
+    file is still being read. Only the three needed columns are parsed. The rows of each drug must be next to each
+    other in the file, as they are in plate reader exports. The last drug of a chunk is held back until the next
+    chunk shows that its rows have ended.
+
+    :param path: str or file-like
+        CSV file to read.
+    :param name_col: str
+        Name column from the file.
+    :param concentration_col: str
+        Concentration column from the file.
+    :param response_col: str or list
+        Response column from the file. A list of columns holds one replicate per column.
+    :param chunksize: int
+        Number of rows to parse at a time.
+    :param kwargs:
+        Passed on to pd.read_csv().
+
+    :return: Generator of GroupedData
+    """
+    value_cols = [concentration_col] + response_columns(response_col)
+    reader = pd.read_csv(
+        path,
+        usecols=[name_col] + value_cols,
+        dtype=dict.fromkeys(value_cols, float),
+        chunksize=chunksize,
+        **kwargs,
+    )
+
+    seen = set()
+    carry = None
+    for chunk in reader:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if len(chunk) == 0:
+            continue
+
+        # Start of every block of rows with the same drug name
+        name = chunk[name_col].to_numpy()
+        starts = np.flatnonzero(np.r_[True, name[1:] != name[:-1]])
+        run_names = name[starts]
+        if len(set(run_names)) != len(run_names) or seen.intersection(run_names):
+            raise ValueError(
+                "Rows for each drug must be next to each other in the file. Sort the file by drug name or read it "
+                "with Calculator.from_csv()"
+            )
+
+        # Rows of the last drug may continue in the next chunk
+        complete, carry = chunk.iloc[: starts[-1]], chunk.iloc[starts[-1] :]
+        if len(complete):
+            seen.update(run_names[:-1])
+            yield GroupedData.from_frame(
+                complete, name_col, concentration_col, response_col
+            )
+
+    if carry is not None and len(carry):
+        yield GroupedData.from_frame(carry, name_col, concentration_col, response_col)
@@ -0,0 +1,1597 @@
+"""
+Batched curve fitting for the Calculator. Instead of calling scipy's curve_fit once per compound, every compound is
+stacked into a padded (compounds x doses) array and fitted at once with a vectorized Levenberg-Marquardt solver.
+
+Besides the 4PL equation, the solver fits the 5PL equation, which adds an asymmetry parameter. The 3PL model is the
+4PL equation with the minimum fixed at 0. See fit_models() for model selection. global_fit() fits compounds with
+parameters shared across a group. screen_activity() sorts out flat compounds before any fitting.
+"""
+
+import time
+import numpy as np
+
+__all__ = [
+    "BatchFit",
+    "FitBudget",
+    "MODELS",
+    "batch_fit",
+    "bootstrap_fit",
+    "curve_direction",
+    "estimate_initial_guess",
+    "fit_models",
+    "fivepl_jacobian",
+    "fourpl_bounds",
+    "fourpl_covariance",
+    "fourpl_jacobian",
+    "global_covariance",
+    "global_fit",
+    "inverse_fourpl",
+    "logistic_bounds",
+    "logistic_midpoint",
+    "pad_groups",
+    "screen_activity",
+]
+
+# Models known to fit_models() and the number of free parameters of each
+MODELS = {"constant": 1, "3PL": 3, "4PL": 4, "5PL": 5}
+
+
+def pad_groups(values, offsets, fill_value=np.nan):
+    """
+    Scatter a flat array of grouped values into a padded 2D array. Rows belonging to group i are found in
+    values[offsets[i]:offsets[i + 1]].
+
+    :param values: np.ndarray
+        Flat array of values sorted by group.
+    :param offsets: np.ndarray
+        Start position of each group plus the final end position (length is number of groups + 1).
+    :param fill_value: float
+        Value used for the padded cells.
+
+    :return: Padded array of shape (groups, longest group) and a boolean mask marking the real values.
+    """
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    n_groups = len(lengths)
+    width = int(lengths.max()) if n_groups > 0 else 0
+
+    row = np.repeat(np.arange(n_groups), lengths)
+    col = np.arange(offsets[-1] - offsets[0]) - np.repeat(offsets[:-1] - offsets[0], lengths)
+
+    padded = np.full((n_groups, width), fill_value, dtype=float)
+    mask = np.zeros((n_groups, width), dtype=bool)
+    padded[row, col] = values[offsets[0] : offsets[-1]]
+    mask[row, col] = True
+    return padded, mask
+
+
+def _fourpl_batch(concentration, params, direction):
+    """
+    Vectorized form of Calculator._fourpl and Calculator._reverse_fourpl. The reverse equation is the forward
+    equation with a negated hill slope, so a direction of +1 gives _fourpl and -1 gives _reverse_fourpl.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param params: np.ndarray
+        Parameters of shape (compounds, 4) in the order used by Calculator (maximum, minimum, ic50, hill_slope).
+    :param direction: np.ndarray
+        +1 or -1 for each compound.
+
+    :return: Padded responses of shape (compounds, doses).
+    """
+    maximum, minimum, ic50, hill_slope = (params[:, i, None] for i in range(4))
+    with np.errstate(all="ignore"):
+        return maximum + (minimum - maximum) / (
+            1 + (concentration / ic50) ** (direction[:, None] * hill_slope)
+        )
+
+
+def _fivepl_batch(concentration, params, direction):
+    """
+    Vectorized 5PL equation. The 4PL term is raised to the power of the asymmetry parameter, so an asymmetry of 1
+    gives the 4PL equation.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param params: np.ndarray
+        Parameters of shape (compounds, 5). Order is maximum, minimum, ic50, hill_slope, and asymmetry.
+    :param direction: np.ndarray
+        +1 or -1 for each compound.
+
+    :return: Padded responses of shape (compounds, doses).
+    """
+    maximum, minimum, ic50, hill_slope, asymmetry = (
+        params[:, i, None] for i in range(5)
+    )
+    with np.errstate(all="ignore"):
+        return maximum + (minimum - maximum) / (
+            1 + (concentration / ic50) ** (direction[:, None] * hill_slope)
+        ) ** asymmetry
+
+
+def curve_direction(concentration, response, mask):
+    """
+    Direction of every dose-response curve. A curve falls (100% to 0%, fit with _reverse_fourpl) when the response at
+    the lowest concentration is above the response at the highest concentration. When the two are equal, the sign of
+    the trend of the response against log concentration decides. Flat curves are treated as rising.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses), sorted in ascending order within each row.
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+
+    :return: np.ndarray with -1 for falling curves and +1 for rising curves.
+    """
+    n_compounds = len(response)
+    rows = np.arange(n_compounds)
+    first = response[:, 0] if n_compounds else np.zeros(0)
+    last = response[rows, mask.sum(axis=1) - 1] if n_compounds else np.zeros(0)
+
+    with np.errstate(all="ignore"):
+        log_conc = np.log10(np.where(mask & (concentration > 0), concentration, np.nan))
+        use = mask & np.isfinite(log_conc)
+        n = use.sum(axis=1)
+        x_mean = np.where(use, log_conc, 0).sum(axis=1) / n
+        y_mean = np.where(use, response, 0).sum(axis=1) / n
+        trend = np.where(
+            use,
+            (log_conc - x_mean[:, None]) * (response - y_mean[:, None]),
+            0,
+        ).sum(axis=1)
+
+    falling = (first > last) | ((first == last) & (trend < 0))
+    return np.where(falling, -1, 1)
+
+
+def _average_ranks(values, mask):
+    """
+    Ranks of the real values in every row, starting at 1. Tied values get the average of their ranks. Padded values
+    are ranked last and should be ignored.
+    """
+    n_cols = values.shape[1]
+    filled = np.where(mask, values, np.inf)
+    order = np.argsort(filled, axis=1, kind="stable")
+    ordered = np.take_along_axis(filled, order, axis=1)
+    position = np.broadcast_to(np.arange(n_cols), values.shape)
+
+    # First and last sorted position of every run of tied values
+    starts = np.ones(values.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends = np.ones(values.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    first = np.maximum.accumulate(np.where(starts, position, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, position, n_cols)[:, ::-1], axis=1)
+
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, 0.5 * (first + last[:, ::-1]) + 1, axis=1)
+    return ranks
+
+
+def screen_activity(
+    concentration,
+    response,
+    mask,
+    min_span: float = 20.0,
+    min_effect: float = 20.0,
+    full_effect: float = 80.0,
+    min_trend: float = 0.6,
+):
+    """
+    Classify every compound as "inactive", "partial", or "full" from its data alone, without fitting. Three statistics
+    are used:
+
+    1. span: highest minus lowest response
+    2. effect: mean response at the highest concentration minus the mean response at the lowest concentration
+    3. trend: Spearman rank correlation between concentration and response, a test for a monotonic curve
+
+    A compound is inactive if its span is below min_span, or if both its effect is below min_effect and its trend is
+    below min_trend. Active compounds are full if their effect reaches full_effect and partial otherwise. Thresholds
+    are in response units, so the defaults assume responses in percent.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses), sorted in ascending order within each row.
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param min_span: float
+        Smallest response span of an active compound.
+    :param min_effect: float
+        Effect that makes a compound active regardless of its trend.
+    :param full_effect: float
+        Smallest effect of a fully active compound.
+    :param min_trend: float
+        Absolute rank correlation that makes a compound active regardless of its effect.
+
+    :return: Dictionary of arrays of length compounds. Keys are "activity", "span", "effect" (absolute), and "trend".
+    """
+    n_compounds, n_doses = response.shape
+    if n_compounds == 0 or n_doses == 0:
+        empty = np.zeros(n_compounds)
+        return {
+            "activity": np.full(n_compounds, "inactive", dtype=object),
+            "span": empty,
+            "effect": empty,
+            "trend": empty,
+        }
+
+    n = mask.sum(axis=1)
+    rows = np.arange(n_compounds)
+    with np.errstate(all="ignore"):
+        high = np.where(mask, response, -np.inf).max(axis=1)
+        low = np.where(mask, response, np.inf).min(axis=1)
+        span = np.where(n > 0, high - low, 0.0)
+
+        # Replicates at the lowest and highest concentration are averaged
+        at_low = mask & (concentration == concentration[:, :1])
+        top = concentration[rows, np.maximum(n - 1, 0)]
+        at_high = mask & (concentration == top[:, None])
+        effect = np.abs(
+            np.where(at_high, response, 0).sum(axis=1) / at_high.sum(axis=1)
+            - np.where(at_low, response, 0).sum(axis=1) / at_low.sum(axis=1)
+        )
+        effect = np.where(np.isfinite(effect), effect, 0.0)
+
+        # Average ranks keep the mean rank at (n + 1) / 2 for both variables
+        center = 0.5 * (n + 1)[:, None]
+        conc_ranks = np.where(mask, _average_ranks(concentration, mask) - center, 0)
+        resp_ranks = np.where(mask, _average_ranks(response, mask) - center, 0)
+        trend = (conc_ranks * resp_ranks).sum(axis=1) / np.sqrt(
+            (conc_ranks**2).sum(axis=1) * (resp_ranks**2).sum(axis=1)
+        )
+        trend = np.where(np.isfinite(trend), trend, 0.0)
+
+    inactive = (span < min_span) | ((effect < min_effect) & (np.abs(trend) < min_trend))
+    activity = np.where(
+        inactive, "inactive", np.where(effect >= full_effect, "full", "partial")
+    ).astype(object)
+    return {"activity": activity, "span": span, "effect": effect, "trend": trend}
+
+
+def fourpl_bounds(concentration, response, mask):
+    """
+    Plausible 4PL parameters for every compound. The plateaus may lie one response span outside the data, the ic50
+    must be within three log units of the tested concentrations, and the hill slope must be between 0.01 and 20. Used
+    as the bounds of the fallback fits and to reject fits that ran off to implausible values.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+
+    :return: Tuple of lower and upper bound arrays of shape (compounds, 4). Order is maximum, minimum, ic50, and
+        hill_slope.
+    """
+    with np.errstate(all="ignore"):
+        low = np.where(mask, response, np.inf).min(axis=1, initial=np.inf)
+        high = np.where(mask, response, -np.inf).max(axis=1, initial=-np.inf)
+        span = np.where(high > low, high - low, np.maximum(np.abs(high), 1.0))
+
+        positive = mask & (concentration > 0)
+        conc_low = np.where(positive, concentration, np.inf).min(
+            axis=1, initial=np.inf
+        )
+        conc_high = np.where(positive, concentration, -np.inf).max(
+            axis=1, initial=-np.inf
+        )
+        conc_low, conc_high = conc_low / 1e3, conc_high * 1e3
+        no_positive = ~positive.any(axis=1)
+        conc_low[no_positive] = np.finfo(float).tiny
+        conc_high[no_positive] = 1.0
+
+    hill = np.ones_like(low)
+    lower = np.stack([low - span, low - span, conc_low, 0.01 * hill], axis=1)
+    upper = np.stack([high + span, high + span, conc_high, 20.0 * hill], axis=1)
+    return lower, upper
+
+
+def logistic_bounds(concentration, response, mask):
+    """
+    fourpl_bounds() with a fifth column for the 5PL asymmetry parameter, which must be between 0.05 and 20.
+
+    :return: Tuple of lower and upper bound arrays of shape (compounds, 5).
+    """
+    lower, upper = fourpl_bounds(concentration, response, mask)
+    ones = np.ones((len(lower), 1))
+    return np.hstack([lower, 0.05 * ones]), np.hstack([upper, 20.0 * ones])
+
+
+class FitBudget:
+    """
+    Budget for fitting a single compound. Wraps the model and Jacobian functions passed to curve_fit so that every
+    call is counted, and raises TimeoutError once the wall-clock deadline has passed. This stops a pathological
+    compound from stalling a whole run.
+
+    :param time_budget: float
+        Seconds allowed for the compound. If None, only evaluations are counted.
+    """
+
+    def __init__(self, time_budget: float = None):
+        self.nfev = 0
+        self.njev = 0
+        self.deadline = None
+        if time_budget is not None:
+            self.deadline = time.perf_counter() + time_budget
+
+    def remaining(self):
+        """Seconds left before the deadline, or None if there is no deadline"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.perf_counter()
+
+    def check(self):
+        """Raise TimeoutError if the deadline has passed"""
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise TimeoutError("Fit time budget exceeded")
+
+    def model(self, func):
+        """Wrap a model function to count evaluations and enforce the deadline"""
+
+        def wrapped(*args):
+            self.nfev += 1
+            self.check()
+            return func(*args)
+
+        return wrapped
+
+    def jacobian(self, func):
+        """Wrap a Jacobian function to count evaluations and enforce the deadline"""
+
+        def wrapped(*args):
+            self.njev += 1
+            self.check()
+            return func(*args)
+
+        return wrapped
+
+
+def estimate_initial_guess(concentration, response, mask):
+    """
+    Estimate 4PL starting parameters for every compound from the data itself. The plateaus are taken from the
+    highest and lowest responses, the ic50 is the log-interpolated concentration where the response crosses the
+    midpoint between the plateaus, and the hill slope is estimated from the steepest segment of the curve. A 4PL curve
+    has a slope of (maximum - minimum) * hill_slope * ln(10) / 4 against log10(concentration) at its midpoint.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses), sorted in ascending order within each row.
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+
+    :return: np.ndarray of shape (compounds, 4). Order is maximum, minimum, ic50, and hill_slope.
+    """
+    n_compounds = len(response)
+    if n_compounds == 0:
+        return np.zeros((0, 4))
+
+    maximum = np.max(np.where(mask, response, -np.inf), axis=1)
+    minimum = np.min(np.where(mask, response, np.inf), axis=1)
+    midpoint = 0.5 * (maximum + minimum)
+    span = maximum - minimum
+
+    with np.errstate(all="ignore"):
+        log_conc = np.where(mask & (concentration > 0), np.log10(concentration), np.nan)
+        y0, y1 = response[:, :-1], response[:, 1:]
+        x0, x1 = log_conc[:, :-1], log_conc[:, 1:]
+        valid = np.isfinite(x0) & np.isfinite(x1) & (x1 > x0) & mask[:, 1:]
+
+        # Log concentration where the response first crosses the midpoint
+        crosses = (
+            valid & ((y0 - midpoint[:, None]) * (y1 - midpoint[:, None]) <= 0) & (y1 != y0)
+        )
+        first = np.argmax(crosses, axis=1)
+        rows = np.arange(n_compounds)
+        log_ic50 = x0[rows, first] + (midpoint - y0[rows, first]) * (
+            x1[rows, first] - x0[rows, first]
+        ) / (y1[rows, first] - y0[rows, first])
+
+        # Without a crossing, use the tested concentration with the response nearest the midpoint
+        nearest = np.argmin(
+            np.where(np.isfinite(log_conc), np.abs(response - midpoint[:, None]), np.inf),
+            axis=1,
+        )
+        log_ic50 = np.where(crosses.any(axis=1), log_ic50, log_conc[rows, nearest])
+
+        steepest = np.max(
+            np.where(valid, np.abs((y1 - y0) / (x1 - x0)), 0.0), axis=1, initial=0.0
+        )
+        hill_slope = 4 * steepest / (span * np.log(10))
+
+    log_ic50 = np.where(np.isfinite(log_ic50), log_ic50, 0.0)
+    hill_slope = np.where(
+        np.isfinite(hill_slope) & (hill_slope > 0), np.clip(hill_slope, 0.1, 10), 1.0
+    )
+    return np.column_stack([maximum, minimum, 10**log_ic50, hill_slope])
+
+
+def inverse_fourpl(params, direction, target: float = 50, asymmetry=None):
+    """
+    Solve the 4PL (or 5PL) equation for the concentration that gives the target response. Used for the absolute IC50
+    (target of 50) or any other IC-X value. Works on a single set of parameters or on stacked parameters for many
+    compounds.
+
+    :param params: np.ndarray
+        Parameters of shape (4,) or (compounds, 4). Order is maximum, minimum, ic50, and hill_slope.
+    :param direction: int or np.ndarray
+        +1 for parameters fit with _fourpl or -1 for parameters fit with _reverse_fourpl.
+    :param target: float
+        Response value to solve for.
+    :param asymmetry: float or np.ndarray
+        Optional 5PL asymmetry parameter. If None, the 4PL equation is solved.
+
+    :return: Concentrations at the target response and a boolean mask that is False where the curve never reaches
+        the target. Those concentrations are NaN.
+    """
+    maximum, minimum, ic50, hill_slope = np.atleast_2d(params).astype(float).T
+    with np.errstate(all="ignore"):
+        if asymmetry is None:
+            ratio = (minimum - target) / (target - maximum)
+        else:
+            ratio = ((minimum - maximum) / (target - maximum)) ** (1 / asymmetry) - 1
+        concentration = ic50 * ratio ** (1 / (np.asarray(direction) * hill_slope))
+    reached = (ratio > 0) & (ic50 > 0) & np.isfinite(concentration)
+    return np.where(reached, concentration, np.nan), reached
+
+
+def logistic_midpoint(params, direction, asymmetry):
+    """
+    Concentration where the 5PL curve is halfway between its plateaus, which is the relative IC50. For an asymmetry of
+    1 this is the ic50 parameter itself.
+
+    :param params: np.ndarray
+        Parameters of shape (compounds, 4). Order is maximum, minimum, ic50, and hill_slope.
+    :param direction: np.ndarray
+        +1 or -1 for each compound.
+    :param asymmetry: np.ndarray
+        5PL asymmetry parameter of each compound.
+
+    :return: np.ndarray of concentrations
+    """
+    with np.errstate(all="ignore"):
+        return params[:, 2] * (2 ** (1 / asymmetry) - 1) ** (
+            1 / (np.asarray(direction) * params[:, 3])
+        )
+
+
+def fourpl_jacobian(concentration, params, direction):
+    """
+    Analytic Jacobian of the 4PL equation with respect to (maximum, minimum, ic50, hill_slope). Replaces finite
+    differences, which cost one extra model evaluation per parameter on every iteration.
+
+    Accepts a single curve (concentration of shape (doses,) and params of shape (4,)) or a batch of curves
+    (concentration of shape (compounds, doses) and params of shape (compounds, 4)).
+
+    :param concentration: np.ndarray
+        Concentrations.
+    :param params: np.ndarray
+        Parameters in the order maximum, minimum, ic50, and hill_slope.
+    :param direction: int or np.ndarray
+        +1 for _fourpl or -1 for _reverse_fourpl.
+
+    :return: np.ndarray of shape (doses, 4) or (compounds, doses, 4)
+    """
+    params = np.asarray(params, dtype=float)
+    if params.ndim == 1:
+        return fourpl_jacobian(
+            np.asarray(concentration, dtype=float)[None, :],
+            params[None, :],
+            np.atleast_1d(direction),
+        )[0]
+
+    maximum, minimum, ic50, hill_slope = (params[:, i, None] for i in range(4))
+    sign = np.asarray(direction, dtype=float)[:, None]
+    with np.errstate(all="ignore"):
+        # w = 1 / (1 + u) is bounded, which avoids overflow when u = (x / ic50) ** hill_slope is very large
+        w = 1 / (1 + (concentration / ic50) ** (sign * hill_slope))
+        slope = w * (1 - w)
+        d_ic50 = (minimum - maximum) * sign * hill_slope * slope / ic50
+        d_hill = -(minimum - maximum) * sign * np.log(concentration / ic50) * slope
+    # On either plateau the slope term is exactly 0, but log(0) would give 0 * inf
+    flat = slope == 0
+    d_ic50 = np.where(flat, 0.0, d_ic50)
+    d_hill = np.where(flat, 0.0, d_hill)
+    return np.stack([1 - w, w, d_ic50, d_hill], axis=-1)
+
+
+def fourpl_covariance(
+    concentration,
+    response,
+    mask,
+    params,
+    direction,
+    sigma=None,
+    fixed_hill=None,
+    free=None,
+):
+    """
+    Covariance matrices of fitted 4PL (or 5PL) parameters for every compound at once, the same way curve_fit computes
+    pcov: the inverse of J^T J at the fitted parameters, scaled by the residual variance. Needs one Jacobian evaluation
+    and no refit.
+
+    J^T J is scaled to unit diagonal before it is inverted. The condition number of this scaled matrix shows how well
+    the data pins down the parameters independent of their units. Large values (above about 1e6) mean some parameters
+    trade off against each other, for example when the curve has no lower plateau, and their errors are unreliable.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param params: np.ndarray
+        Fitted parameters of shape (compounds, 4) or (compounds, 5). Order is maximum, minimum, ic50, hill_slope, and
+        asymmetry.
+    :param direction: np.ndarray
+        +1 for _fourpl or -1 for _reverse_fourpl, one per compound.
+    :param sigma: np.ndarray
+        Optional padded standard errors of shape (compounds, doses) that the fit was weighted by.
+    :param fixed_hill: np.ndarray
+        Optional boolean mask of compounds fit with a fixed hill slope. Their hill slope variance is NaN.
+    :param free: np.ndarray
+        Optional boolean array with the shape of params marking the parameters that were fit. Fixed parameters, such
+        as the minimum of a 3PL fit, have NaN variance.
+
+    :return: Covariance matrices of shape (compounds, k, k) and condition numbers of shape (compounds,), where k is the
+        number of parameters. Both are NaN for compounds with NaN parameters or fewer data points than fitted
+        parameters.
+    """
+    n_compounds, n_params = params.shape
+    covariance = np.full((n_compounds, n_params, n_params), np.nan)
+    condition = np.full(n_compounds, np.nan)
+    free = np.ones(params.shape, dtype=bool) if free is None else free.copy()
+    if fixed_hill is not None:
+        free[fixed_hill, 3] = False
+    dof = mask.sum(axis=1) - free.sum(axis=1)
+    idx = np.flatnonzero(np.all(np.isfinite(params), axis=1) & (dof > 0))
+    if idx.size == 0:
+        return covariance, condition
+
+    mask, params, direction = mask[idx], params[idx], np.asarray(direction)[idx]
+    if n_params == 5:
+        model, model_jacobian = _fivepl_batch, fivepl_jacobian
+    else:
+        model, model_jacobian = _fourpl_batch, fourpl_jacobian
+    if sigma is None:
+        weight = mask.astype(float)
+    else:
+        weight = np.where(mask, 1.0 / np.where(mask, sigma[idx], 1.0), 0.0)
+    concentration = np.where(mask, concentration[idx], 1.0)
+    response = np.where(mask, response[idx], 0.0)
+
+    resid = np.where(
+        mask, (model(concentration, params, direction) - response) * weight, 0.0
+    )
+    variance = np.sum(resid**2, axis=1) / dof[idx]
+    jacobian = model_jacobian(concentration, params, direction)
+    jacobian[~mask] = 0.0
+    jacobian *= weight[:, :, None]
+    jtj = np.einsum("ndi,ndj->nij", jacobian, jacobian)
+
+    # A fixed parameter, such as a fixed hill slope, is replaced by an identity row and column
+    fixed = ~free[idx]
+    for j in range(n_params):
+        jtj[fixed[:, j], j, :] = 0.0
+        jtj[fixed[:, j], :, j] = 0.0
+        jtj[fixed[:, j], j, j] = 1.0
+
+    with np.errstate(all="ignore"):
+        scale = np.sqrt(np.diagonal(jtj, axis1=1, axis2=2))
+        scale = np.where(scale > 0, scale, 1.0)
+        scaled = jtj / (scale[:, :, None] * scale[:, None, :])
+        finite = np.all(np.isfinite(scaled), axis=(1, 2))
+        scaled[~finite] = np.eye(n_params)
+        singular_values = np.linalg.svd(scaled, compute_uv=False)
+        cond = singular_values[:, 0] / singular_values[:, -1]
+        inverse = np.linalg.pinv(scaled) / (scale[:, :, None] * scale[:, None, :])
+
+    inverse *= variance[:, None, None]
+    for j in range(n_params):
+        inverse[fixed[:, j], j, :] = np.nan
+        inverse[fixed[:, j], :, j] = np.nan
+    inverse[~finite] = np.nan
+    cond[~finite] = np.nan
+    covariance[idx] = inverse
+    condition[idx] = cond
+    return covariance, condition
+
+
+def fivepl_jacobian(concentration, params, direction):
+    """
+    Analytic Jacobian of the 5PL equation with respect to (maximum, minimum, ic50, hill_slope, asymmetry) for a batch
+    of curves. With an asymmetry of 1 the first four columns equal fourpl_jacobian().
+
+    :param concentration: np.ndarray
+        Concentrations of shape (compounds, doses).
+    :param params: np.ndarray
+        Parameters of shape (compounds, 5).
+    :param direction: np.ndarray
+        +1 or -1 for each compound.
+
+    :return: np.ndarray of shape (compounds, doses, 5)
+    """
+    maximum, minimum, ic50, hill_slope, asymmetry = (
+        params[:, i, None] for i in range(5)
+    )
+    sign = np.asarray(direction, dtype=float)[:, None]
+    with np.errstate(all="ignore"):
+        w = 1 / (1 + (concentration / ic50) ** (sign * hill_slope))
+        g = w**asymmetry
+        slope = asymmetry * g * (1 - w)
+        d_ic50 = (minimum - maximum) * sign * hill_slope * slope / ic50
+        d_hill = -(minimum - maximum) * sign * np.log(concentration / ic50) * slope
+        d_asymmetry = (minimum - maximum) * g * np.log(w)
+    flat = slope == 0
+    d_ic50 = np.where(flat, 0.0, d_ic50)
+    d_hill = np.where(flat, 0.0, d_hill)
+    d_asymmetry = np.where(g == 0, 0.0, d_asymmetry)
+    return np.stack([1 - g, g, d_ic50, d_hill, d_asymmetry], axis=-1)
+
+
+class BatchFit:
+    """
+    Results from batch_fit(). Each attribute holds one entry per compound.
+
+    :param params: np.ndarray
+        Fitted parameters of shape (compounds, 4).
+    :param converged: np.ndarray
+        Boolean mask of compounds that met the convergence criteria.
+    :param cost: np.ndarray
+        Final sum of squared residuals.
+    :param n_iter: np.ndarray
+        Number of Levenberg-Marquardt iterations used by each compound.
+    :param nfev: np.ndarray
+        Number of model evaluations used by each compound.
+    :param njev: np.ndarray
+        Number of Jacobian evaluations used by each compound.
+    """
+
+    def __init__(self, params, converged, cost, n_iter, nfev, njev):
+        self.params = params
+        self.converged = converged
+        self.cost = cost
+        self.n_iter = n_iter
+        self.nfev = nfev
+        self.njev = njev
+
+    def __len__(self):
+        return len(self.params)
+
+
+def batch_fit(
+    concentration,
+    response,
+    mask,
+    initial_guess,
+    direction,
+    max_iter: int = 200,
+    ftol: float = 1.5e-8,
+    xtol: float = 1.5e-8,
+    sigma=None,
+    free=None,
+    bounds=None,
+):
+    """
+    Fit the 4PL equation to every compound at once. Each compound keeps its own damping factor and is removed from the
+    active set as soon as it converges, so well-behaved compounds do not pay for difficult ones. Starting parameters
+    with five columns fit the 5PL equation instead. The ic50 and asymmetry of a 5PL fit must be positive.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param initial_guess: np.ndarray
+        Starting parameters of shape (compounds, 4) or (compounds, 5). Order is maximum, minimum, ic50, hill_slope,
+        and asymmetry.
+    :param direction: np.ndarray
+        +1 to fit with _fourpl or -1 to fit with _reverse_fourpl, one per compound.
+    :param max_iter: int
+        Maximum number of iterations for each compound.
+    :param ftol: float
+        Relative tolerance on the reduction of the sum of squares.
+    :param xtol: float
+        Relative tolerance on the size of the parameter step.
+    :param sigma: np.ndarray
+        Optional padded standard errors of shape (compounds, doses). Residuals are divided by sigma, as in
+        curve_fit(sigma=...). If None, every point has the same weight.
+    :param free: np.ndarray
+        Optional boolean array with the shape of initial_guess. Parameters marked False keep their starting value.
+    :param bounds: tuple
+        Optional (lower, upper) arrays with the shape of initial_guess. Every step is clipped to the bounds. Used for
+        the 5PL equation, where the ic50 and asymmetry can otherwise drift off together without changing the curve
+        much.
+
+    :return: BatchFit
+    """
+    if sigma is None:
+        weight = mask.astype(float)
+    else:
+        weight = np.where(mask, 1.0 / np.where(mask, sigma, 1.0), 0.0)
+    concentration = np.where(mask, concentration, 1.0)
+    response = np.where(mask, response, 0.0)
+    params = np.array(initial_guess, dtype=float, copy=True)
+    direction = np.asarray(direction, dtype=float)
+    n_compounds, n_params = params.shape
+    if n_params == 5:
+        # The ic50 and asymmetry are solved for on the log scale, which straightens the long curved valley where
+        # they trade off against each other and cuts the number of iterations
+        logged = [2, 4]
+
+        def model(concentration, p, direction):
+            p = p.copy()
+            p[:, logged] = np.exp(p[:, logged])
+            return _fivepl_batch(concentration, p, direction)
+
+        def model_jacobian(concentration, p, direction):
+            p = p.copy()
+            p[:, logged] = np.exp(p[:, logged])
+            jacobian = fivepl_jacobian(concentration, p, direction)
+            jacobian[:, :, logged] *= p[:, None, logged]
+            return jacobian
+
+        with np.errstate(all="ignore"):
+            params[:, logged] = np.log(params[:, logged])
+            if bounds is not None:
+                bounds = tuple(np.array(limit, dtype=float) for limit in bounds)
+                for limit in bounds:
+                    limit[:, logged] = np.log(np.maximum(limit[:, logged], 0.0))
+    else:
+        model, model_jacobian = _fourpl_batch, fourpl_jacobian
+
+    def residuals(idx, p):
+        model_y = model(concentration[idx], p, direction[idx])
+        return model_y, np.where(
+            mask[idx], (model_y - response[idx]) * weight[idx], 0.0
+        )
+
+    model_y, resid = residuals(slice(None), params)
+    cost = np.sum(resid**2, axis=1)
+
+    damping = np.full(n_compounds, 1e-3)
+    converged = np.zeros(n_compounds, dtype=bool)
+    active = np.isfinite(cost)
+    n_iter = np.zeros(n_compounds, dtype=int)
+    njev = np.zeros(n_compounds, dtype=int)
+
+    # Normal equations are only rebuilt for compounds whose last step was accepted
+    jtj = np.zeros((n_compounds, n_params, n_params))
+    jtr = np.zeros((n_compounds, n_params))
+    stale = active.copy()
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+
+        rebuild = idx[stale[idx]]
+        if rebuild.size > 0:
+            jacobian = model_jacobian(
+                concentration[rebuild], params[rebuild], direction[rebuild]
+            )
+            njev[rebuild] += 1
+            jacobian[~mask[rebuild]] = 0.0
+            if free is not None:
+                # A fixed parameter has no Jacobian column, so its step is always 0
+                jacobian *= free[rebuild][:, None, :]
+            jacobian *= weight[rebuild][:, :, None]
+            jtj[rebuild] = np.einsum("ndi,ndj->nij", jacobian, jacobian)
+            jtr[rebuild] = np.einsum("ndi,nd->ni", jacobian, resid[rebuild])
+            stale[rebuild] = False
+
+        # Marquardt scaling of the damping term by the diagonal of J^T J
+        diag = np.maximum(np.diagonal(jtj[idx], axis1=1, axis2=2), 1e-12)
+        lhs = jtj[idx] + damping[idx, None, None] * (
+            diag[:, :, None] * np.eye(n_params)
+        )
+        lhs = np.where(np.isfinite(lhs), lhs, 0.0)
+        rhs = np.where(np.isfinite(jtr[idx]), -jtr[idx], 0.0)
+        if bounds is not None:
+            # A parameter on a bound that the descent direction points past is left out of the step, so the other
+            # parameters are solved for as if it were fixed
+            at_lower = (params[idx] <= bounds[0][idx]) & (rhs < 0)
+            at_upper = (params[idx] >= bounds[1][idx]) & (rhs > 0)
+            pinned = at_lower | at_upper
+            keep = ~pinned
+            lhs = lhs * (keep[:, :, None] & keep[:, None, :])
+            lhs = lhs + pinned[:, :, None] * np.eye(n_params)
+            rhs = np.where(pinned, 0.0, rhs)
+        try:
+            step = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            step = np.stack(
+                [np.linalg.lstsq(a, b, rcond=None)[0] for a, b in zip(lhs, rhs)]
+            )
+
+        trial = params[idx] + step
+        if bounds is not None:
+            trial = np.clip(trial, bounds[0][idx], bounds[1][idx])
+            step = trial - params[idx]
+        trial_y, trial_resid = residuals(idx, trial)
+        trial_cost = np.sum(trial_resid**2, axis=1)
+        n_iter[idx] += 1
+
+        accepted = np.isfinite(trial_cost) & (trial_cost <= cost[idx])
+        small_cost = np.abs(cost[idx] - trial_cost) <= ftol * cost[idx]
+        small_step = np.all(
+            np.abs(step) <= xtol * (np.abs(params[idx]) + xtol), axis=1
+        )
+
+        ok = idx[accepted]
+        params[ok] = trial[accepted]
+        model_y[ok] = trial_y[accepted]
+        resid[ok] = trial_resid[accepted]
+        cost[ok] = trial_cost[accepted]
+        stale[ok] = True
+        damping[ok] = np.maximum(damping[ok] * 0.1, 1e-12)
+        damping[idx[~accepted]] *= 10.0
+
+        done = idx[accepted & (small_cost | small_step)]
+        converged[done] = True
+        active[done] = False
+        # A compound whose damping has blown up can no longer make progress
+        active[idx[damping[idx] > 1e16]] = False
+
+    if n_params == 5:
+        params[:, logged] = np.exp(params[:, logged])
+    # One evaluation for the starting point and one for each trial step
+    return BatchFit(params, converged, cost, n_iter, n_iter + 1, njev)
+
+
+def _keyed_uniform(seed, keys, *counters):
+    """
+    Uniform random numbers in [0, 1) from a counter-based hash (the SplitMix64 mixing function). Each value depends
+    only on the seed, its key, and its counters, so a compound keeps the same draws whatever other compounds are
+    drawn with it and however the draws are split into blocks.
+
+    :param seed: np.uint64
+        Seed of the draws.
+    :param keys: np.ndarray
+        uint64 key of every value, broadcast against the counters.
+    :param counters: np.ndarray
+        Integer positions, such as the resample and the dose, broadcast against the keys.
+
+    :return: np.ndarray of floats with the broadcast shape of the keys and counters
+    """
+
+    def mix(z):
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+    golden = np.uint64(0x9E3779B97F4A7C15)
+    # The hash relies on uint64 arithmetic wrapping around
+    with np.errstate(over="ignore"):
+        z = mix(np.asarray(keys, dtype=np.uint64) ^ seed)
+        for counter in counters:
+            z = mix(z + (np.asarray(counter, dtype=np.uint64) + np.uint64(1)) * golden)
+    return (z >> np.uint64(11)) * 2.0**-53
+
+
+def bootstrap_fit(
+    concentration,
+    response,
+    mask,
+    params,
+    direction,
+    n_boot: int,
+    resample: str = "residuals",
+    sigma=None,
+    wells=None,
+    seed=None,
+    max_iter: int = 200,
+    block_size: int = 50000,
+    free=None,
+    shared=None,
+    groups=None,
+    keys=None,
+):
+    """
+    Refit every compound to n_boot resampled copies of its data. All resampled curves are stacked and fit together
+    with batch_fit(), starting from the fitted parameters, so each refit usually needs only a few iterations.
+
+    With resample="residuals", the (standardized) residuals of each compound are drawn with replacement and added back
+    onto its fitted curve. The residuals are scaled by sqrt(n / (n - k)) to make up for the k fitted parameters.
+    With resample="replicates", the replicate wells of every dose are drawn with replacement and averaged again.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param params: np.ndarray
+        Fitted parameters of shape (compounds, 4) or (compounds, 5). Compounds with NaN parameters are not resampled.
+    :param direction: np.ndarray
+        +1 for _fourpl or -1 for _reverse_fourpl, one per compound.
+    :param n_boot: int
+        Number of resampled data sets for each compound.
+    :param resample: str
+        "residuals" or "replicates".
+    :param sigma: np.ndarray
+        Optional padded standard errors of shape (compounds, doses), used to weight the refits as in batch_fit().
+    :param wells: np.ndarray
+        Padded raw replicate responses of shape (compounds, doses, replicates), NaN where missing. Required for
+        resample="replicates".
+    :param seed: int
+        Seed for the random draws.
+    :param max_iter: int
+        Maximum number of iterations for each refit.
+    :param block_size: int
+        Largest number of curves fit in one batch_fit() call. Limits memory use for large data sets.
+    :param free: np.ndarray
+        Optional boolean array with the shape of params. Parameters marked False are held at their fitted value.
+    :param shared: list
+        Positions of parameters shared by each group, for parameters from global_fit(). Each resample is refit with
+        global_fit(), as its own set of groups.
+    :param groups: array-like
+        Group label of every compound for shared parameters. If None, all compounds form one group.
+    :param keys: np.ndarray
+        Integer key of every compound, such as GroupedData.content_hashes(). The draws of a compound depend only on
+        the seed and its key, so its resamples do not change when other compounds are added or left out. If None, the
+        position of each compound is its key.
+
+    :return: np.ndarray of shape (n_boot, compounds, k) for k parameters. Refits that do not converge or leave
+        logistic_bounds() are NaN.
+    """
+    if resample not in ("residuals", "replicates"):
+        raise ValueError("Resample must be 'residuals' or 'replicates'")
+    if resample == "replicates" and wells is None:
+        raise ValueError("Replicate resampling needs data with replicate wells")
+
+    seed = np.random.default_rng(seed).integers(2**64, dtype=np.uint64)
+    keys = np.arange(len(params)) if keys is None else np.asarray(keys)
+    n_params = params.shape[1]
+    boot = np.full((n_boot, len(params), n_params), np.nan)
+    fitted = np.flatnonzero(np.all(np.isfinite(params), axis=1))
+    if n_boot == 0 or fitted.size == 0:
+        return boot
+
+    concentration, response, mask = concentration[fitted], response[fitted], mask[fitted]
+    params, direction = params[fitted], np.asarray(direction)[fitted]
+    keys = keys[fitted].astype(np.uint64)
+    weighted = sigma is not None
+    sigma = sigma[fitted] if weighted else np.ones_like(response)
+    lower, upper = logistic_bounds(concentration, response, mask)
+    lower, upper = lower[:, :n_params], upper[:, :n_params]
+    free = np.ones(params.shape, dtype=bool) if free is None else free[fitted]
+    if shared is not None:
+        codes = np.zeros(len(fitted), dtype=int) if groups is None else groups[fitted]
+        codes = np.unique(codes, return_inverse=True)[1].ravel()
+    n_compounds, n_doses = response.shape
+
+    if resample == "residuals":
+        model = _fivepl_batch if n_params == 5 else _fourpl_batch
+        curve = model(np.where(mask, concentration, 1.0), params, direction)
+        n_points = mask.sum(axis=1)
+        n_free = free.sum(axis=1)
+        if shared is not None:
+            # Each compound uses its local parameters and a share of its group's shared parameters
+            group_size = np.bincount(codes)[codes]
+            n_free = 4 - len(shared) + len(shared) / group_size
+        with np.errstate(all="ignore"):
+            scale = np.where(
+                n_points > n_free, np.sqrt(n_points / (n_points - n_free)), 1.0
+            )
+        # Padded columns are on the right, so drawing positions below n_points only picks real residuals
+        standardized = np.where(mask, (response - curve) / sigma * scale[:, None], 0.0)
+    else:
+        wells = wells[fitted]
+        n_wells = np.sum(~np.isnan(wells), axis=2)
+        used = np.arange(wells.shape[2]) < n_wells[:, :, None]
+
+    per_block = max(1, block_size // n_compounds)
+    for start in range(0, n_boot, per_block):
+        size = min(per_block, n_boot - start)
+        if resample == "residuals":
+            uniform = _keyed_uniform(
+                seed,
+                keys[:, None],
+                np.arange(start, start + size)[:, None, None],
+                np.arange(n_doses),
+            )
+            draw = (uniform * n_points[:, None]).astype(int)
+            picked = np.take_along_axis(
+                np.broadcast_to(standardized, draw.shape), draw, axis=2
+            )
+            sample = curve + sigma * picked
+        else:
+            # One resample at a time keeps the (compounds x doses x replicates) draws small
+            sample = np.empty((size, n_compounds, n_doses))
+            for b in range(size):
+                uniform = _keyed_uniform(
+                    seed,
+                    keys[:, None, None],
+                    start + b,
+                    np.arange(n_doses)[:, None],
+                    np.arange(wells.shape[2]),
+                )
+                draw = (uniform * n_wells[:, :, None]).astype(int)
+                picked = np.take_along_axis(wells, draw, axis=2)
+                with np.errstate(all="ignore"):
+                    sample[b] = np.where(used, picked, 0.0).sum(axis=2) / n_wells
+
+        if shared is None:
+            fit = batch_fit(
+                np.tile(concentration, (size, 1)),
+                np.where(mask, sample, 0.0).reshape(-1, n_doses),
+                np.tile(mask, (size, 1)),
+                np.tile(params, (size, 1)),
+                np.tile(direction, size),
+                max_iter=max_iter,
+                sigma=np.tile(sigma, (size, 1)) if weighted else None,
+                free=np.tile(free, (size, 1)) if not free.all() else None,
+            )
+        else:
+            # Every resample gets its own copy of the groups
+            fit = global_fit(
+                np.tile(concentration, (size, 1)),
+                np.where(mask, sample, 0.0).reshape(-1, n_doses),
+                np.tile(mask, (size, 1)),
+                np.tile(params, (size, 1)),
+                np.tile(direction, size),
+                shared,
+                groups=np.tile(codes, size)
+                + np.repeat(np.arange(size), n_compounds) * (codes.max() + 1),
+                max_iter=max_iter,
+                sigma=np.tile(sigma, (size, 1)) if weighted else None,
+            )
+        valid = fit.converged & np.all(
+            (fit.params >= np.tile(lower, (size, 1)))
+            & (fit.params <= np.tile(upper, (size, 1)))
+            | ~np.tile(free, (size, 1)),
+            axis=1,
+        )
+        refit = np.where(valid[:, None], fit.params, np.nan)
+        boot[start : start + size, fitted] = refit.reshape(
+            size, n_compounds, n_params
+        )
+    return boot
+
+
+def fit_models(
+    concentration,
+    response,
+    mask,
+    params,
+    direction,
+    models=("4PL", "3PL", "5PL", "constant"),
+    criterion: str = "aic",
+    sigma=None,
+    max_iter: int = 200,
+):
+    """
+    Fit several models to every compound and pick the best one by information criterion. The 4PL fit is passed in, the
+    constant model (a flat line at the weighted mean response) has a closed form, and the 3PL and 5PL models are
+    stacked into a single batch_fit() call that starts from the 4PL parameters. The 3PL model is the 4PL equation with
+    the minimum fixed at 0. The 5PL model adds an asymmetry parameter, see _fivepl_batch().
+
+    Models are compared by the small-sample corrected AIC, n * ln(SSR / n) + 2k + 2k(k + 1) / (n - k - 1), or by the
+    BIC, n * ln(SSR / n) + k * ln(n), for n data points and k free parameters. A 3PL or 5PL model is only a candidate
+    if its fit converged strictly inside logistic_bounds(). A fit with a free parameter on a bound, such as a 5PL
+    maximum that runs into its bound on a curve without an effect, is rejected and not scored. The 4PL fit must lie
+    inside the bounds, but may sit on one: it comes from the fallback stages, whose "bounded" status flags it. If no
+    candidate can be scored, for example because there are too few data points, the first candidate in the order of
+    models is used.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param params: np.ndarray
+        Fitted 4PL parameters of shape (compounds, 4). NaN for compounds whose 4PL fit failed.
+    :param direction: np.ndarray
+        +1 for _fourpl or -1 for _reverse_fourpl, one per compound.
+    :param models: tuple
+        Names of the models to compare. See MODELS.
+    :param criterion: str
+        "aic" or "bic".
+    :param sigma: np.ndarray
+        Optional padded standard errors of shape (compounds, doses), used to weight the fits and the SSR.
+    :param max_iter: int
+        Maximum number of iterations for the 3PL and 5PL fits.
+
+    :return: Dictionary with the chosen "model" name of each compound, its "params" of shape (compounds, 5) in the order
+        maximum, minimum, ic50, hill_slope, and asymmetry, "valid" (False where no model could be fit, with NaN
+        params), the "scores" of every model in shape (compounds, models), and the "nfev" and "njev" of the refits.
+    """
+    models = tuple(models)
+    if not models or any(name not in MODELS for name in models):
+        raise ValueError(f"Models must be chosen from {', '.join(MODELS)}")
+    if criterion not in ("aic", "bic"):
+        raise ValueError("Criterion must be 'aic' or 'bic'")
+
+    n_compounds = len(params)
+    direction = np.asarray(direction, dtype=float)
+    if sigma is None:
+        weight = mask.astype(float)
+    else:
+        weight = np.where(mask, 1.0 / np.where(mask, sigma, 1.0), 0.0)
+    safe_conc = np.where(mask, concentration, 1.0)
+    safe_resp = np.where(mask, response, 0.0)
+    n_points = mask.sum(axis=1)
+    ones = np.ones((n_compounds, 1))
+    fitted = np.all(np.isfinite(params), axis=1)
+    nfev = np.zeros(n_compounds, dtype=int)
+    njev = np.zeros(n_compounds, dtype=int)
+
+    # Parameters and validity of every candidate model
+    lower, upper = logistic_bounds(concentration, response, mask)
+    candidates = {}
+    if "4PL" in models:
+        inside = np.all((params >= lower[:, :4]) & (params <= upper[:, :4]), axis=1)
+        candidates["4PL"] = (np.hstack([params, ones]), fitted & inside)
+    if "constant" in models:
+        with np.errstate(all="ignore"):
+            mean = np.sum(weight**2 * safe_resp, axis=1) / np.sum(weight**2, axis=1)
+        nan = np.full(n_compounds, np.nan)
+        candidates["constant"] = (
+            np.column_stack([mean, mean, nan, nan, nan]),
+            np.isfinite(mean),
+        )
+
+    refit = [name for name in ("3PL", "5PL") if name in models]
+    if refit and n_compounds > 0:
+        start = np.where(
+            fitted[:, None],
+            params,
+            estimate_initial_guess(concentration, response, mask),
+        )
+        start = np.hstack([start, ones])
+        starts, frees = [], []
+        for name in refit:
+            free = np.ones(start.shape, dtype=bool)
+            initial = start.copy()
+            if name == "3PL":
+                initial[:, 1] = 0.0
+                free[:, [1, 4]] = False
+            starts.append(initial)
+            frees.append(free)
+
+        copies = len(refit)
+        # Fixed parameters are not clipped, so a 3PL minimum of 0 stays at 0
+        free = np.vstack(frees)
+        fit = batch_fit(
+            np.tile(concentration, (copies, 1)),
+            np.tile(response, (copies, 1)),
+            np.tile(mask, (copies, 1)),
+            np.vstack(starts),
+            np.tile(direction, copies),
+            max_iter=max_iter,
+            sigma=None if sigma is None else np.tile(sigma, (copies, 1)),
+            free=free,
+            bounds=(
+                np.where(free, np.tile(lower, (copies, 1)), -np.inf),
+                np.where(free, np.tile(upper, (copies, 1)), np.inf),
+            ),
+        )
+        for j, name in enumerate(refit):
+            rows = slice(j * n_compounds, (j + 1) * n_compounds)
+            # The solver stops on a bound it runs into, so a parameter on a bound was not fitted. The ic50 and
+            # asymmetry are solved for on the log scale and land on their bounds up to rounding
+            fitted_params = fit.params[rows]
+            on_bound = np.isclose(fitted_params, lower, rtol=1e-9, atol=0) | np.isclose(
+                fitted_params, upper, rtol=1e-9, atol=0
+            )
+            inside = (fitted_params > lower) & (fitted_params < upper) & ~on_bound
+            valid = fit.converged[rows] & np.all(inside | ~frees[j], axis=1)
+            candidates[name] = (fitted_params, valid)
+            nfev += fit.nfev[rows]
+            njev += fit.njev[rows]
+
+    scores = np.full((n_compounds, len(models)), np.inf)
+    usable = np.zeros((n_compounds, len(models)), dtype=bool)
+    for j, name in enumerate(models):
+        candidate, valid = candidates[name]
+        k = MODELS[name]
+        if name == "constant":
+            curve = candidate[:, :1]
+        else:
+            curve = _fivepl_batch(safe_conc, candidate, direction)
+        ssr = np.sum(np.where(mask, ((curve - safe_resp) * weight) ** 2, 0.0), axis=1)
+        with np.errstate(all="ignore"):
+            # A perfect fit would give ln(0), so the SSR is floored at the smallest float
+            fit_term = n_points * np.log(
+                np.maximum(ssr, np.finfo(float).tiny) / n_points
+            )
+            if criterion == "aic":
+                score = fit_term + 2 * k + 2 * k * (k + 1) / (n_points - k - 1)
+                supported = n_points - k - 1 > 0
+            else:
+                score = fit_term + k * np.log(n_points)
+                supported = n_points > k
+        usable[:, j] = valid
+        scores[:, j] = np.where(valid & supported & np.isfinite(score), score, np.inf)
+
+    # Lowest score first, then the first usable model, then the first model with NaN params
+    best = np.argmin(scores, axis=1)
+    unscored = ~np.isfinite(scores).any(axis=1)
+    best[unscored] = np.argmax(usable[unscored], axis=1)
+    rows = np.arange(n_compounds)
+    valid = usable[rows, best]
+
+    chosen = np.empty((n_compounds, 5))
+    for j, name in enumerate(models):
+        chosen[best == j] = candidates[name][0][best == j]
+    chosen[~valid] = np.nan
+    return {
+        "model": np.asarray(models, dtype=object)[best],
+        "params": chosen,
+        "valid": valid,
+        "scores": scores,
+        "nfev": nfev,
+        "njev": njev,
+    }
+
+
+def _group_sum(values, codes, n_groups: int):
+    """Sum the rows of values that belong to each group. Rows with a non-finite value count as 0."""
+    flat = values.reshape(len(values), -1)
+    flat = np.where(np.isfinite(flat), flat, 0.0)
+    summed = np.stack(
+        [np.bincount(codes, flat[:, j], n_groups) for j in range(flat.shape[1])],
+        axis=-1,
+    )
+    return summed.reshape((n_groups,) + values.shape[1:])
+
+
+def _group_median(values, codes, n_groups: int):
+    """Median of the finite values of each group, or NaN for a group without finite values"""
+    finite = np.isfinite(values)
+    # Non-finite values are sorted to the end of their group and left out of the count
+    order = np.lexsort((np.where(finite, values, np.inf), codes))
+    count = np.bincount(codes, finite, n_groups).astype(int)
+    start = np.searchsorted(codes[order], np.arange(n_groups))
+    last = len(values) - 1
+    low = np.minimum(start + np.maximum(count - 1, 0) // 2, last)
+    high = np.minimum(start + count // 2, last)
+    sorted_values = values[order]
+    median = 0.5 * (sorted_values[low] + sorted_values[high])
+    return np.where(count > 0, median, np.nan)
+
+
+def _shared_positions(shared):
+    """Sorted shared and local parameter positions. Raise ValueError unless 1 to 3 parameters are shared."""
+    shared = sorted(set(int(j) for j in shared))
+    local = [j for j in range(4) if j not in shared]
+    if not shared or not local or shared[0] < 0 or shared[-1] > 3:
+        raise ValueError("Between one and three of the four parameters can be shared")
+    return shared, local
+
+
+def _global_normal_equations(jacobian, resid, shared, local):
+    """
+    Blocks of J^T J and J^T r for the local and shared parameters of every compound. A is (local x local), B is
+    (local x shared), and C is (shared x shared). Each compound only touches its own local parameters and the shared
+    parameters of its group, so these blocks are all there is of the (sparse) global J^T J.
+    """
+    local_jac, shared_jac = jacobian[:, :, local], jacobian[:, :, shared]
+    return (
+        np.einsum("ndi,ndj->nij", local_jac, local_jac),
+        np.einsum("ndi,ndj->nij", local_jac, shared_jac),
+        np.einsum("ndi,ndj->nij", shared_jac, shared_jac),
+        np.einsum("ndi,nd->ni", local_jac, resid),
+        np.einsum("ndi,nd->ni", shared_jac, resid),
+    )
+
+
+def _solve(lhs, rhs):
+    """Batched np.linalg.solve with a least-squares fallback for singular systems"""
+    try:
+        return np.linalg.solve(lhs, rhs)
+    except np.linalg.LinAlgError:
+        return np.stack([np.linalg.lstsq(a, b, rcond=None)[0] for a, b in zip(lhs, rhs)])
+
+
+def global_fit(
+    concentration,
+    response,
+    mask,
+    initial_guess,
+    direction,
+    shared,
+    groups=None,
+    max_iter: int = 200,
+    ftol: float = 1.5e-8,
+    xtol: float = 1.5e-8,
+    sigma=None,
+):
+    """
+    Fit the 4PL equation to every compound at once with some parameters shared by all compounds of a group, for
+    example a common hill slope or common plateaus. Every other parameter stays local to its compound.
+
+    The global J^T J is sparse: each compound only couples its own local parameters to the shared parameters of its
+    group. Each Levenberg-Marquardt step therefore eliminates the local parameters compound by compound and solves
+    the small Schur complement
+
+        S = C - sum(B_i^T A_i^-1 B_i)
+
+    for the shared parameters of each group, then recovers the local steps. Time and memory grow linearly with the
+    number of compounds, instead of the quadratic memory of a dense joint fit. Groups are independent fits with
+    their own damping factor, and a group is removed from the active set as soon as it converges.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param initial_guess: np.ndarray
+        Starting parameters of shape (compounds, 4). Order is maximum, minimum, ic50, and hill_slope. Shared
+        parameters start at the median of their group.
+    :param direction: np.ndarray
+        +1 to fit with _fourpl or -1 to fit with _reverse_fourpl, one per compound.
+    :param shared: list
+        Positions of the shared parameters, for example [3] for a common hill slope.
+    :param groups: array-like
+        Group label of every compound. If None, all compounds form one group.
+    :param max_iter: int
+        Maximum number of iterations for each group.
+    :param ftol: float
+        Relative change in the cost of a group below which it is considered converged.
+    :param xtol: float
+        Relative step size below which a group is considered converged.
+    :param sigma: np.ndarray
+        Optional padded standard errors of shape (compounds, doses), as in batch_fit().
+
+    :return: BatchFit. Convergence, iterations, and evaluations are those of each compound's group. cost is the sum
+        of squared residuals of each compound.
+    """
+    shared, local = _shared_positions(shared)
+    n_compounds = len(initial_guess)
+    if groups is None:
+        codes = np.zeros(n_compounds, dtype=int)
+    else:
+        codes = np.unique(np.asarray(groups), return_inverse=True)[1].ravel()
+    n_groups = int(codes.max()) + 1 if n_compounds > 0 else 0
+    n_shared = len(shared)
+
+    if sigma is None:
+        weight = mask.astype(float)
+    else:
+        weight = np.where(mask, 1.0 / np.where(mask, sigma, 1.0), 0.0)
+    concentration = np.where(mask, concentration, 1.0)
+    response = np.where(mask, response, 0.0)
+    direction = np.asarray(direction, dtype=float)
+    params = np.array(initial_guess, dtype=float, copy=True)
+    for j in shared:
+        params[:, j] = _group_median(params[:, j], codes, n_groups)[codes]
+
+    def residuals(rows, p):
+        model_y = _fourpl_batch(concentration[rows], p, direction[rows])
+        return np.where(mask[rows], (model_y - response[rows]) * weight[rows], 0.0)
+
+    resid = residuals(slice(None), params)
+    cost = np.sum(resid**2, axis=1)
+    group_cost = np.bincount(codes, cost, n_groups)
+
+    damping = np.full(n_groups, 1e-3)
+    converged = np.zeros(n_groups, dtype=bool)
+    active = np.isfinite(group_cost) & (np.bincount(codes, minlength=n_groups) > 0)
+    n_iter = np.zeros(n_groups, dtype=int)
+    njev = np.zeros(n_groups, dtype=int)
+
+    # Blocks of the normal equations are only rebuilt for groups whose last step was accepted
+    n_local = len(local)
+    a_block = np.zeros((n_compounds, n_local, n_local))
+    b_block = np.zeros((n_compounds, n_local, n_shared))
+    c_block = np.zeros((n_compounds, n_shared, n_shared))
+    local_grad = np.zeros((n_compounds, n_local))
+    shared_grad = np.zeros((n_compounds, n_shared))
+    stale = active.copy()
+
+    for _ in range(max_iter):
+        gidx = np.flatnonzero(active)
+        if gidx.size == 0:
+            break
+        rows = np.flatnonzero(active[codes])
+        row_codes = codes[rows]
+
+        rebuild = rows[stale[row_codes]]
+        if rebuild.size > 0:
+            jacobian = fourpl_jacobian(
+                concentration[rebuild], params[rebuild], direction[rebuild]
+            )
+            jacobian[~mask[rebuild]] = 0.0
+            jacobian *= weight[rebuild][:, :, None]
+            (
+                a_block[rebuild],
+                b_block[rebuild],
+                c_block[rebuild],
+                local_grad[rebuild],
+                shared_grad[rebuild],
+            ) = _global_normal_equations(jacobian, resid[rebuild], shared, local)
+            njev[stale & active] += 1
+            stale[:] = False
+
+        # Marquardt damping of the local blocks, then elimination of the local parameters
+        row_damping = damping[row_codes]
+        a_diag = np.maximum(np.diagonal(a_block[rows], axis1=1, axis2=2), 1e-12)
+        a_damped = a_block[rows] + row_damping[:, None, None] * (
+            a_diag[:, :, None] * np.eye(n_local)
+        )
+        a_damped = np.where(np.isfinite(a_damped), a_damped, 0.0)
+        eliminated = _solve(
+            a_damped,
+            np.concatenate([b_block[rows], local_grad[rows][:, :, None]], axis=2),
+        )
+        eliminated = np.where(np.isfinite(eliminated), eliminated, 0.0)
+        a_inv_b, a_inv_g = eliminated[:, :, :n_shared], eliminated[:, :, n_shared]
+
+        # Schur complement and right-hand side of the shared parameters of each group
+        c_group = _group_sum(c_block[rows], row_codes, n_groups)[gidx]
+        c_diag = np.maximum(np.diagonal(c_group, axis1=1, axis2=2), 1e-12)
+        schur = c_group + damping[gidx, None, None] * (
+            c_diag[:, :, None] * np.eye(n_shared)
+        )
+        schur -= _group_sum(
+            np.einsum("nki,nkj->nij", b_block[rows], a_inv_b), row_codes, n_groups
+        )[gidx]
+        rhs = _group_sum(
+            np.einsum("nki,nk->ni", b_block[rows], a_inv_g) - shared_grad[rows],
+            row_codes,
+            n_groups,
+        )[gidx]
+        shared_step = np.zeros((n_groups, n_shared))
+        shared_step[gidx] = _solve(schur, rhs[:, :, None])[:, :, 0]
+        row_shared_step = shared_step[row_codes]
+        local_step = -a_inv_g - np.einsum("nij,nj->ni", a_inv_b, row_shared_step)
+
+        step = np.zeros((len(rows), 4))
+        step[:, local] = local_step
+        step[:, shared] = row_shared_step
+        trial = params[rows] + step
+        trial_resid = residuals(rows, trial)
+        trial_cost = np.sum(trial_resid**2, axis=1)
+        group_trial = np.bincount(row_codes, trial_cost, n_groups)[gidx]
+        # A group with a non-finite compound cannot accept the step
+        finite = np.bincount(row_codes, ~np.isfinite(trial_cost), n_groups)[gidx] == 0
+        n_iter[gidx] += 1
+
+        accepted = finite & (group_trial <= group_cost[gidx])
+        small_cost = np.abs(group_cost[gidx] - group_trial) <= ftol * group_cost[gidx]
+        large = ~np.all(np.abs(step) <= xtol * (np.abs(params[rows]) + xtol), axis=1)
+        small_step = np.bincount(row_codes, large, n_groups)[gidx] == 0
+
+        ok = gidx[accepted]
+        ok_rows = np.isin(row_codes, ok)
+        params[rows[ok_rows]] = trial[ok_rows]
+        resid[rows[ok_rows]] = trial_resid[ok_rows]
+        cost[rows[ok_rows]] = trial_cost[ok_rows]
+        group_cost[ok] = group_trial[accepted]
+        stale[ok] = True
+        damping[ok] = np.maximum(damping[ok] * 0.1, 1e-12)
+        damping[gidx[~accepted]] *= 10.0
+
+        done = gidx[accepted & (small_cost | small_step)]
+        converged[done] = True
+        active[done] = False
+        active[gidx[damping[gidx] > 1e16]] = False
+
+    return BatchFit(
+        params,
+        converged[codes],
+        cost,
+        n_iter[codes],
+        n_iter[codes] + 1,
+        njev[codes],
+    )
+
+
+def global_covariance(
+    concentration,
+    response,
+    mask,
+    params,
+    direction,
+    shared,
+    groups=None,
+    sigma=None,
+):
+    """
+    Covariance matrices of the parameters of a global_fit(), from the same sparse blocks of J^T J. The shared
+    parameters have the covariance S^-1 of the group's Schur complement, and the local parameters of a compound add
+    the uncertainty of the shared parameters to their own, A^-1 + A^-1 B S^-1 B^T A^-1. Everything is scaled by the
+    residual variance of the group, with one degree of freedom used for every local parameter of every compound and
+    for every shared parameter.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses).
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses).
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param params: np.ndarray
+        Fitted parameters of shape (compounds, 4) from global_fit().
+    :param direction: np.ndarray
+        +1 for _fourpl or -1 for _reverse_fourpl, one per compound.
+    :param shared: list
+        Positions of the shared parameters.
+    :param groups: array-like
+        Group label of every compound. If None, all compounds form one group.
+    :param sigma: np.ndarray
+        Optional padded standard errors of shape (compounds, doses) that the fit was weighted by.
+
+    :return: Covariance matrices of shape (compounds, 4, 4) and condition numbers of shape (compounds,). The condition
+        number is that of each compound's correlation matrix. Both are NaN for compounds with NaN parameters or for
+        groups with fewer data points than fitted parameters.
+    """
+    shared, local = _shared_positions(shared)
+    n_compounds = len(params)
+    covariance = np.full((n_compounds, 4, 4), np.nan)
+    condition = np.full(n_compounds, np.nan)
+    if groups is None:
+        codes = np.zeros(n_compounds, dtype=int)
+    else:
+        codes = np.unique(np.asarray(groups), return_inverse=True)[1].ravel()
+    fitted = np.all(np.isfinite(params), axis=1)
+    if not fitted.any():
+        return covariance, condition
+
+    idx = np.flatnonzero(fitted)
+    codes = np.unique(codes[idx], return_inverse=True)[1].ravel()
+    n_groups = int(codes.max()) + 1
+    mask, params, direction = mask[idx], params[idx], np.asarray(direction)[idx]
+    if sigma is None:
+        weight = mask.astype(float)
+    else:
+        weight = np.where(mask, 1.0 / np.where(mask, sigma[idx], 1.0), 0.0)
+    concentration = np.where(mask, concentration[idx], 1.0)
+    response = np.where(mask, response[idx], 0.0)
+
+    resid = np.where(
+        mask, (_fourpl_batch(concentration, params, direction) - response) * weight, 0.0
+    )
+    jacobian = fourpl_jacobian(concentration, params, direction)
+    jacobian[~mask] = 0.0
+    jacobian *= weight[:, :, None]
+    a_block, b_block, c_block, _, _ = _global_normal_equations(
+        jacobian, resid, shared, local
+    )
+
+    with np.errstate(all="ignore"):
+        a_inv = np.linalg.pinv(a_block)
+        a_inv_b = a_inv @ b_block
+        schur = _group_sum(c_block, codes, n_groups) - _group_sum(
+            np.einsum("nki,nkj->nij", b_block, a_inv_b), codes, n_groups
+        )
+        schur_inv = np.linalg.pinv(schur)[codes]
+
+        dof = np.bincount(codes, mask.sum(axis=1), n_groups) - (
+            np.bincount(codes, minlength=n_groups) * len(local) + len(shared)
+        )
+        ssr = np.bincount(codes, np.sum(resid**2, axis=1), n_groups)
+        variance = np.where(dof > 0, ssr / dof, np.nan)[codes]
+
+        # Blocks are assembled in (local, shared) order and then put back in parameter order
+        cross = -a_inv_b @ schur_inv
+        local_cov = a_inv + a_inv_b @ schur_inv @ np.swapaxes(a_inv_b, 1, 2)
+        block = np.concatenate(
+            [
+                np.concatenate([local_cov, cross], axis=2),
+                np.concatenate([np.swapaxes(cross, 1, 2), schur_inv], axis=2),
+            ],
+            axis=1,
+        )
+        position = np.argsort(local + shared)
+        block = block[:, position][:, :, position] * variance[:, None, None]
+
+        scale = np.sqrt(np.diagonal(block, axis1=1, axis2=2))
+        correlation = block / (scale[:, :, None] * scale[:, None, :])
+        finite = np.all(np.isfinite(correlation), axis=(1, 2))
+        correlation[~finite] = np.eye(4)
+        singular_values = np.linalg.svd(correlation, compute_uv=False)
+        cond = singular_values[:, 0] / singular_values[:, -1]
+
+    block[~finite] = np.nan
+    cond[~finite] = np.nan
+    covariance[idx] = block
+    condition[idx] = cond
+    return covariance, condition
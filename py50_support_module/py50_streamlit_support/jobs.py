@@ -0,0 +1,169 @@
+"""
+Background fitting jobs. Calculator.submit() returns a FitJob that fits the drugs chunk by chunk on a worker thread, so
+the caller can show progress, read the rows finished so far, or cancel the job while it runs.
+"""
+
+import threading
+from concurrent.futures import CancelledError, TimeoutError
+from py50_streamlit_support.results import FitResults
+
+__all__ = ["FitJob"]
+
+
+class FitJob:
+    """
+    Handle for a calculation started with Calculator.submit(). Works like a concurrent.futures.Future, with progress
+    and partial results added. A job can be cancelled while chunks are left to start. The chunk that is already being
+    fit then finishes in the background, and its rows are added to partial() and its fits to the cache.
+
+    :param total: int
+        Number of drugs in the job.
+    :param callback: callable
+        Called as callback(completed, total) on the worker thread after every chunk.
+    """
+
+    def __init__(self, total: int, callback=None):
+        self.total = total
+        self.completed = 0
+        self.callback = callback
+        self._parts = []
+        self._build = self._to_pandas
+        self._result = None
+        self._exception = None
+        self._chunks = 0
+        self._started = 0
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        # Set when the worker finishes or the job is cancelled
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __repr__(self):
+        if self.cancelled():
+            state = "cancelled"
+        elif self.done():
+            state = "finished"
+        else:
+            state = "running"
+        return f"<FitJob {state} {self.completed}/{self.total}>"
+
+    def _start(self, chunks, fit_chunk, build=None):
+        """
+        Start the worker thread.
+
+        :param chunks: list
+            GroupedData chunks to fit in order.
+        :param fit_chunk: callable
+            Fits one chunk and returns its output rows as FitResults.
+        :param build: callable
+            Turns the list of FitResults into the output DataFrame. Default joins them with FitResults.concat().
+        """
+        if build is not None:
+            self._build = build
+        self._chunks = len(chunks)
+        self._thread = threading.Thread(
+            target=self._run, args=(chunks, fit_chunk), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, chunks, fit_chunk):
+        """Worker thread. Fits the chunks in order until done or cancelled"""
+        try:
+            for chunk in chunks:
+                # Checked under the lock, so cancel() only succeeds while a chunk is left to start
+                with self._lock:
+                    if self._cancel.is_set():
+                        return
+                    self._started += 1
+                values = fit_chunk(chunk)
+                with self._lock:
+                    self._parts.append(values)
+                    self.completed += len(chunk)
+                if self.callback is not None:
+                    self.callback(self.completed, self.total)
+            self._result = self.partial()
+        except Exception as error:
+            self._exception = error
+        finally:
+            self._finished.set()
+            self._done.set()
+
+    @staticmethod
+    def _to_pandas(parts):
+        """Default build. Joins the chunk results into one DataFrame"""
+        return FitResults.concat(parts).to_pandas()
+
+    @property
+    def progress(self):
+        """Fraction of drugs that have been fit"""
+        if self.total == 0:
+            return 1.0
+        return self.completed / self.total
+
+    def cancel(self):
+        """
+        Cancel the chunks that have not started. The job is done and cancelled as soon as this returns True.
+
+        :return: False if every chunk had already started, otherwise True
+        """
+        with self._lock:
+            if self._cancel.is_set():
+                return True
+            if self._finished.is_set() or self._started == self._chunks:
+                return False
+            self._cancel.set()
+        self._done.set()
+        return True
+
+    def cancelled(self):
+        """True if cancel() stopped the job"""
+        return self._cancel.is_set()
+
+    def running(self):
+        """True until the job finishes, fails, or is cancelled"""
+        return not self._done.is_set()
+
+    def done(self):
+        """True if the job finished, failed, or was cancelled"""
+        return self._done.is_set()
+
+    def partial(self):
+        """
+        Output rows of the drugs finished so far. Safe to call while the job is running.
+
+        :return: DataFrame in the same format as the final result
+        """
+        with self._lock:
+            parts = list(self._parts)
+        return self._build(parts)
+
+    def result(self, timeout: float = None):
+        """
+        Wait for the job and return the output DataFrame.
+
+        :param timeout: float
+            Seconds to wait. If None, wait until the job is done.
+
+        :return: DataFrame
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Fit job did not finish in time")
+        if self._cancel.is_set():
+            raise CancelledError("Fit job was cancelled")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout: float = None):
+        """
+        Wait for the job and return the exception raised while fitting, or None.
+
+        :param timeout: float
+            Seconds to wait. If None, wait until the job is done.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Fit job did not finish in time")
+        if self._cancel.is_set():
+            raise CancelledError("Fit job was cancelled")
+        return self._exception
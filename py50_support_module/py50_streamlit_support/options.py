@@ -0,0 +1,193 @@
+"""
+Fitting options of the Calculator. calculate_ic50(), calculate_absolute_ic50(), calculate_pic50(), submit(), and
+stream_csv() take them as keyword arguments. They are documented and checked here, so every method accepts the same
+options and rejects the ones it cannot use.
+"""
+
+from py50_streamlit_support.fitting import MODELS
+
+__all__ = ["FitOptions"]
+
+# Parameter names of the 4PL model, in the order of the fitted parameter arrays
+_PARAMETERS = ("maximum", "minimum", "ic50", "hill_slope")
+
+
+def _is_default(value, default):
+    """True if value is the default. Values of another type, such as a DataFrame for prior, are never the default"""
+    return value is default or (type(value) is type(default) and value == default)
+
+
+class FitOptions:
+    """
+    Checked fitting options. Raises TypeError for an unknown option and ValueError for an invalid value.
+
+    :param batch: bool
+        Fit all compounds at once with the vectorized solver instead of one curve_fit call per compound.
+    :param n_jobs: int
+        Number of worker processes to fit compounds in parallel. Use -1 for all available cores.
+    :param executor: concurrent.futures.Executor
+        Optional executor for parallel fitting. Takes priority over n_jobs.
+    :param max_nfev: int
+        Maximum number of model evaluations for each fitting stage of a drug. Default is 1000.
+    :param time_budget: float
+        Seconds allowed for fitting each drug. If None, only max_nfev limits the fit.
+    :param standard_errors: bool
+        Add the standard error and 95% Wald confidence interval of every parameter, and the condition number of the
+        fit. Computed from the covariance matrix of each fit, so no extra fitting is needed. See
+        Calculator._parameter_errors().
+    :param bootstrap: int
+        Number of bootstrap resamples for each drug. If given, percentile confidence intervals are added for the
+        relative IC50, the absolute IC50, and the hill slope. See fitting.bootstrap_fit().
+    :param resample: str
+        "residuals" to resample the residuals of each fitted curve, or "replicates" to resample the replicate wells of
+        each concentration. Default is "residuals".
+    :param confidence: float
+        Confidence level of the bootstrap intervals. Default is 0.95.
+    :param seed: int
+        Seed for the bootstrap resampling, for reproducible intervals. The resamples of a drug depend only on the seed
+        and the drug's data, so its intervals do not change when other drugs are added or removed.
+    :param model: str
+        "4PL", "3PL" (minimum fixed at 0), "5PL" (asymmetric curve), "constant" (inactive drug), or "auto" to fit all
+        of them and keep the best model of each drug by criterion. See fitting.fit_models(). Default is "4PL".
+    :param criterion: str
+        "aic" or "bic". Used to choose the model when model="auto".
+    :param shared: list
+        Parameters to share across drugs in a global fit, for example ["hill_slope"] for a common hill slope or
+        ["maximum", "minimum"] for common plateaus. Names are "maximum", "minimum", "ic50", and "hill_slope". The other
+        parameters are fit for each drug. See fitting.global_fit(). Only for the 4PL model.
+    :param group_col: str
+        Optional column with a group label for every drug, such as the plate. Shared parameters are shared within each
+        group. If None, they are shared by all drugs.
+    :param prescreen: bool or dict
+        Classify every drug as "inactive", "partial", or "full" before fitting with fitting.screen_activity(), and only
+        fit the active drugs. Inactive drugs get the mean response as maximum and minimum, NaN for the ic50 and hill
+        slope, and an "inactive" fit status. Adds an "activity" column. A dict is passed on to screen_activity() as
+        thresholds.
+    :param drop_outliers: bool or dict
+        Drop replicate outliers and single-point spikes found by qc.outlier_mask() before fitting. The dropped points
+        are listed in Calculator.dropped_points. A dict is passed on to outlier_mask() as thresholds.
+    :param prior: pd.DataFrame
+        Earlier results of the same drugs to start the fits from, such as the output of a previous calculation or
+        FitResultStore.latest(). Drugs found in the table are fit starting from their earlier maximum, minimum, relative
+        IC50, and hill slope instead of the estimate from the data, which takes fewer iterations when a drug is tested
+        again. Other drugs start from the data as usual. Calculator.fit_stats counts the warm started drugs under
+        "warm_starts" and their model evaluations under "warm_nfev". A FitResults object or a pyarrow Table is also
+        accepted.
+    :param compare_cold: bool
+        Also fit the warm started drugs from the data as usual, to measure what the warm start saves.
+        Calculator.fit_stats then reports the evaluations of the cold fits under "cold_nfev" and the difference to
+        "warm_nfev" under "saved_nfev". The results and the fit cache only use the warm fits. Doubles the fitting work
+        of the warm started drugs, so it is meant for benchmarks.
+    :param store: FitResultStore
+        Optional SQLite store. Drugs missing from the fit cache are looked up in the store by content hash before
+        fitting, new fits are saved to it, and the output rows are saved as a new run. See store.FitResultStore.
+    """
+
+    DEFAULTS = {
+        "batch": False,
+        "n_jobs": None,
+        "executor": None,
+        "max_nfev": 1000,
+        "time_budget": None,
+        "standard_errors": False,
+        "bootstrap": None,
+        "resample": "residuals",
+        "confidence": 0.95,
+        "seed": None,
+        "model": "4PL",
+        "criterion": "aic",
+        "shared": None,
+        "group_col": None,
+        "prescreen": False,
+        "drop_outliers": False,
+        "prior": None,
+        "compare_cold": False,
+        "store": None,
+    }
+    # Options of the absolute IC50 and pIC50 only. The relative IC50 has no bootstrap intervals or store runs
+    ABSOLUTE = ("bootstrap", "resample", "confidence", "seed", "store")
+    # Options that submit() and stream_csv() cannot split into chunks. Shared parameters tie drugs in different chunks
+    # together, and a store would save every chunk as its own run
+    CHUNKED = ("shared", "group_col", "store")
+
+    def __init__(self, **options):
+        unknown = sorted(set(options) - set(self.DEFAULTS))
+        if unknown:
+            raise TypeError(f"Unknown fit option(s): {', '.join(unknown)}")
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, options.get(name, default))
+
+        if self.model != "auto" and self.model not in MODELS:
+            raise ValueError(
+                "Model must be '4PL', '3PL', '5PL', 'constant', or 'auto'"
+            )
+        if self.criterion not in ("aic", "bic"):
+            raise ValueError("Criterion must be 'aic' or 'bic'")
+        if self.shared_positions(self.shared) and self.model != "4PL":
+            raise ValueError("Shared parameters are only available for the 4PL model")
+        if self.bootstrap is not None and self.bootstrap < 1:
+            raise ValueError("Bootstrap must be a positive number of resamples")
+        if self.resample not in ("residuals", "replicates"):
+            raise ValueError("Resample must be 'residuals' or 'replicates'")
+        if not 0 < self.confidence < 1:
+            raise ValueError("Confidence must be between 0 and 1")
+
+    def __repr__(self):
+        changed = [
+            f"{name}={getattr(self, name)!r}"
+            for name, default in self.DEFAULTS.items()
+            if not _is_default(getattr(self, name), default)
+        ]
+        return f"FitOptions({', '.join(changed)})"
+
+    def as_dict(self):
+        """Every option and its value"""
+        return {name: getattr(self, name) for name in self.DEFAULTS}
+
+    def check(self, calculation: str, method: str, unsupported: tuple = ()):
+        """
+        Raise ValueError for an unknown calculation, or for options that the calculation or the calling method does not
+        support. An option left at its default is always accepted.
+
+        :param calculation: str
+            "relative", "absolute", or "pic50".
+        :param method: str
+            Name of the calling method for the error message, for example "submit()".
+        :param unsupported: tuple
+            Further option names the method does not support, such as FitOptions.CHUNKED.
+        """
+        if calculation not in ("relative", "absolute", "pic50"):
+            raise ValueError("Calculation must be 'relative', 'absolute', or 'pic50'")
+        names = tuple(unsupported)
+        if calculation == "relative":
+            names += self.ABSOLUTE
+        used = [
+            name
+            for name in self.DEFAULTS
+            if name in names
+            and not _is_default(getattr(self, name), self.DEFAULTS[name])
+        ]
+        if used:
+            raise ValueError(f"{method} does not support {', '.join(used)}")
+
+    @staticmethod
+    def shared_positions(shared: list = None):
+        """
+        Raise ValueError for unknown shared parameter names, or if every parameter is shared.
+
+        :param shared: str or list
+            Names of the shared parameters.
+
+        :return: Positions of the shared parameters in the order maximum, minimum, ic50, and hill_slope
+        """
+        if not shared:
+            return []
+        if isinstance(shared, str):
+            shared = [shared]
+        if any(name not in _PARAMETERS for name in shared):
+            raise ValueError(
+                "Shared parameters must be 'maximum', 'minimum', 'ic50', or 'hill_slope'"
+            )
+        if len(set(shared)) == len(_PARAMETERS):
+            raise ValueError("At least one parameter must be fit for each drug")
+        return [_PARAMETERS.index(name) for name in shared]
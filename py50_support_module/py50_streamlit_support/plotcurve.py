@@ -5,14 +5,56 @@ import itertools
 from scipy.interpolate import interp1d
 from py50_streamlit_support.plot_settings import CBMARKERS, CBPALETTE, CurveSettings
 from py50_streamlit_support.calculator import Calculator
+from py50_streamlit_support.cache import FitCache
+from py50_streamlit_support.dataset import as_dataframe, read_parquet
 
 __all__ = ["PlotCurve"]
 
 
 class PlotCurve:
-    # Will accept input DataFrame and output said DataFrame for double checking.
-    def __init__(self, data):
-        self.data = data
+    # Will accept input DataFrame and output said DataFrame for double checking. pyarrow Tables are converted to a
+    # DataFrame.
+    # Curve fits are stored in the cache so that replotting the same data does not refit.
+    def __init__(self, data, cache: FitCache = None):
+        self.data = as_dataframe(data)
+        self.cache = cache if cache is not None else FitCache()
+
+    @classmethod
+    def from_parquet(
+        cls,
+        path,
+        name_col: str = None,
+        concentration_col: str = None,
+        response_col: str = None,
+        names=None,
+        cache: FitCache = None,
+        **kwargs,
+    ):
+        """
+        Build a PlotCurve from a Parquet file. Only the name, concentration, and response columns are read, and with
+        names only the rows of the drugs to plot. See dataset.read_parquet(). Requires pyarrow.
+
+        :param path: str or file-like
+            Parquet file, or a folder of Parquet files.
+        :param name_col: str
+            Name column from the file.
+        :param concentration_col: str
+            Concentration column from the file.
+        :param response_col: str or list
+            Response column from the file.
+        :param names: list
+            Optional drug names to read. If None, every drug is read.
+        :param cache: FitCache
+            Optional fit cache to share with Calculator or other PlotCurve objects.
+        :param kwargs:
+            Passed on to pyarrow.parquet.read_table().
+
+        :return: PlotCurve
+        """
+        data = read_parquet(
+            path, name_col, concentration_col, response_col, names=names, **kwargs
+        )
+        return cls(data, cache=cache)
 
     def show(self, rows: int = None):
         """
@@ -156,7 +198,6 @@ class PlotCurve:
         :return: Figure
         """
 
-        global x_fit, drug_query, y_intersection, x_intersection, reverse
         if drug_name is not None:
             drug_query = self._filter_dataframe(drug_name=drug_name)
             if len(drug_query) > 0:
@@ -170,20 +211,8 @@ class PlotCurve:
         concentration = drug_query[concentration_col]
         response = drug_query[response_col]
 
-        # Set initial guess for 4PL equation
-        initial_guess = [
-            max(response),
-            min(response),
-            0.5 * (max(response) + min(response)),
-            1.0,
-        ]  # Max, Min, ic50, and hill_slope
-
         # Initialize in Calculator class for calculating results for plotting
-        calculator = Calculator(drug_query)
-
-        # set a new coy of the DataFrame to avoid warnings
-        query = drug_query.copy()
-        query.sort_values(by=concentration_col, ascending=True, inplace=True)
+        calculator = Calculator(drug_query, cache=self.cache)
 
         """
         x_fit and concentration adjustments mut come before the calc_logic or curve and datapoints will not bre aligned
@@ -199,13 +228,7 @@ class PlotCurve:
             xscale_unit, concentration, verbose=verbose
         )
 
-        reverse, params, covariance = calculator._calc_logic(
-            data=query,
-            concentration=concentration,
-            response_col=response_col,
-            initial_guess=initial_guess,
-            response=response,
-        )
+        reverse, params = calculator._fit_curve(concentration, response)
         # Extract parameter values
         maximum, minimum, ic50, hill_slope = params
         # print(drug_name, ' IC50: ', ic50, 'µM') # For checking
@@ -272,6 +295,7 @@ class PlotCurve:
 
         # Plot box to IC50 on curve
         # Interpolate to find the x-value (Concentration) at the intersection point
+        y_intersection = None
         if box_intercept is None:
             print("Input Inhibition % target")
         elif box_intercept and conc_target is None and reverse == 1:
@@ -438,7 +462,6 @@ class PlotCurve:
 
         :return: Figure
         """
-        global response, x_fit, y_fit, y_intersection, x_intersection, reverse, params
         name_list = np.unique(self.data[name_col])
 
         concentration_list = []
@@ -452,20 +475,8 @@ class PlotCurve:
             concentration = drug_query[concentration_col]
             response = drug_query[response_col]
 
-            # Set initial guess for 4PL equation
-            initial_guess = [
-                max(response),
-                min(response),
-                1.0,
-                1.0,
-            ]  # Max, Min, ic50, and hill_slope
-
             # Initialize in Calculator class for calculating results for plotting
-            calculator = Calculator(drug_query)
-
-            # set a new coy of the DataFrame to avoid warnings
-            query = drug_query.copy()
-            query.sort_values(by=concentration_col, ascending=True, inplace=True)
+            calculator = Calculator(drug_query, cache=self.cache)
 
             """
             x_fit and concentration adjustments must come before the calc_logic or curve and datapoints will 
@@ -482,13 +493,7 @@ class PlotCurve:
                 xscale_unit, concentration, verbose=verbose
             )
 
-            reverse, params, covariance = calculator._calc_logic(
-                data=query,
-                concentration=concentration,
-                response_col=response_col,
-                initial_guess=initial_guess,
-                response=response,
-            )
+            reverse, params = calculator._fit_curve(concentration, response)
             # Extract parameter values
             maximum, minimum, ic50, hill_slope = params
             # print(drug, ' IC50: ', ic50, 'nM') # For checking
@@ -817,7 +822,6 @@ class PlotCurve:
         :return: Figure
         """
 
-        global x_fit, reverse, params, response, concentration
         name_list = np.unique(self.data[name_col])
 
         # Generate lists for modifying plots (vline, box, etc)
@@ -833,20 +837,8 @@ class PlotCurve:
             concentration = drug_query[concentration_col]
             response = drug_query[response_col]
 
-            # Set initial guess for 4PL equation
-            initial_guess = [
-                max(response),
-                min(response),
-                1.0,
-                1.0,
-            ]  # Max, Min, ic50, and hill_slope
-
             # Initialize in Calculator class for calculating results for plotting
-            calculator = Calculator(drug_query)
-
-            # set a new coy of the DataFrame to avoid warnings
-            query = drug_query.copy()
-            query.sort_values(by=concentration_col, ascending=True, inplace=True)
+            calculator = Calculator(drug_query, cache=self.cache)
 
             """
             x_fit and concentration adjustments must come before the calc_logic or curve and datapoints will 
@@ -864,13 +856,7 @@ class PlotCurve:
                 xscale_unit, concentration, verbose=verbose
             )
 
-            reverse, params, covariance = calculator._calc_logic(
-                data=query,
-                concentration=concentration,
-                response_col=response_col,
-                initial_guess=initial_guess,
-                response=response,
-            )
+            reverse, params = calculator._fit_curve(concentration, response)
             # Extract parameter values
             maximum, minimum, ic50, hill_slope = params
             # print(drug, ' IC50: ', ic50, 'nM') # For checking
@@ -0,0 +1,231 @@
+"""
+Quality control of dose-response data before fitting. Every check works on the padded (compounds x doses) arrays of
+GroupedData, so all compounds are screened at once without a Python loop over compounds. normalize_plates() turns raw
+plate signals into percent inhibition with one grouped pass over all plates.
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+
+__all__ = ["normalize_plates", "outlier_mask"]
+
+
+def normalize_plates(plate, signal, positive, negative):
+    """
+    Normalize raw plate signals to percent inhibition with the control wells of each plate, and score every plate
+    with its Z'-factor and signal window. All plates are handled at once with np.bincount over the plate codes.
+
+    Percent inhibition is 100 * (negative mean - signal) / (negative mean - positive mean), so the negative controls
+    (no inhibition) are at 0% and the positive controls (full inhibition) at 100%, whichever of the two gives the
+    higher signal. With the control means and standard deviations of a plate:
+
+    - Z' = 1 - 3 * (positive sd + negative sd) / |positive mean - negative mean|. Plates with Z' of 0.5 or more are
+      usually accepted.
+    - signal window = (|positive mean - negative mean| - 3 * (positive sd + negative sd)) / sd of the control with
+      the higher mean. A signal window of 2 or more is usually accepted.
+
+    :param plate: array-like
+        Plate label of every well.
+    :param signal: array-like
+        Raw signal of every well.
+    :param positive: array-like
+        Boolean array, True for the positive (full inhibition) control wells.
+    :param negative: array-like
+        Boolean array, True for the negative (no inhibition) control wells.
+
+    :return: Tuple of the percent inhibition of every well and a dictionary of per-plate arrays. Keys are "plate"
+        (plate labels, in order of first appearance), "positive mean", "positive sd", "negative mean", "negative sd",
+        "z_prime", and "signal window". Plates without two wells of each control get NaN.
+    """
+    signal = np.asarray(signal, dtype=float)
+    positive = np.asarray(positive, dtype=bool)
+    negative = np.asarray(negative, dtype=bool)
+    if not len(signal) == len(positive) == len(negative) == len(plate):
+        raise ValueError("plate, signal, positive, and negative must have the same length")
+    if (positive & negative).any():
+        raise ValueError("A well cannot be both a positive and a negative control")
+
+    codes, labels = pd.factorize(np.asarray(plate))
+    if (codes < 0).any():
+        raise ValueError("Plate labels must not be missing")
+    n_plates = len(labels)
+
+    def control_stats(control):
+        # Two passes over the wells, so large signals do not lose precision in the variance
+        count = np.bincount(codes, control, n_plates)
+        with np.errstate(all="ignore"):
+            mean = np.bincount(codes, np.where(control, signal, 0.0), n_plates) / count
+            squares = np.where(control, (signal - mean[codes]) ** 2, 0.0)
+            sd = np.sqrt(np.bincount(codes, squares, n_plates) / (count - 1))
+        return mean, np.where(count > 1, sd, np.nan)
+
+    positive_mean, positive_sd = control_stats(positive)
+    negative_mean, negative_sd = control_stats(negative)
+
+    with np.errstate(all="ignore"):
+        inhibition = (
+            100
+            * (negative_mean[codes] - signal)
+            / (negative_mean - positive_mean)[codes]
+        )
+        separation = np.abs(positive_mean - negative_mean)
+        spread = 3 * (positive_sd + negative_sd)
+        z_prime = 1 - spread / separation
+        high_sd = np.where(positive_mean > negative_mean, positive_sd, negative_sd)
+        signal_window = (separation - spread) / high_sd
+
+    stats = {
+        "plate": np.asarray(labels),
+        "positive mean": positive_mean,
+        "positive sd": positive_sd,
+        "negative mean": negative_mean,
+        "negative sd": negative_sd,
+        "z_prime": z_prime,
+        "signal window": signal_window,
+    }
+    return inhibition, stats
+
+
+def outlier_mask(
+    concentration,
+    response,
+    mask,
+    wells=None,
+    mad_threshold: float = 3.5,
+    spike_threshold: float = 4.0,
+    min_replicates: int = 3,
+):
+    """
+    Flag replicate outliers and single-point spikes in every compound.
+
+    1. Replicate outliers: at every dose with at least min_replicates wells, every well is compared with the median
+       of the other wells of the dose. The spread of these differences is estimated once for the whole compound
+       from their median absolute value (MAD / 0.6745), because the MAD of a handful of replicates is too unstable
+       on its own. The well furthest from the others is an outlier if its difference is more than mad_threshold
+       times this spread. Only one well is flagged per dose.
+    2. Spikes: the dose means, without the replicate outliers, should follow a monotone curve. A dose lies outside
+       the monotone envelope of its neighbours if it is above both or below both. The dose that lies furthest outside
+       is a candidate if that distance is more than spike_threshold times the noise of the compound. The noise is
+       estimated from the median distance of every dose to the mean of its neighbours, and is at least 1% of the
+       response span. The candidate is only flagged if the other doses follow a monotone curve: their isotonic
+       regression, rising or falling, must be within spike_threshold times the noise of every dose mean. A genuine
+       bell-shaped or otherwise non-monotone curve is therefore left alone. Only one spike is flagged per compound,
+       the first and last doses are never flagged, and at least four doses are always kept for the fit.
+
+    :param concentration: np.ndarray
+        Padded concentrations of shape (compounds, doses), sorted in ascending order within each row.
+    :param response: np.ndarray
+        Padded responses of shape (compounds, doses). Replicate means if the data has replicates.
+    :param mask: np.ndarray
+        Boolean array of shape (compounds, doses) marking the real (non-padded) data points.
+    :param wells: np.ndarray
+        Optional raw replicate responses of shape (compounds, doses, replicates), padded with NaN. See
+        GroupedData.padded_wells(). Without wells only the spike check is done.
+    :param mad_threshold: float
+        Distance from the dose median, in robust standard deviations, that makes a well an outlier.
+    :param spike_threshold: float
+        Distance outside the neighbour envelope, in units of the compound noise, that makes a dose a spike.
+    :param min_replicates: int
+        Fewest wells at a dose for the replicate check.
+
+    :return: Dictionary with "spikes", a boolean array of shape (compounds, doses), and "wells", a boolean array of
+        shape (compounds, doses, replicates) or None without wells. True marks a point to drop.
+    """
+    n_compounds, n_doses = response.shape
+    outliers = None
+    means = np.where(mask, response, np.nan)
+
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        # nanmedian and nanmean warn about padded doses and compounds with no usable doses
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        if wells is not None:
+            n_wells = wells.shape[2]
+            present = ~np.isnan(wells)
+            tested = present & (present.sum(axis=2) >= min_replicates)[..., None]
+
+            # Median of the other wells, with each well hidden in turn on a diagonal of NaN
+            others = np.repeat(wells[..., None, :], n_wells, axis=-2)
+            others[..., np.arange(n_wells), np.arange(n_wells)] = np.nan
+            deviation = np.where(
+                tested, np.abs(wells - np.nanmedian(others, axis=-1)), np.nan
+            )
+            spread = np.nanmedian(deviation.reshape(n_compounds, -1), axis=1) / 0.6745
+
+            worst = np.argmax(np.where(tested, deviation, -np.inf), axis=2)
+            outliers = np.zeros(wells.shape, dtype=bool)
+            np.put_along_axis(outliers, worst[..., None], True, axis=2)
+            outliers &= tested & (deviation > mad_threshold * spread[:, None, None])
+            kept = np.where(outliers, np.nan, wells)
+            means = np.where(mask, np.nanmean(kept, axis=2), np.nan)
+
+        spikes = np.zeros((n_compounds, n_doses), dtype=bool)
+        if n_doses >= 3:
+            left, middle, right = means[:, :-2], means[:, 1:-1], means[:, 2:]
+            interior = mask[:, :-2] & mask[:, 1:-1] & mask[:, 2:]
+            outside = np.maximum(
+                middle - np.fmax(left, right), np.fmin(left, right) - middle
+            )
+            outside = np.where(interior, outside, -np.inf)
+
+            # Var(y - mean of two neighbours) is 1.5 times the noise variance
+            residual = np.where(interior, np.abs(middle - 0.5 * (left + right)), np.nan)
+            noise = 1.4826 * np.nanmedian(residual, axis=1) / np.sqrt(1.5)
+            span = np.nanmax(means, axis=1) - np.nanmin(means, axis=1)
+            noise = np.fmax(noise, 0.01 * span)
+
+            worst = np.argmax(outside, axis=1)
+            rows = np.arange(n_compounds)
+            flagged = (outside[rows, worst] > spike_threshold * noise) & (
+                mask.sum(axis=1) >= 5
+            )
+
+            # The other doses of a spiked compound must be monotone within the noise
+            rows = rows[flagged]
+            rest = mask[rows] & np.isfinite(means[rows])
+            rest[np.arange(len(rows)), worst[flagged] + 1] = False
+            values = np.where(rest, means[rows], 0.0)
+            misfit = np.fmin(
+                _isotonic_misfit(values, rest), _isotonic_misfit(-values, rest)
+            )
+            monotone = misfit <= spike_threshold * noise[rows]
+            spikes[rows[monotone], worst[flagged][monotone] + 1] = True
+
+    return {"spikes": spikes, "wells": outliers}
+
+
+def _isotonic_misfit(values, weight):
+    """
+    Largest distance of the weighted points of every row from their non-decreasing isotonic regression. The
+    regression is found for all rows at once with the min-max formula, fit_i = max over j <= i of the min over
+    k >= i of the mean of points j to k, which needs (rows x points x points) memory and no loop over rows.
+
+    :param values: np.ndarray
+        Values of shape (rows, points), 0 where weight is False.
+    :param weight: np.ndarray
+        Boolean array of shape (rows, points) marking the points to fit.
+
+    :return: np.ndarray of shape (rows,). 0 for rows without points.
+    """
+    n_points = values.shape[1]
+    zero = np.zeros((len(values), 1))
+    count = np.hstack([zero, np.cumsum(weight, axis=1)])
+    total = np.hstack([zero, np.cumsum(values, axis=1)])
+    # mean[:, j, k] is the mean of the points j to k, NaN for k < j or no points
+    with np.errstate(all="ignore"):
+        mean = (total[:, None, 1:] - total[:, :-1, None]) / (
+            count[:, None, 1:] - count[:, :-1, None]
+        )
+    j, k = np.indices((n_points, n_points))
+    mean[:, k < j] = np.nan
+    mean[~np.isfinite(mean)] = np.nan
+
+    # Min over k >= i for every j, then max over j <= i
+    lowest = np.fmin.accumulate(mean[:, :, ::-1], axis=2)[:, :, ::-1]
+    lowest[:, j > k] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        fit = np.nanmax(lowest, axis=1)
+    distance = np.where(weight, np.abs(values - fit), 0.0)
+    return distance.max(axis=1, initial=0.0)
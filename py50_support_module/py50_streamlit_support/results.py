@@ -0,0 +1,229 @@
+"""
+Array-backed container for calculation results. Every output column is held as one NumPy array, so a calculation on
+hundreds of thousands of drugs does not build a Python dictionary per drug. Results can be used as they are, looked up
+by drug name, converted to a pandas DataFrame or an Arrow table when needed, or written to Parquet.
+"""
+
+import numpy as np
+import pandas as pd
+
+__all__ = ["FitResults", "FitRow"]
+
+
+class FitRow:
+    """
+    Read-only view of one drug in a FitResults object. Values are read from the column arrays when accessed, so
+    creating a row copies nothing.
+
+    :param results: FitResults
+        Results the row belongs to.
+    :param position: int
+        Position of the drug in the results.
+    """
+
+    __slots__ = ("_results", "_position")
+
+    def __init__(self, results, position: int):
+        self._results = results
+        self._position = position
+
+    def __getitem__(self, field: str):
+        return self._results.columns[field][self._position]
+
+    def __contains__(self, field):
+        return field in self._results.columns
+
+    def __repr__(self):
+        return f"<FitRow {self.to_dict()}>"
+
+    def keys(self):
+        """Column names of the row"""
+        return list(self._results.columns)
+
+    def to_dict(self):
+        """
+        Values of the row.
+
+        :return: Dictionary of column names and values
+        """
+        return {
+            field: values[self._position]
+            for field, values in self._results.columns.items()
+        }
+
+
+class FitResults:
+    """
+    Calculation results with one NumPy array per output column. The "compound_name" column identifies each drug.
+
+    results["hill_slope"] gives a whole column, results[i] gives a FitRow view of the i-th drug, and
+    results.row(name) looks a drug up by name.
+
+    :param columns: dict
+        Column names and arrays of equal length. Insertion order is the column order.
+    """
+
+    __slots__ = ("columns", "_index")
+
+    def __init__(self, columns: dict = None):
+        self.columns = {}
+        self._index = None
+        for field, values in (columns or {}).items():
+            self[field] = values
+
+    @classmethod
+    def from_pandas(cls, data: pd.DataFrame):
+        """
+        Build results from a DataFrame returned by a calculate method.
+
+        :param data: pd.DataFrame
+            Output of Calculator.calculate_ic50(), calculate_absolute_ic50(), or calculate_pic50().
+
+        :return: FitResults
+        """
+        return cls({field: data[field].to_numpy() for field in data.columns})
+
+    @classmethod
+    def concat(cls, parts):
+        """
+        Join results with the same columns end to end.
+
+        :param parts: list
+            FitResults objects. Empty objects without columns are skipped.
+
+        :return: FitResults
+        """
+        parts = [part for part in parts if part.columns]
+        if not parts:
+            return cls()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            {
+                field: np.concatenate([part.columns[field] for part in parts])
+                for field in parts[0].columns
+            }
+        )
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield FitRow(self, position)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        position = int(key)
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("Result position out of range")
+        return FitRow(self, position)
+
+    def __setitem__(self, field: str, values):
+        values = np.asarray(values)
+        if self.columns and len(values) != len(self):
+            raise ValueError("Columns must have one value per drug")
+        self.columns[field] = values
+        if field == "compound_name":
+            self._index = None
+
+    def __repr__(self):
+        return f"<FitResults {len(self)} drugs x {len(self.columns)} columns>"
+
+    @property
+    def names(self):
+        """Drug names"""
+        return self.columns["compound_name"]
+
+    @property
+    def fields(self):
+        """Column names"""
+        return list(self.columns)
+
+    def index(self, name):
+        """
+        Position of a drug. The name index is built on first use.
+
+        :param name:
+            Drug name.
+
+        :return: int
+        """
+        if self._index is None:
+            self._index = {
+                drug: position for position, drug in enumerate(self.names)
+            }
+        if name not in self._index:
+            raise KeyError(f"{name} not found in results")
+        return self._index[name]
+
+    def row(self, name):
+        """
+        Row view of a drug by name.
+
+        :param name:
+            Drug name.
+
+        :return: FitRow
+        """
+        return FitRow(self, self.index(name))
+
+    def take(self, positions):
+        """
+        Results for the drugs at the given positions, in that order.
+
+        :param positions: array-like
+            Integer positions or a boolean mask.
+
+        :return: FitResults
+        """
+        return FitResults(
+            {field: values[positions] for field, values in self.columns.items()}
+        )
+
+    def to_pandas(self):
+        """
+        Convert to a DataFrame. The column arrays are passed to pandas as they are, so no per-drug Python objects are
+        built. Pandas may still copy columns of the same type into one block.
+
+        :return: pd.DataFrame
+        """
+        return pd.DataFrame(self.columns, copy=False)
+
+    def to_arrow(self):
+        """
+        Convert to a pyarrow Table. Numeric columns are shared with pyarrow without copying. Requires pyarrow.
+
+        :return: pyarrow.Table
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(
+                "to_arrow() requires pyarrow. Install it with: pip install pyarrow"
+            )
+        return pa.table(
+            {field: pa.array(values) for field, values in self.columns.items()}
+        )
+
+    def to_parquet(self, path, **kwargs):
+        """
+        Write the results to a Parquet file through to_arrow(). Requires pyarrow.
+
+        :param path: str or file-like
+            File to write.
+        :param kwargs:
+            Passed on to pyarrow.parquet.write_table(), for example compression.
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "to_parquet() requires pyarrow. Install it with: pip install pyarrow"
+            )
+        pq.write_table(self.to_arrow(), path, **kwargs)
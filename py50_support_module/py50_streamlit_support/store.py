@@ -0,0 +1,314 @@
+"""
+Persistent store of curve fit results in a local SQLite database. Fits are saved under the same content hash as the
+FitCache (see cache.fit_key()), so a later session can reuse the fit of every compound whose data did not change. Every
+calculation is also saved as a run, so the history of a compound can be queried without loading the input files again.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+__all__ = ["FitResultStore"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fits (
+    key TEXT PRIMARY KEY,
+    reverse INTEGER,
+    maximum REAL,
+    minimum REAL,
+    ic50 REAL,
+    hill_slope REAL,
+    asymmetry REAL,
+    model TEXT,
+    status TEXT,
+    nfev INTEGER,
+    njev INTEGER,
+    created TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT,
+    units TEXT,
+    target REAL,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER REFERENCES runs(run),
+    compound TEXT,
+    key TEXT,
+    maximum REAL,
+    minimum REAL,
+    relative_ic50 REAL,
+    absolute_ic50 REAL,
+    hill_slope REAL,
+    units TEXT,
+    model TEXT,
+    status TEXT,
+    created TEXT
+);
+CREATE INDEX IF NOT EXISTS results_compound ON results (compound, run);
+CREATE INDEX IF NOT EXISTS results_run ON results (run);
+"""
+
+# Fields of a cached fit, in the column order of the fits table after the key
+_FIT_COLUMNS = (
+    "reverse",
+    "maximum",
+    "minimum",
+    "ic50",
+    "hill_slope",
+    "asymmetry",
+    "model",
+    "status",
+    "nfev",
+    "njev",
+)
+
+# Keys per query, below the SQLite limit on query parameters
+_CHUNK = 500
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class FitResultStore:
+    """
+    Thread-safe SQLite store of curve fits and calculation results. Pass it to Calculator.calculate_absolute_ic50()
+    with store=... to save every fit and result row. Fits missing from the FitCache are looked up here before fitting.
+
+    The database has three tables:
+
+    - fits: one row per content hash with the fitted parameters, model, fit status, and number of evaluations.
+    - runs: one row per calculation with its time (UTC), concentration units, target response, and options.
+    - results: one row per compound and run with the reported parameters, relative and absolute IC values, units,
+      model, and fit status. Indexed by compound and by run.
+
+    NaN values are stored as NULL and read back as NaN.
+
+    :param path: str
+        Database file, created if it does not exist. Default is ":memory:" for a store that lasts only as long as
+        the object.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return f"<FitResultStore {self.path}>"
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM fits").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._connection.close()
+
+    def get_many(self, keys):
+        """
+        Look up fits by content hash.
+
+        :param keys: list
+            Keys from cache.fit_key().
+
+        :return: Dictionary of the keys that were found and their fits, in the format of the FitCache values.
+        """
+        keys = list(keys)
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), _CHUNK):
+                chunk = keys[start : start + _CHUNK]
+                rows += self._connection.execute(
+                    f"SELECT key, {', '.join(_FIT_COLUMNS)} FROM fits "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+
+        found = {}
+        for key, reverse, *params, asymmetry, model, status, nfev, njev in rows:
+            found[key] = {
+                "reverse": np.int64(reverse),
+                "params": np.array(params, dtype=float),
+                "status": status,
+                "nfev": np.int64(nfev),
+                "njev": np.int64(njev),
+                "model": model,
+                "asymmetry": np.float64(np.nan if asymmetry is None else asymmetry),
+            }
+        return found
+
+    def put_many(self, fits: dict):
+        """
+        Save fits by content hash. A key that is already in the store is replaced.
+
+        :param fits: dict
+            Keys from cache.fit_key() and their fits, in the format of the FitCache values.
+        """
+        created = _now()
+        rows = [
+            (
+                key,
+                int(fit["reverse"]),
+                *map(float, fit["params"]),
+                float(fit["asymmetry"]),
+                str(fit["model"]),
+                str(fit["status"]),
+                int(fit["nfev"]),
+                int(fit["njev"]),
+                created,
+            )
+            for key, fit in fits.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO fits "
+                f"(key, {', '.join(_FIT_COLUMNS)}, created) "
+                f"VALUES ({', '.join('?' * (len(_FIT_COLUMNS) + 2))})",
+                rows,
+            )
+
+    def record(self, results, keys, options: dict = None):
+        """
+        Save the output of an absolute IC50 calculation as a new run.
+
+        :param results: FitResults
+            Output of Calculator.calculate_absolute_ic50(as_frame=False).
+        :param keys: list
+            Content hash of every compound, in the order of the results.
+        :param options: dict
+            Calculation options saved with the run. The concentration units and "target" are also saved in their own
+            columns. Values that are not JSON types are saved as text.
+
+        :return: int, the run number
+        """
+        options = dict(options or {})
+        target = float(options.get("target", 50))
+        # The IC50 columns carry the units in their name, for example "relative ic50 (nM)" and "absolute ic90 (nM)"
+        units = [
+            unit
+            for unit in ("nM", "µM", "pM")
+            if f"relative ic50 ({unit})" in results.columns
+            and f"absolute ic{target:g} ({unit})" in results.columns
+        ]
+        if not units:
+            raise ValueError(
+                f"Results must have relative ic50 and absolute ic{target:g} columns"
+            )
+        units = units[0]
+        relative = f"relative ic50 ({units})"
+        absolute = f"absolute ic{target:g} ({units})"
+        created = _now()
+
+        columns = [
+            results["compound_name"].tolist(),
+            list(keys),
+            *(
+                np.asarray(results[field], dtype=float).tolist()
+                for field in ("maximum", "minimum", relative, absolute, "hill_slope")
+            ),
+            results["model"].tolist(),
+            results["fit status"].tolist(),
+        ]
+        with self._lock, self._connection:
+            run = self._connection.execute(
+                "INSERT INTO runs (created, units, target, options) "
+                "VALUES (?, ?, ?, ?)",
+                (created, units, target, json.dumps(options, default=str)),
+            ).lastrowid
+            self._connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (run, name, key, *values, units, model, status, created)
+                    for name, key, *values, model, status in zip(*columns)
+                ),
+            )
+        return run
+
+    def runs(self):
+        """
+        All saved runs.
+
+        :return: DataFrame with the run number, time, units, target, and options (JSON text) of every run.
+        """
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT * FROM runs ORDER BY run", self._connection
+            )
+
+    def history(self, compounds=None, run: int = None):
+        """
+        Saved results, optionally for some compounds or one run. Lookups by compound and run use the indexes of the
+        results table, so they do not scan the whole history.
+
+        :param compounds: str or list
+            Compound name or names. If None, all compounds.
+        :param run: int
+            Run number. If None, all runs.
+
+        :return: DataFrame with one row per compound and run, ordered by compound and run. The absolute_ic50 column is
+            at the target response of the run (see runs()).
+        """
+        conditions, parameters = [], []
+        if run is not None:
+            conditions.append("run = ?")
+            parameters.append(int(run))
+        if compounds is None:
+            chunks = [None]
+        else:
+            compounds = [compounds] if isinstance(compounds, str) else list(compounds)
+            chunks = [
+                compounds[start : start + _CHUNK]
+                for start in range(0, len(compounds), _CHUNK)
+            ] or [[]]
+
+        parts = []
+        with self._lock:
+            for chunk in chunks:
+                where = list(conditions)
+                if chunk is not None:
+                    where.append(f"compound IN ({', '.join('?' * len(chunk))})")
+                query = "SELECT * FROM results"
+                if where:
+                    query += f" WHERE {' AND '.join(where)}"
+                parts.append(
+                    pd.read_sql_query(
+                        f"{query} ORDER BY compound, run",
+                        self._connection,
+                        params=parameters + (chunk or []),
+                    )
+                )
+        if len(parts) == 1:
+            return parts[0]
+        # Keys per query are limited, so larger lists are looked up in chunks and merged in the same order
+        return pd.concat(parts, ignore_index=True).sort_values(
+            ["compound", "run"], kind="stable", ignore_index=True
+        )
+
+    def latest(self, compounds=None):
+        """
+        Most recent saved result of every compound.
+
+        :param compounds: str or list
+            Compound name or names. If None, all compounds.
+
+        :return: DataFrame with one row per compound, in the format of history().
+        """
+        history = self.history(compounds)
+        return history.drop_duplicates("compound", keep="last").reset_index(
+            drop=True
+        )
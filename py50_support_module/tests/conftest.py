@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def make_screen(
+    n_drugs: int = 20, n_doses: int = 8, replicates: int = 1, seed: int = 0
+):
+    """
+    Synthetic dose-response screen with rising and falling 4PL curves and normal noise.
+
+    :return: DataFrame with "compound", "concentration", and "response" columns
+    """
+    rng = np.random.default_rng(seed)
+    concentration = np.logspace(0, 4, n_doses)
+    ic50 = 10 ** rng.uniform(1, 3, n_drugs)
+    hill_slope = rng.uniform(0.7, 1.5, n_drugs) * rng.choice([-1, 1], n_drugs)
+    maximum = rng.uniform(90, 105, n_drugs)
+    minimum = rng.uniform(-5, 5, n_drugs)
+    curve = minimum[:, None] + (maximum - minimum)[:, None] / (
+        1 + (ic50[:, None] / concentration) ** hill_slope[:, None]
+    )
+    curve = np.repeat(curve, replicates, axis=1)
+    return pd.DataFrame(
+        {
+            "compound": np.repeat(
+                [f"D{i:04d}" for i in range(n_drugs)], n_doses * replicates
+            ),
+            "concentration": np.tile(np.repeat(concentration, replicates), n_drugs),
+            "response": curve.ravel() + rng.normal(0, 3, curve.size),
+        }
+    )
+
+
+@pytest.fixture
+def screen():
+    return make_screen()
+
+
+@pytest.fixture
+def replicate_screen():
+    return make_screen(replicates=3, seed=1)
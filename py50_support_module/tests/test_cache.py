@@ -0,0 +1,60 @@
+import numpy as np
+from py50_streamlit_support import Calculator, FitCache, fit_key
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+def test_fit_key_depends_on_data_and_model():
+    concentration = np.array([1.0, 10.0, 100.0])
+    response = np.array([5.0, 50.0, 95.0])
+    key = fit_key(concentration, response)
+
+    assert key == fit_key(concentration.copy(), response.tolist())
+    assert key != fit_key(concentration, response + 1e-9)
+    assert key != fit_key(concentration, response, model="5PL")
+    assert key != fit_key(concentration, response, sigma=np.ones(3))
+    # The length is hashed, so arrays split at another point give another key
+    assert fit_key(concentration[:2], response) != fit_key(concentration, response[:2])
+
+
+def test_least_recently_used_fit_is_dropped():
+    cache = FitCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert [cache.get("a"), cache.get("c")] == [1, 3]
+    assert cache.info() == {"hits": 3, "misses": 1, "size": 2, "maxsize": 2}
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.info()["hits"] == 0
+
+
+def test_calculations_reuse_cached_fits(screen):
+    cache = FitCache()
+    absolute = Calculator(screen, cache=cache).calculate_absolute_ic50(*COLUMNS)
+    assert cache.info()["misses"] == len(absolute)
+
+    # Another calculation of the same curves, in other units, on another Calculator
+    Calculator(screen, cache=cache).calculate_pic50(*COLUMNS, input_units="µM")
+    assert cache.info()["misses"] == len(absolute)
+    assert cache.info()["hits"] == len(absolute)
+
+    # Changing one drug only refits that drug
+    changed = screen.copy()
+    changed.loc[changed["compound"] == "D0003", "response"] *= 1.01
+    Calculator(changed, cache=cache).calculate_absolute_ic50(*COLUMNS)
+    assert cache.info()["misses"] == len(absolute) + 1
+
+
+def test_fit_options_are_cached_separately(screen):
+    cache = FitCache()
+    Calculator(screen, cache=cache).calculate_absolute_ic50(*COLUMNS)
+
+    Calculator(screen, cache=cache).calculate_absolute_ic50(*COLUMNS, batch=True)
+    assert cache.info()["hits"] == 0
+    assert len(cache) == 2 * len(screen["compound"].unique())
@@ -0,0 +1,544 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import curve_fit
+import py50_streamlit_support.calculator as calculator_module
+from py50_streamlit_support import Calculator, global_fit
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+@pytest.mark.parametrize(
+    "method", ["calculate_ic50", "calculate_absolute_ic50", "calculate_pic50"]
+)
+@pytest.mark.parametrize("batch", [False, True])
+def test_parallel_fits_match_serial_fits(screen, method, batch):
+    serial = getattr(Calculator(screen), method)(*COLUMNS, batch=batch)
+
+    processes = getattr(Calculator(screen), method)(*COLUMNS, batch=batch, n_jobs=2)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        threads = getattr(Calculator(screen), method)(
+            *COLUMNS, batch=batch, executor=pool
+        )
+
+    pd.testing.assert_frame_equal(processes, serial, check_exact=True)
+    pd.testing.assert_frame_equal(threads, serial, check_exact=True)
+
+
+def fallback_screen():
+    """A well-behaved drug and a drug too steep for the unbounded fit, which runs past the hill slope bound of 20"""
+    concentration = np.logspace(0, 4, 8)
+    return pd.DataFrame(
+        {
+            "compound": np.repeat(["good", "steep"], 8),
+            "concentration": np.tile(concentration, 2),
+            "response": np.concatenate(
+                [
+                    100 / (1 + (100 / concentration) ** 1.2),
+                    100 / (1 + (100 / concentration) ** 30),
+                ]
+            ),
+        }
+    )
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_fallback_stages(batch):
+    data = fallback_screen()
+    results = Calculator(data).calculate_absolute_ic50(*COLUMNS, batch=batch)
+    good, steep = results.to_dict("records")
+
+    assert good["fit status"] == "converged"
+    np.testing.assert_allclose(good["hill_slope"], 1.2, rtol=1e-6)
+    # The bounded fit keeps the hill slope on its bound
+    assert steep["fit status"] == "bounded"
+    assert abs(steep["hill_slope"]) == pytest.approx(20)
+    np.testing.assert_allclose(steep["absolute ic50 (nM)"], 100, rtol=1e-6)
+
+    # Too few evaluations for the full bounded fit leaves the fixed hill slope
+    limited = Calculator(data).calculate_absolute_ic50(
+        *COLUMNS, batch=batch, max_nfev=10
+    )
+    assert limited["fit status"][1] == "fixed hill"
+    assert abs(limited["hill_slope"][1]) == 1.0
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_undetermined_fits_move_down_the_stages(batch):
+    concentration = np.logspace(0, 4, 8)
+    curves = {
+        "good": (concentration, 100 / (1 + (100 / concentration) ** 1.2)),
+        # A flat curve leaves every stage at its initial ic50 and hill slope
+        "flat": (concentration, np.full(8, 50.0)),
+        # Four points fit a 4PL exactly, so only the fixed hill slope has a covariance
+        "four": (concentration[:4], [90.0, 60.0, 30.0, 10.0]),
+        "three": (concentration[:3], [90.0, 50.0, 10.0]),
+    }
+    data = pd.concat(
+        pd.DataFrame({"compound": name, "concentration": x, "response": y})
+        for name, (x, y) in curves.items()
+    )
+    results = Calculator(data).calculate_absolute_ic50(*COLUMNS, batch=batch)
+    results = results.set_index("compound_name")
+
+    assert results["fit status"].to_dict() == {
+        "good": "converged",
+        "flat": "not converged",
+        "four": "fixed hill",
+        "three": "not converged",
+    }
+    failed = results.loc[["flat", "three"], ["maximum", "minimum", "hill_slope"]]
+    assert failed.isna().all(axis=None)
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_time_budget_stops_every_stage(batch):
+    data = fallback_screen()
+    results = Calculator(data).calculate_absolute_ic50(
+        *COLUMNS, batch=batch, time_budget=0.0
+    )
+
+    # The batch solver has no time budget. Only its failures go through the per-drug stages
+    statuses = ["converged", "not converged"] if batch else ["not converged"] * 2
+    assert results["fit status"].tolist() == statuses
+    failed = results[results["fit status"] == "not converged"]
+    assert failed[["maximum", "minimum", "hill_slope"]].isna().all(axis=None)
+
+
+def test_slow_fits_run_out_of_time(monkeypatch):
+    fourpl = Calculator._fourpl
+
+    def slow_fourpl(*args):
+        time.sleep(0.01)
+        return fourpl(*args)
+
+    monkeypatch.setattr(Calculator, "_fourpl", staticmethod(slow_fourpl))
+    data = fallback_screen()
+    data = data[data["compound"] == "good"]
+    start = time.perf_counter()
+    results = Calculator(data).calculate_absolute_ic50(*COLUMNS, time_budget=0.05)
+
+    # Every stage raises TimeoutError on its share of the budget, so the drug is given up
+    assert time.perf_counter() - start < 1.0
+    assert results["fit status"].tolist() == ["not converged"]
+    assert np.isnan(results["hill_slope"][0])
+
+
+@pytest.mark.parametrize("chunksize", [13, 100000])
+def test_csv_input_matches_frame_input(screen, tmp_path, chunksize):
+    path = tmp_path / "screen.csv"
+    screen.to_csv(path, index=False)
+    expected = Calculator(pd.read_csv(path)).calculate_absolute_ic50(*COLUMNS)
+
+    calculator = Calculator.from_csv(path, *COLUMNS, chunksize=chunksize)
+    assert list(calculator.data.columns) == COLUMNS
+    assert isinstance(calculator.data["compound"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(
+        calculator.calculate_absolute_ic50(*COLUMNS), expected
+    )
+
+    streamed = Calculator.stream_csv(path, *COLUMNS, chunksize=chunksize)
+    pd.testing.assert_frame_equal(pd.concat(streamed, ignore_index=True), expected)
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 1000])
+def test_from_csv_builds_the_same_frame(tmp_path, chunksize):
+    data = pd.DataFrame(
+        {
+            "compound": ["A", "A", None, "B", "B", "C"],
+            "concentration": [1.0, 10.0, 1.0, 1.0, 10.0, 1.0],
+            "r1": [90.0, 10.0, 50.0, 80.0, np.nan, 70.0],
+            "r2": [92.0, 12.0, 51.0, 82.0, 20.0, 71.0],
+        }
+    )
+    path = tmp_path / "screen.csv"
+    data.to_csv(path, index=False)
+    columns = ["compound", "concentration", ["r1", "r2"]]
+
+    frame = Calculator.from_csv(path, *columns, chunksize=chunksize).data
+    pd.testing.assert_frame_equal(
+        frame, data.astype({"compound": "category"}), check_categorical=False
+    )
+
+    data.iloc[:0].to_csv(path, index=False)
+    empty = Calculator.from_csv(path, *columns, chunksize=chunksize).data
+    assert empty.empty and list(empty.columns) == list(data.columns)
+
+
+def logistic(concentration, maximum, minimum, ic50, hill_slope):
+    return minimum + (maximum - minimum) / (1 + (ic50 / concentration) ** hill_slope)
+
+
+def test_replicates_are_fit_as_weighted_means(replicate_screen):
+    results = Calculator(replicate_screen).calculate_ic50(*COLUMNS)
+    results = results.set_index("compound_name")
+
+    shifts = []
+    for name, drug in replicate_screen.groupby("compound"):
+        doses = drug.groupby("concentration")["response"]
+        mean, sd = doses.mean(), doses.std()
+        # Every dose has three replicates, so only the floor at 10% of the pooled SD applies
+        pooled = np.sqrt(np.mean(sd**2))
+        sigma = np.maximum(sd, 0.1 * pooled) / np.sqrt(doses.count())
+        concentration = mean.index.to_numpy()
+        rising = mean.iloc[-1] > mean.iloc[0]
+        params, _ = curve_fit(
+            logistic,
+            concentration,
+            mean.to_numpy(),
+            p0=[100, 0, 100, 1 if rising else -1],
+            sigma=sigma.to_numpy(),
+            absolute_sigma=True,
+        )
+        unweighted, _ = curve_fit(logistic, concentration, mean.to_numpy(), p0=params)
+
+        row = results.loc[name]
+        np.testing.assert_allclose(row["ic50 (nM)"], params[2], rtol=1e-4)
+        np.testing.assert_allclose(
+            sorted([row["maximum"], row["minimum"]]),
+            sorted(params[:2]),
+            rtol=1e-4,
+            atol=1e-3,
+        )
+        shifts.append(abs(np.log(unweighted[2] / params[2])))
+
+    # The weights change the fit
+    assert max(shifts) > 0.01
+
+
+@pytest.mark.parametrize("resample", ["residuals", "replicates"])
+def test_bootstrap_intervals(replicate_screen, resample):
+    options = {"bootstrap": 50, "resample": resample, "seed": 3}
+    results = Calculator(replicate_screen).calculate_absolute_ic50(*COLUMNS, **options)
+
+    assert (results["bootstrap fits"] == 50).all()
+    for value in ["relative ic50", "absolute ic50"]:
+        estimate = results[f"{value} (nM)"]
+        assert (results[f"{value} 95% CI low (nM)"] <= estimate).all()
+        assert (results[f"{value} 95% CI high (nM)"] >= estimate).all()
+    assert (results["hill_slope 95% CI low"] < results["hill_slope 95% CI high"]).all()
+
+    # The same seed gives the same intervals and a lower confidence gives narrower ones
+    again = Calculator(replicate_screen).calculate_absolute_ic50(*COLUMNS, **options)
+    pd.testing.assert_frame_equal(again, results, check_exact=True)
+    narrow = Calculator(replicate_screen).calculate_absolute_ic50(
+        *COLUMNS, confidence=0.8, **options
+    )
+    width = (
+        results["absolute ic50 95% CI high (nM)"]
+        - results["absolute ic50 95% CI low (nM)"]
+    )
+    narrow_width = (
+        narrow["absolute ic50 80% CI high (nM)"]
+        - narrow["absolute ic50 80% CI low (nM)"]
+    )
+    assert (narrow_width <= width).all() and (narrow_width < width).any()
+
+
+@pytest.mark.parametrize("options", [{"bootstrap": 0}, {"confidence": 1.0}])
+def test_bootstrap_options_are_checked(screen, options):
+    with pytest.raises(ValueError):
+        Calculator(screen).calculate_absolute_ic50(
+            *COLUMNS, **{"bootstrap": 10, **options}
+        )
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_standard_errors_match_curve_fit(screen, replicate_screen, weighted):
+    data = replicate_screen if weighted else screen
+    results = Calculator(data).calculate_ic50(*COLUMNS, standard_errors=True)
+    results = results.set_index("compound_name")
+
+    for name, drug in data.groupby("compound"):
+        doses = drug.groupby("concentration")["response"]
+        mean, sd = doses.mean(), doses.std()
+        sigma = None
+        if weighted:
+            sigma = np.maximum(sd, 0.1 * np.sqrt(np.mean(sd**2))) / np.sqrt(3)
+        row = results.loc[name]
+        rising = mean.iloc[-1] > mean.iloc[0]
+        params, covariance = curve_fit(
+            logistic,
+            mean.index.to_numpy(),
+            mean.to_numpy(),
+            p0=[100, 0, row["ic50 (nM)"], 1 if rising else -1],
+            sigma=sigma,
+        )
+        se = np.sqrt(np.diag(covariance))
+
+        # The plateaus of the logistic are matched to maximum and minimum by value
+        plateaus = {"maximum": row["maximum"], "minimum": row["minimum"]}
+        for label, value in plateaus.items():
+            j = np.argmin(np.abs(params[:2] - value))
+            np.testing.assert_allclose(row[f"{label} SE"], se[j], rtol=1e-3)
+        np.testing.assert_allclose(row["ic50 SE (nM)"], se[2], rtol=1e-3)
+        np.testing.assert_allclose(row["hill_slope SE"], se[3], rtol=1e-3)
+
+
+def test_ill_conditioned_fits_warn(screen):
+    data = screen.copy()
+    step = data["compound"] == "D0003"
+    # Only the top dose falls, so the slope and ic50 of the step are not determined
+    top = np.where(data.loc[step, "concentration"] < 5000, 100, 0)
+    data.loc[step, "response"] = top + np.arange(step.sum()) % 2
+
+    with pytest.warns(RuntimeWarning, match="ill-conditioned.*: D0003$"):
+        Calculator(data).calculate_absolute_ic50(*COLUMNS, standard_errors=True)
+
+
+def edited(data):
+    """Copy of data with one drug changed, one removed, and one added"""
+    data = data.copy()
+    data.loc[data["compound"] == "D0002", "response"] += 5
+    data = data[data["compound"] != "D0005"]
+    added = data[data["compound"] == "D0009"].assign(compound="N0001")
+    return pd.concat([data, added], ignore_index=True)
+
+
+def test_update_refits_changed_drugs(screen):
+    calculator = Calculator(screen)
+    with pytest.raises(ValueError, match="before"):
+        calculator.update(screen)
+    calculator.calculate_absolute_ic50(*COLUMNS, input_units="µM")
+
+    updated = calculator.update(edited(screen))
+    # The added drug repeats the curve of D0009, so only the changed drug is fit
+    assert calculator.fit_stats["fits"] == 1
+    assert calculator.fit_stats["cache_hits"] == len(updated) - 1
+    expected = Calculator(edited(screen)).calculate_absolute_ic50(
+        *COLUMNS, input_units="µM"
+    )
+    pd.testing.assert_frame_equal(updated, expected)
+    pd.testing.assert_frame_equal(calculator.calculation, expected)
+
+
+UPDATE_OPTIONS = [
+    {},
+    {"batch": True},
+    {"standard_errors": True},
+    {"model": "5PL"},
+    {"model": "auto"},
+    {"prescreen": True},
+    {"drop_outliers": True},
+    {"shared": ["hill_slope"]},
+    {"bootstrap": 20, "seed": 1},
+    {"bootstrap": 20, "seed": 1, "resample": "replicates", "model": "3PL"},
+    {
+        "bootstrap": 20,
+        "seed": 2,
+        "prescreen": True,
+        "drop_outliers": True,
+        "model": "auto",
+    },
+]
+
+
+@pytest.mark.parametrize(
+    "method", ["calculate_ic50", "calculate_absolute_ic50", "calculate_pic50"]
+)
+@pytest.mark.parametrize("options", UPDATE_OPTIONS)
+def test_update_matches_full_calculation(replicate_screen, method, options):
+    if "bootstrap" in options and method != "calculate_absolute_ic50":
+        pytest.skip("bootstrap is only available for absolute IC50")
+    data = replicate_screen.copy()
+    # A flat drug for the prescreen and a spike for the outlier filter
+    flat = data["compound"] == "D0003"
+    data.loc[flat, "response"] = 50 + np.arange(flat.sum()) % 3
+    data.loc[10, "response"] += 80
+
+    calculator = Calculator(data)
+    getattr(calculator, method)(*COLUMNS, **options)
+    updated = calculator.update(edited(data))
+    full = Calculator(edited(data))
+    expected = getattr(full, method)(*COLUMNS, **options)
+
+    pd.testing.assert_frame_equal(updated, expected, check_exact=True)
+    assert calculator.fit_stats["compounds"] == full.fit_stats["compounds"]
+    assert calculator.fit_stats.get("inactive") == full.fit_stats.get("inactive")
+    if options.get("drop_outliers"):
+        pd.testing.assert_frame_equal(calculator.dropped_points, full.dropped_points)
+
+
+@pytest.mark.parametrize(
+    "method", ["calculate_ic50", "calculate_absolute_ic50", "calculate_pic50"]
+)
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"standard_errors": True, "model": "auto"},
+        {"prescreen": True, "drop_outliers": True},
+        {"bootstrap": 20, "seed": 4},
+    ],
+)
+def test_submit_matches_calculation(replicate_screen, method, options):
+    if method == "calculate_ic50" and "bootstrap" in options:
+        pytest.skip("no bootstrap intervals for the relative IC50")
+    calculation = {
+        "calculate_ic50": "relative",
+        "calculate_absolute_ic50": "absolute",
+        "calculate_pic50": "pic50",
+    }[method]
+    job = Calculator(replicate_screen).submit(
+        *COLUMNS, calculation=calculation, chunk_size=6, **options
+    )
+    full = getattr(Calculator(replicate_screen), method)(*COLUMNS, **options)
+    pd.testing.assert_frame_equal(job.result(), full)
+
+
+def test_stream_csv_matches_calculation(replicate_screen, tmp_path):
+    path = tmp_path / "screen.csv"
+    replicate_screen.to_csv(path, index=False)
+    options = {"standard_errors": True, "bootstrap": 20, "seed": 4}
+    streamed = pd.concat(
+        Calculator.stream_csv(path, *COLUMNS, chunksize=50, **options),
+        ignore_index=True,
+    )
+    full = Calculator(pd.read_csv(path)).calculate_absolute_ic50(*COLUMNS, **options)
+    pd.testing.assert_frame_equal(streamed, full)
+
+
+def test_unknown_fit_option(screen):
+    with pytest.raises(TypeError, match="bootstraps"):
+        Calculator(screen).calculate_absolute_ic50(*COLUMNS, bootstraps=10)
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        lambda data: Calculator(data).calculate_ic50(*COLUMNS, bootstrap=10),
+        lambda data: Calculator(data).calculate_ic50(*COLUMNS, model="6PL"),
+        lambda data: Calculator(data).submit(*COLUMNS, shared=["hill_slope"]),
+        lambda data: Calculator(data).submit(*COLUMNS, calculation="ic90"),
+    ],
+)
+def test_unsupported_fit_options(screen, call):
+    with pytest.raises(ValueError):
+        call(screen)
+
+
+def test_stream_csv_rejects_options_before_reading(tmp_path):
+    # The file does not exist, so only the option check can raise
+    with pytest.raises(ValueError, match="drop_outliers"):
+        Calculator.stream_csv(tmp_path / "missing.csv", *COLUMNS, drop_outliers=True)
+
+
+def test_shared_hill_slope_per_plate(screen):
+    names = screen["compound"].unique()
+    data = screen.assign(
+        plate=np.where(screen["compound"].isin(names[:10]), "P1", "P2")
+    )
+    results = Calculator(data).calculate_absolute_ic50(
+        *COLUMNS, shared=["hill_slope"], group_col="plate", standard_errors=True
+    )
+
+    slopes = results["hill_slope"].abs().to_numpy()
+    assert np.ptp(slopes[:10]) < 1e-12 and np.ptp(slopes[10:]) < 1e-12
+    assert slopes[0] != slopes[10]
+    assert results["hill_slope SE"].notna().all()
+
+
+def test_failed_global_fits_of_cached_drugs(screen, monkeypatch):
+    calculator = Calculator(screen)
+    calculator.calculate_absolute_ic50(*COLUMNS)
+
+    def not_converged(*args, **kwargs):
+        fit = global_fit(*args, **kwargs)
+        fit.converged = np.zeros_like(fit.converged)
+        return fit
+
+    monkeypatch.setattr(calculator_module, "global_fit", not_converged)
+    results = calculator.calculate_absolute_ic50(*COLUMNS, shared=["hill_slope"])
+    # Every per-drug fit comes from the cache, and the failure label is not cut short
+    assert calculator.fit_stats["cache_hits"] == len(results)
+    assert (results["fit status"] == "not converged").all()
+    assert results["absolute ic50 (nM)"].isna().all()
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_prescreen_skips_inactive_drugs(screen, batch):
+    data = screen.copy()
+    flat = data["compound"].isin(["D0003", "D0011"])
+    data.loc[flat, "response"] = 50 + np.arange(flat.sum()) % 3
+
+    calculator = Calculator(data)
+    results = calculator.calculate_absolute_ic50(*COLUMNS, batch=batch, prescreen=True)
+    inactive = results["compound_name"].isin(["D0003", "D0011"])
+
+    assert (results["fit status"][inactive] == "inactive").all()
+    assert (results["activity"][inactive] == "inactive").all()
+    assert results["absolute ic50 (nM)"][inactive].isna().all()
+    assert calculator.fit_stats["inactive"] == 2
+    assert calculator.fit_stats["fits"] == len(results) - 2
+
+    # Active drugs get the same fits as without the prescreen
+    full = Calculator(data).calculate_absolute_ic50(*COLUMNS, batch=batch)
+    columns = ["maximum", "minimum", "absolute ic50 (nM)", "hill_slope"]
+    pd.testing.assert_frame_equal(
+        results[~inactive][columns], full[~inactive][columns], check_exact=True
+    )
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_warm_start_from_earlier_results(screen, batch):
+    first = Calculator(screen).calculate_absolute_ic50(*COLUMNS, batch=batch)
+
+    cold = Calculator(screen)
+    cold.calculate_absolute_ic50(*COLUMNS, batch=batch)
+    warm = Calculator(screen)
+    results = warm.calculate_absolute_ic50(*COLUMNS, batch=batch, prior=first)
+
+    assert warm.fit_stats["warm_starts"] == len(first)
+    assert warm.fit_stats["warm_nfev"] < cold.fit_stats["nfev"]
+    columns = ["maximum", "minimum", "absolute ic50 (nM)", "hill_slope"]
+    pd.testing.assert_frame_equal(
+        results[columns], first[columns], check_exact=False, rtol=1e-4, atol=1e-3
+    )
+
+    # Drugs missing from the prior start cold; relative output units are converted
+    prior = Calculator(screen).calculate_ic50(*COLUMNS, batch=batch)
+    part = Calculator(screen)
+    part.calculate_absolute_ic50(*COLUMNS, batch=batch, prior=prior.iloc[:5])
+    assert part.fit_stats["warm_starts"] == 5
+
+
+@pytest.mark.parametrize("resample", ["residuals", "replicates"])
+def test_bootstrap_intervals_do_not_depend_on_other_drugs(replicate_screen, resample):
+    options = {"bootstrap": 50, "resample": resample, "seed": 3}
+    full = Calculator(replicate_screen).calculate_absolute_ic50(*COLUMNS, **options)
+    names = ["D0001", "D0007", "D0012"]
+    subset = replicate_screen[replicate_screen["compound"].isin(names)]
+    part = Calculator(subset).calculate_absolute_ic50(*COLUMNS, **options)
+
+    full = full.set_index("compound_name").loc[names]
+    part = part.set_index("compound_name").loc[names]
+    limits = [column for column in full.columns if " CI " in column]
+    assert limits
+    np.testing.assert_array_equal(full[limits].to_numpy(), part[limits].to_numpy())
+
+
+@pytest.mark.parametrize("options", [{}, {"batch": True}, {"prescreen": True}])
+def test_warm_start_reports_saved_evaluations(replicate_screen, options):
+    first = Calculator(replicate_screen).calculate_absolute_ic50(*COLUMNS, **options)
+    rng = np.random.default_rng(7)
+    retest = replicate_screen.assign(
+        response=replicate_screen["response"] + rng.normal(0, 1, len(replicate_screen))
+    )
+
+    warm = Calculator(retest)
+    results = warm.calculate_absolute_ic50(*COLUMNS, prior=first, **options)
+    compared = Calculator(retest)
+    compared_results = compared.calculate_absolute_ic50(
+        *COLUMNS, prior=first, compare_cold=True, **options
+    )
+    cold = Calculator(retest)
+    cold.calculate_absolute_ic50(*COLUMNS, **options)
+
+    pd.testing.assert_frame_equal(compared_results, results)
+    stats = compared.fit_stats
+    assert stats["warm_starts"] == warm.fit_stats["warm_starts"] > 0
+    assert stats["warm_nfev"] == warm.fit_stats["warm_nfev"]
+    assert stats["saved_nfev"] == stats["cold_nfev"] - stats["warm_nfev"] > 0
+    if stats["warm_starts"] == stats["fits"]:
+        assert stats["cold_nfev"] == cold.fit_stats["nfev"]
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+from conftest import make_screen
+from py50_streamlit_support import Calculator, FitCache
+
+COLUMNS = ["compound", "concentration", "response"]
+
+# Calculations of every session, with the fit paths that keep state while fitting
+CALLS = [
+    ("calculate_ic50", {"drop_outliers": True}),
+    ("calculate_absolute_ic50", {"batch": True}),
+    ("calculate_absolute_ic50", {"model": "auto", "standard_errors": True}),
+    ("calculate_pic50", {"input_units": "µM", "prescreen": True}),
+    ("calculate_absolute_ic50", {"bootstrap": 20, "seed": 1}),
+]
+
+
+def sessions():
+    """
+    Overlapping slices of 20 drugs from one screen, each twice, so sessions fit and look up the same drugs at the
+    same time
+    """
+    screen = make_screen(n_drugs=60, replicates=2, seed=3)
+    names = screen["compound"].unique()
+    return [
+        screen[screen["compound"].isin(names[start : start + 20])]
+        for start in range(0, 41, 5)
+    ] * 2
+
+
+def run_session(data: pd.DataFrame, cache: FitCache = None):
+    calculator = Calculator(data, cache=cache)
+    return [
+        getattr(calculator, method)(*COLUMNS, **options) for method, options in CALLS
+    ]
+
+
+@pytest.mark.parametrize("maxsize", [4096, 16])
+def test_threaded_sessions_match_serial_run(maxsize):
+    data = sessions()
+    serial = [run_session(frame) for frame in data]
+
+    # A small cache also drops fits while other threads read them
+    cache = FitCache(maxsize=maxsize)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        threaded = list(pool.map(run_session, data, [cache] * len(data)))
+
+    assert cache.hits > 0
+    for expected, results in zip(serial, threaded):
+        for left, right in zip(expected, results):
+            pd.testing.assert_frame_equal(left, right, check_exact=True)
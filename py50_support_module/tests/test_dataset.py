@@ -0,0 +1,228 @@
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from py50_streamlit_support import (
+    Calculator,
+    GroupedData,
+    PlotCurve,
+    iter_csv_groups,
+    read_parquet,
+)
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+def assert_same_groups(left, right, rtol=0.0):
+    """Compare every array of two grouped views. Replicate means reduced in another order may differ by rounding"""
+    np.testing.assert_array_equal(left.names, right.names)
+    np.testing.assert_array_equal(left.offsets, right.offsets)
+    np.testing.assert_array_equal(left.concentration, right.concentration)
+    np.testing.assert_allclose(left.response, right.response, rtol=rtol)
+    for field in ("sigma", "replicates", "wells"):
+        left_values, right_values = getattr(left, field), getattr(right, field)
+        assert (left_values is None) == (right_values is None)
+        if left_values is not None:
+            np.testing.assert_allclose(left_values, right_values, rtol=rtol)
+
+
+def test_groups_are_sorted_by_name_and_concentration():
+    groups = GroupedData.from_arrays(
+        ["b", "a", "b", "a", "b"], [3.0, 2.0, 1.0, 1.0, 2.0], [30, 20, 10, 10, 20]
+    )
+
+    np.testing.assert_array_equal(groups.names, ["a", "b"])
+    np.testing.assert_array_equal(groups.lengths, [2, 3])
+    concentration, response = groups.group(1)
+    np.testing.assert_array_equal(concentration, [1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(response, [10, 20, 30])
+    assert groups.sigma is None
+    np.testing.assert_array_equal(groups.endpoints()[1], [20, 30])
+
+
+def test_replicates_are_reduced_to_their_mean():
+    groups = GroupedData.from_arrays(
+        ["a"] * 5, [1.0, 1.0, 1.0, 2.0, 2.0], [9.0, 10.0, 11.0, 20.0, np.nan]
+    )
+
+    np.testing.assert_array_equal(groups.concentration, [1.0, 2.0])
+    np.testing.assert_array_equal(groups.response, [10.0, 20.0])
+    np.testing.assert_array_equal(groups.replicates, [3, 1])
+    # The single well uses the pooled standard deviation of the drug
+    np.testing.assert_allclose(groups.sigma, [1.0 / np.sqrt(3), 1.0])
+    np.testing.assert_array_equal(groups.wells[0], [9.0, 10.0, 11.0])
+
+
+def test_replicate_columns_match_replicate_rows(replicate_screen):
+    wide = replicate_screen.assign(
+        well=replicate_screen.groupby(["compound", "concentration"]).cumcount()
+    ).pivot(index=["compound", "concentration"], columns="well", values="response")
+    wide = wide.reset_index()
+    wide.columns = ["compound", "concentration", "r0", "r1", "r2"]
+
+    rows = GroupedData.from_frame(replicate_screen, *COLUMNS)
+    columns = GroupedData.from_frame(
+        wide, "compound", "concentration", ["r0", "r1", "r2"]
+    )
+    assert_same_groups(rows, columns, rtol=1e-12)
+
+
+def test_padded_groups(screen):
+    groups = GroupedData.from_frame(screen, *COLUMNS)
+    concentration, response, mask = groups.padded()
+
+    assert concentration.shape == (len(groups), groups.lengths.max())
+    np.testing.assert_array_equal(response[mask], groups.response)
+    np.testing.assert_array_equal(concentration[3][mask[3]], groups.group(3)[0])
+    assert groups.padded() is groups.padded()
+
+
+def test_categorical_names_group_like_strings(screen):
+    shuffled = screen.sample(frac=1, random_state=0)
+    categorical = shuffled.assign(
+        compound=pd.Categorical(
+            shuffled["compound"], categories=sorted(screen["compound"].unique())[::-1]
+        )
+    )
+
+    assert_same_groups(
+        GroupedData.from_frame(categorical, *COLUMNS),
+        GroupedData.from_frame(screen, *COLUMNS),
+    )
+
+
+def test_subset_and_take(replicate_screen):
+    groups = GroupedData.from_frame(replicate_screen, *COLUMNS)
+
+    part = groups.subset(3, 6)
+    np.testing.assert_array_equal(part.names, groups.names[3:6])
+    for i in range(3):
+        np.testing.assert_array_equal(part.group(i)[1], groups.group(i + 3)[1])
+        np.testing.assert_array_equal(part.group_sigma(i), groups.group_sigma(i + 3))
+
+    picked = groups.take([7, 2, 11])
+    np.testing.assert_array_equal(picked.names, groups.names[[7, 2, 11]])
+    for i, source in enumerate([7, 2, 11]):
+        np.testing.assert_array_equal(picked.group(i)[0], groups.group(source)[0])
+        np.testing.assert_array_equal(
+            picked.wells[picked.offsets[i]], groups.wells[groups.offsets[source]]
+        )
+    assert_same_groups(groups.take([3, 4, 5]), part)
+
+
+def test_store_round_trip(replicate_screen, tmp_path):
+    groups = GroupedData.from_frame(replicate_screen, *COLUMNS)
+    groups.save(tmp_path / "store")
+
+    loaded = GroupedData.load(tmp_path / "store")
+    assert isinstance(loaded.response, np.memmap)
+    assert_same_groups(loaded, groups)
+
+    # Subsets of a store are pickled as a reference and mapped again
+    part = pickle.loads(pickle.dumps(loaded.subset(5, 8)))
+    assert_same_groups(part, groups.subset(5, 8))
+
+    with pytest.raises(ValueError):
+        GroupedData.load(tmp_path)
+
+
+@pytest.mark.parametrize("chunksize", [7, 1000])
+def test_csv_groups_cover_every_drug_once(screen, tmp_path, chunksize):
+    path = tmp_path / "screen.csv"
+    screen.to_csv(path, index=False)
+
+    parts = list(iter_csv_groups(path, *COLUMNS, chunksize=chunksize))
+    names = np.concatenate([part.names for part in parts])
+    np.testing.assert_array_equal(names, screen["compound"].unique())
+    whole = GroupedData.from_frame(pd.read_csv(path), *COLUMNS)
+    np.testing.assert_array_equal(
+        np.concatenate([part.response for part in parts]), whole.response
+    )
+
+
+def test_csv_groups_must_be_contiguous(screen, tmp_path):
+    path = tmp_path / "screen.csv"
+    screen.sample(frac=1, random_state=0).to_csv(path, index=False)
+
+    with pytest.raises(ValueError, match="next to each other"):
+        list(iter_csv_groups(path, *COLUMNS, chunksize=50))
+
+
+def test_without_rows_and_wells(replicate_screen):
+    groups = GroupedData.from_frame(replicate_screen, *COLUMNS)
+    rows = np.zeros(len(groups.response), dtype=bool)
+    rows[0] = True
+    wells = np.zeros(groups.wells.shape, dtype=bool)
+    wells[1, 0] = True
+
+    clean = groups.without(rows, wells)
+    assert clean.lengths[0] == groups.lengths[0] - 1
+    np.testing.assert_array_equal(clean.concentration, groups.concentration[1:])
+    np.testing.assert_allclose(clean.response[0], np.mean(groups.wells[1, 1:]))
+    np.testing.assert_array_equal(clean.replicates[1:], groups.replicates[2:])
+
+    unchanged = groups.without(np.zeros(len(groups.response), dtype=bool))
+    assert_same_groups(unchanged, groups, rtol=1e-12)
+
+
+def test_content_hashes_follow_the_data(screen):
+    groups = GroupedData.from_frame(screen, *COLUMNS)
+    hashes = groups.content_hashes()
+    assert len(set(hashes)) == len(groups)
+
+    changed = screen.copy()
+    changed.loc[changed["compound"] == "D0004", "response"] += 1
+    new = GroupedData.from_frame(changed, *COLUMNS).content_hashes()
+    assert (new != hashes).sum() == 1
+    assert new[4] != hashes[4]
+    np.testing.assert_array_equal(groups.subset(2, 9).content_hashes(), hashes[2:9])
+
+
+@pytest.fixture
+def screen_files(screen, tmp_path):
+    """The screen as CSV and Parquet files with an extra column that should not be read"""
+    pytest.importorskip("pyarrow")
+    wide = screen.assign(plate="P1")
+    wide.to_csv(tmp_path / "screen.csv", index=False)
+    wide.to_parquet(tmp_path / "screen.parquet", index=False, row_group_size=50)
+    return tmp_path / "screen.csv", tmp_path / "screen.parquet"
+
+
+def test_read_parquet(screen, screen_files):
+    _, path = screen_files
+    data = read_parquet(path, *COLUMNS)
+    assert list(data.columns) == COLUMNS
+    assert isinstance(data["compound"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(data.astype({"compound": object}), screen)
+
+    names = ["D0003", "D0011"]
+    some = read_parquet(path, *COLUMNS, names=names)
+    expected = screen[screen["compound"].isin(names)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(some.astype({"compound": object}), expected)
+
+    # Other read_table() arguments are passed on
+    filtered = read_parquet(path, *COLUMNS, filters=[("concentration", ">", 1.0)])
+    assert (filtered["concentration"] > 1.0).all()
+    assert len(filtered) == (screen["concentration"] > 1.0).sum()
+
+
+def test_parquet_input_matches_csv_input(screen_files):
+    csv, path = screen_files
+    expected = Calculator.from_csv(csv, *COLUMNS).calculate_absolute_ic50(*COLUMNS)
+    results = Calculator.from_parquet(path, *COLUMNS).calculate_absolute_ic50(*COLUMNS)
+    pd.testing.assert_frame_equal(results, expected)
+
+    names = ["D0002", "D0007"]
+    some = Calculator.from_parquet(path, *COLUMNS, names=names)
+    pd.testing.assert_frame_equal(
+        some.calculate_absolute_ic50(*COLUMNS),
+        expected[expected["compound_name"].isin(names)].reset_index(drop=True),
+    )
+
+    plot = PlotCurve.from_parquet(path, *COLUMNS, names=["D0002"])
+    assert plot.data["compound"].tolist() == ["D0002"] * len(plot.data)
+    pd.testing.assert_frame_equal(
+        plot.data,
+        some.data[some.data["compound"] == "D0002"],
+        check_categorical=False,
+    )
@@ -0,0 +1,485 @@
+import itertools
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import curve_fit, least_squares
+from scipy.stats import spearmanr
+from benchmarks.fit_iterations import count_evaluations, synthetic_screen
+from py50_streamlit_support import (
+    Calculator,
+    FitBudget,
+    batch_fit,
+    curve_direction,
+    estimate_initial_guess,
+    fit_models,
+    fivepl_jacobian,
+    fourpl_bounds,
+    fourpl_covariance,
+    fourpl_jacobian,
+    global_covariance,
+    global_fit,
+    inverse_fourpl,
+    logistic_bounds,
+    pad_groups,
+    screen_activity,
+)
+
+COLUMNS = ["compound", "concentration", "response"]
+# Maximum, minimum, ic50, and hill_slope of three curves
+TRUTH = np.array(
+    [[100.0, 0.0, 30.0, 1.0], [95.0, 5.0, 300.0, 1.5], [110.0, -5.0, 2.0, 0.8]]
+)
+
+
+def fourpl(concentration, params, direction):
+    """The 4PL equation of the batch solver. A direction of -1 gives a falling curve"""
+    maximum, minimum, ic50, hill_slope = (params[:, i, None] for i in range(4))
+    return maximum + (minimum - maximum) / (
+        1 + (concentration / ic50) ** (np.asarray(direction)[:, None] * hill_slope)
+    )
+
+
+def fivepl(concentration, params, direction):
+    """The 5PL equation of the batch solver. Rows with a NaN ic50 are flat lines at the maximum"""
+    maximum, minimum, ic50, hill_slope, asymmetry = (
+        params[:, i, None] for i in range(5)
+    )
+    with np.errstate(all="ignore"):
+        curve = (
+            maximum
+            + (minimum - maximum)
+            / (
+                1
+                + (concentration / ic50)
+                ** (np.asarray(direction)[:, None] * hill_slope)
+            )
+            ** asymmetry
+        )
+    return np.where(np.isnan(ic50), maximum, curve)
+
+
+def test_pad_groups():
+    padded, mask = pad_groups(np.arange(6.0), [0, 1, 4, 6])
+
+    np.testing.assert_array_equal(
+        mask, [[True, False, False], [True, True, True], [True, True, False]]
+    )
+    np.testing.assert_array_equal(padded[mask], np.arange(6.0))
+    assert np.isnan(padded[~mask]).all()
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_batch_fit_recovers_noiseless_curves(direction):
+    direction = np.full(len(TRUTH), direction)
+    concentration = np.tile(np.logspace(-1, 4, 12), (len(TRUTH), 1))
+    response = fourpl(concentration, TRUTH, direction)
+    mask = np.ones_like(response, dtype=bool)
+
+    guess = estimate_initial_guess(concentration, response, mask)
+    fit = batch_fit(concentration, response, mask, guess, direction)
+
+    assert len(fit) == len(TRUTH)
+    assert fit.converged.all()
+    np.testing.assert_allclose(fit.params, TRUTH, rtol=1e-6, atol=1e-8)
+    np.testing.assert_array_equal(
+        curve_direction(concentration, response, mask), direction
+    )
+
+
+def test_batch_fit_matches_curve_fit(screen):
+    serial = Calculator(screen).calculate_absolute_ic50(*COLUMNS)
+    batch = Calculator(screen).calculate_absolute_ic50(*COLUMNS, batch=True)
+
+    pd.testing.assert_frame_equal(
+        batch, serial, check_exact=False, rtol=1e-4, atol=1e-3
+    )
+
+
+def test_inverse_fourpl():
+    direction = np.array([1, -1, 1])
+    concentration, reached = inverse_fourpl(TRUTH, direction, target=50)
+
+    assert reached.all()
+    np.testing.assert_allclose(
+        fourpl(concentration[:, None], TRUTH, direction)[:, 0], 50
+    )
+    unreachable, reached = inverse_fourpl(TRUTH, direction, target=150)
+    assert not reached.any()
+    assert np.isnan(unreachable).all()
+
+
+def central_differences(model, concentration, params, direction, step=1e-6):
+    """Jacobian of a batched model by central differences, with a step relative to each parameter"""
+    jacobian = np.empty(concentration.shape + (params.shape[1],))
+    for j in range(params.shape[1]):
+        h = step * np.maximum(np.abs(params[:, j]), 1.0)
+        up, down = params.copy(), params.copy()
+        up[:, j] += h
+        down[:, j] -= h
+        jacobian[:, :, j] = (
+            model(concentration, up, direction) - model(concentration, down, direction)
+        ) / (2 * h[:, None])
+    return jacobian
+
+
+# Parameter grid with falling and rising curves, negative hill slopes, and ic50 values inside and outside the doses
+GRID = np.array(
+    list(
+        itertools.product(
+            [100.0, 20.0], [0.0, -10.0], [0.05, 3.0, 400.0], [-2.0, -0.6, 0.5, 1.0, 3.0]
+        )
+    )
+)
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_fourpl_jacobian_matches_finite_differences(direction):
+    direction = np.full(len(GRID), direction)
+    concentration = np.tile(np.logspace(-2, 3, 9), (len(GRID), 1))
+
+    analytic = fourpl_jacobian(concentration, GRID, direction)
+    numeric = central_differences(fourpl, concentration, GRID, direction)
+    np.testing.assert_allclose(analytic, numeric, rtol=1e-6, atol=1e-6)
+
+    # A single curve gives the same rows as the batch
+    np.testing.assert_allclose(
+        fourpl_jacobian(concentration[5], GRID[5], direction[5]), analytic[5]
+    )
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_fivepl_jacobian_matches_finite_differences(direction):
+    params = np.array(
+        [np.append(row, asymmetry) for row in GRID for asymmetry in [0.3, 1.0, 2.5]]
+    )
+    direction = np.full(len(params), direction)
+    concentration = np.tile(np.logspace(-2, 3, 9), (len(params), 1))
+
+    analytic = fivepl_jacobian(concentration, params, direction)
+    numeric = central_differences(fivepl, concentration, params, direction)
+    np.testing.assert_allclose(analytic, numeric, rtol=1e-6, atol=1e-6)
+
+    # With an asymmetry of 1 the 5PL equation is the 4PL equation
+    symmetric = params[:, 4] == 1.0
+    np.testing.assert_allclose(
+        analytic[symmetric, :, :4],
+        fourpl_jacobian(concentration[symmetric], GRID, direction[symmetric]),
+    )
+
+
+def padded_curves(ic50, hill_slope, maximum=100.0, minimum=0.0, n_doses=12):
+    """Padded arrays of noiseless 4PL curves, one row per ic50"""
+    concentration = np.tile(np.logspace(-1, 4, n_doses), (len(ic50), 1))
+    response = minimum + (maximum - minimum) / (
+        1 + (np.asarray(ic50)[:, None] / concentration) ** hill_slope
+    )
+    return concentration, response, np.ones_like(response, dtype=bool)
+
+
+def test_initial_guess_is_close_to_the_curve():
+    ic50 = np.array([0.5, 3.0, 40.0, 700.0])
+    guess = estimate_initial_guess(*padded_curves(ic50, 1.2))
+
+    np.testing.assert_allclose(guess[:, 2], ic50, rtol=0.25)
+    np.testing.assert_allclose(guess[:, 3], 1.2, rtol=0.3)
+    assert np.all(guess[:, 0] > guess[:, 1])
+
+
+def test_initial_guess_of_no_compounds():
+    empty = np.zeros((0, 5))
+    assert estimate_initial_guess(empty, empty, empty.astype(bool)).shape == (0, 4)
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_data_guess_saves_evaluations(batch):
+    old, new = count_evaluations(synthetic_screen(100, seed=5), batch)
+    assert new < 0.8 * old
+
+
+def test_bounds_hold_the_data():
+    concentration, response, mask = padded_curves(np.array([3.0, 40.0]), 1.0)
+    mask[1, -4:] = False
+    lower, upper = fourpl_bounds(concentration, response, mask)
+
+    assert lower.shape == upper.shape == (2, 4)
+    assert np.all(lower < upper)
+    low, high = response[1][mask[1]].min(), response[1][mask[1]].max()
+    np.testing.assert_allclose(lower[1, :2], low - (high - low))
+    np.testing.assert_allclose(upper[1, :2], high + (high - low))
+    np.testing.assert_allclose(upper[1, 2], concentration[1][mask[1]].max() * 1e3)
+    np.testing.assert_allclose(lower[:, 3], 0.01)
+
+
+def test_bounds_of_no_compounds():
+    empty = np.zeros((0, 5))
+    lower, upper = fourpl_bounds(empty, empty, empty.astype(bool))
+    assert lower.shape == upper.shape == (0, 4)
+
+
+def test_fit_budget_counts_calls_and_stops_at_the_deadline():
+    budget = FitBudget()
+    model, jacobian = budget.model(np.sqrt), budget.jacobian(np.square)
+    assert model(4.0) == 2.0 and jacobian(3.0) == 9.0
+    assert (budget.nfev, budget.njev) == (1, 1)
+    assert budget.remaining() is None
+
+    budget = FitBudget(0.01)
+    time.sleep(0.02)
+    assert budget.remaining() < 0
+    with pytest.raises(TimeoutError):
+        budget.model(np.sqrt)(4.0)
+    assert budget.nfev == 1
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_covariance_matches_curve_fit(weighted):
+    rng = np.random.default_rng(4)
+    direction = np.array([1, -1, 1])
+    concentration = np.tile(np.logspace(-1, 4, 10), (len(TRUTH), 1))
+    sigma = rng.uniform(0.5, 4.0, concentration.shape) if weighted else None
+    noise = rng.normal(0, 1, concentration.shape) * (2.0 if sigma is None else sigma)
+    response = fourpl(concentration, TRUTH, direction) + noise
+    mask = np.ones_like(response, dtype=bool)
+
+    params, expected = np.empty_like(TRUTH), np.empty((len(TRUTH), 4, 4))
+    for i in range(len(TRUTH)):
+
+        def model(x, *p):
+            return fourpl(x[None], np.array([p]), direction[[i]])[0]
+
+        params[i], expected[i] = curve_fit(
+            model,
+            concentration[i],
+            response[i],
+            p0=TRUTH[i],
+            sigma=None if sigma is None else sigma[i],
+            absolute_sigma=False,
+        )
+
+    covariance, condition = fourpl_covariance(
+        concentration, response, mask, params, direction, sigma=sigma
+    )
+    # curve_fit differentiates the model numerically, so small covariances only agree to a few digits
+    np.testing.assert_allclose(
+        covariance, expected, rtol=1e-3, atol=1e-5 * np.abs(expected).max()
+    )
+    np.testing.assert_allclose(
+        np.sqrt(np.diagonal(covariance, axis1=1, axis2=2)),
+        np.sqrt(np.diagonal(expected, axis1=1, axis2=2)),
+        rtol=1e-4,
+    )
+    assert np.all(condition >= 1)
+
+
+# Maximum, minimum, ic50, hill_slope, and asymmetry of curves from the 3PL, 4PL, 5PL, and constant models
+MODEL_TRUTH = np.array(
+    [
+        [100.0, 0.0, 30.0, 1.2, 1.0],
+        [100.0, 20.0, 300.0, 1.0, 1.0],
+        [100.0, 5.0, 10.0, 1.5, 0.25],
+        [50.0, 50.0, np.nan, np.nan, np.nan],
+    ]
+)
+MODEL_NAMES = ["3PL", "4PL", "5PL", "constant"]
+MODEL_DIRECTION = np.array([1, -1, 1, 1])
+
+
+def model_curves(noise=0.0, seed=0):
+    """Padded arrays of one curve for every model in MODEL_TRUTH, and the 4PL fits that fit_models() starts from"""
+    rng = np.random.default_rng(seed)
+    concentration = np.tile(np.logspace(-1, 4, 12), (len(MODEL_TRUTH), 1))
+    response = fivepl(concentration, MODEL_TRUTH, MODEL_DIRECTION)
+    response = response + rng.normal(0, noise, response.shape)
+    mask = np.ones_like(response, dtype=bool)
+    direction = curve_direction(concentration, response, mask)
+    guess = estimate_initial_guess(concentration, response, mask)
+    fit = batch_fit(concentration, response, mask, guess, direction)
+    return concentration, response, mask, fit.params, direction
+
+
+@pytest.mark.parametrize("model", ["3PL", "4PL", "5PL", "constant"])
+def test_models_recover_their_parameters(model):
+    curves = model_curves()
+    i = MODEL_NAMES.index(model)
+    fits = fit_models(*curves, models=(model,))
+
+    assert fits["valid"][i]
+    assert fits["model"][i] == model
+    np.testing.assert_allclose(
+        fits["params"][i], MODEL_TRUTH[i], rtol=1e-5, atol=1e-6, equal_nan=True
+    )
+
+
+@pytest.mark.parametrize("criterion", ["aic", "bic"])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_criterion_picks_the_generating_model(criterion, seed):
+    fits = fit_models(*model_curves(noise=1.0, seed=seed), criterion=criterion)
+
+    assert fits["model"].tolist() == MODEL_NAMES
+    assert fits["valid"].all()
+    assert fits["scores"].shape == (len(MODEL_NAMES), 4)
+    best = np.argmin(fits["scores"], axis=1)
+    assert [("4PL", "3PL", "5PL", "constant")[j] for j in best] == MODEL_NAMES
+
+
+@pytest.mark.parametrize("model, free", [("3PL", [0, 2, 3]), ("5PL", [0, 1, 2, 3, 4])])
+def test_fits_on_a_bound_are_rejected(model, free):
+    # Curves without an effect, whose 3PL and 5PL fits often run into a bound
+    rng = np.random.default_rng(0)
+    concentration = np.tile(np.logspace(-1, 4, 12), (100, 1))
+    response = rng.uniform(0, 100, (100, 1)) + rng.normal(0, 3, (100, 12))
+    mask = np.ones_like(response, dtype=bool)
+    direction = curve_direction(concentration, response, mask)
+    guess = estimate_initial_guess(concentration, response, mask)
+    start = batch_fit(concentration, response, mask, guess, direction).params
+    lower, upper = logistic_bounds(concentration, response, mask)
+
+    fits = fit_models(concentration, response, mask, start, direction, models=(model,))
+    valid = fits["valid"]
+    assert 0 < valid.sum() < len(valid)
+    params = fits["params"][valid][:, free]
+    lower, upper = lower[valid][:, free], upper[valid][:, free]
+    assert np.all((params > lower) & (params < upper))
+    assert not np.isclose(params, lower, rtol=1e-6, atol=0).any()
+    assert not np.isclose(params, upper, rtol=1e-6, atol=0).any()
+    assert np.isinf(fits["scores"][~valid]).all()
+
+    both = fit_models(
+        concentration, response, mask, start, direction, models=(model, "constant")
+    )
+    assert (both["model"][~valid] == "constant").all()
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        fit_models(*model_curves(), models=("6PL",))
+
+
+def dense_joint_fit(concentration, response, direction, shared, start):
+    """
+    Joint 4PL fit of one group with scipy least_squares on the dense Jacobian of all parameters, and its covariance
+    from inv(J^T J) scaled by the residual variance
+
+    :return: Parameters of shape (compounds, 4) and their standard errors
+    """
+    n_compounds = len(start)
+    local = [j for j in range(4) if j not in shared]
+
+    def unpack(x):
+        params = np.empty((n_compounds, 4))
+        params[:, shared] = x[: len(shared)]
+        params[:, local] = x[len(shared) :].reshape(n_compounds, len(local))
+        return params
+
+    def residuals(x):
+        return (fourpl(concentration, unpack(x), direction) - response).ravel()
+
+    x0 = np.concatenate([np.median(start[:, shared], axis=0), start[:, local].ravel()])
+    solution = least_squares(residuals, x0, method="lm", xtol=1e-14, ftol=1e-14)
+    dof = response.size - len(x0)
+    covariance = np.linalg.inv(solution.jac.T @ solution.jac) * 2 * solution.cost / dof
+    return unpack(solution.x), unpack(np.sqrt(np.diag(covariance)))
+
+
+@pytest.mark.parametrize("shared", [[3], [0, 1]])
+def test_global_fit_matches_dense_joint_fit(shared):
+    rng = np.random.default_rng(6)
+    n_compounds = 6
+    truth = np.column_stack(
+        [
+            rng.uniform(95, 105, n_compounds),
+            rng.uniform(-5, 5, n_compounds),
+            10 ** rng.uniform(0.5, 2.5, n_compounds),
+            rng.uniform(0.8, 1.4, n_compounds),
+        ]
+    )
+    direction = np.array([1, -1, 1, 1, -1, 1])
+    groups = np.array(["A", "A", "A", "B", "B", "B"])
+    concentration = np.tile(np.logspace(-1, 4, 10), (n_compounds, 1))
+    response = fourpl(concentration, truth, direction)
+    response = response + rng.normal(0, 2, response.shape)
+    mask = np.ones_like(response, dtype=bool)
+    start = batch_fit(concentration, response, mask, truth, direction).params
+
+    fit = global_fit(
+        concentration,
+        response,
+        mask,
+        start,
+        direction,
+        shared,
+        groups=groups,
+        ftol=1e-14,
+        xtol=1e-14,
+    )
+    covariance, _ = global_covariance(
+        concentration, response, mask, fit.params, direction, shared, groups=groups
+    )
+    errors = np.sqrt(np.diagonal(covariance, axis1=1, axis2=2))
+
+    assert fit.converged.all()
+    for group in ["A", "B"]:
+        rows = groups == group
+        params, expected_errors = dense_joint_fit(
+            concentration[rows], response[rows], direction[rows], shared, start[rows]
+        )
+        np.testing.assert_allclose(fit.params[rows], params, rtol=1e-7, atol=1e-6)
+        np.testing.assert_allclose(errors[rows], expected_errors, rtol=1e-4)
+        # Shared parameters are equal within the group
+        for j in shared:
+            assert np.ptp(fit.params[rows, j]) == 0
+
+
+def activity_curves():
+    """Padded curves of full and partial inhibitors, and of flat, weak, and bell-shaped inactive compounds"""
+    rng = np.random.default_rng(8)
+    dose = np.logspace(-1, 4, 10)
+    rising = 1 / (1 + 10 / dose)
+    bell = np.exp(-0.5 * ((np.log10(dose) - 1.5) / 0.8) ** 2)
+    response = np.stack(
+        [
+            100 * rising,
+            100 - 50 * rising,
+            np.full(10, 50.0),
+            12 * rising,
+            80 * bell,
+            60 * rising,
+        ]
+    )
+    concentration = np.tile(dose, (len(response), 1))
+    response = response + rng.normal(0, 2, response.shape)
+    mask = np.ones_like(response, dtype=bool)
+    # The last curve loses its top doses to padding
+    mask[5, 8:] = False
+    return concentration, response, mask
+
+
+def test_activity_of_real_and_inactive_curves():
+    concentration, response, mask = activity_curves()
+    screen = screen_activity(concentration, response, mask)
+
+    assert screen["activity"].tolist() == [
+        "full",
+        "partial",
+        "inactive",
+        "inactive",
+        "inactive",
+        "partial",
+    ]
+    # The bell-shaped curve spans 80% but has neither an effect nor a monotonic trend
+    assert screen["span"][4] > 70
+    assert screen["effect"][4] < 20 and abs(screen["trend"][4]) < 0.6
+    for i in range(len(response)):
+        expected = spearmanr(concentration[i][mask[i]], response[i][mask[i]])[0]
+        np.testing.assert_allclose(screen["trend"][i], expected, rtol=1e-12)
+
+
+def test_activity_thresholds():
+    curves = activity_curves()
+    weak = screen_activity(*curves, min_span=10, min_effect=10)
+    assert weak["activity"][3] == "partial"
+    strict = screen_activity(*curves, full_effect=150)
+    assert strict["activity"][0] == "partial"
+    empty = np.zeros((0, 5))
+    assert len(screen_activity(empty, empty, empty.astype(bool))["activity"]) == 0
@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import CancelledError, TimeoutError
+import pandas as pd
+import pytest
+from py50_streamlit_support import Calculator, FitJob
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+def test_job_reports_progress(screen):
+    updates = []
+    calculator = Calculator(screen)
+    job = calculator.submit(
+        *COLUMNS, chunk_size=6, callback=lambda done, total: updates.append(done)
+    )
+    results = job.result(timeout=60)
+
+    assert updates == [6, 12, 18, 20]
+    assert job.done() and not job.running() and not job.cancelled()
+    assert job.progress == 1.0
+    assert job.exception() is None
+    assert not job.cancel()
+    pd.testing.assert_frame_equal(job.partial(), results)
+    assert calculator.fit_stats["compounds"] == calculator.fit_stats["fits"] == 20
+
+
+@pytest.mark.parametrize("calculation", ["relative", "absolute", "pic50"])
+def test_job_matches_calculation(screen, calculation):
+    method = {
+        "relative": "calculate_ic50",
+        "absolute": "calculate_absolute_ic50",
+        "pic50": "calculate_pic50",
+    }[calculation]
+    job = Calculator(screen).submit(*COLUMNS, calculation=calculation, chunk_size=7)
+    full = getattr(Calculator(screen), method)(*COLUMNS)
+
+    pd.testing.assert_frame_equal(job.result(timeout=60), full)
+
+
+def test_cancel_keeps_finished_chunks(screen):
+    first_chunk, release = threading.Event(), threading.Event()
+
+    def wait_after_first_chunk(done, total):
+        first_chunk.set()
+        release.wait(10)
+
+    calculator = Calculator(screen)
+    job = calculator.submit(*COLUMNS, chunk_size=5, callback=wait_after_first_chunk)
+    assert first_chunk.wait(30)
+
+    assert job.cancel()
+    assert job.cancel()
+    assert job.cancelled() and job.done() and not job.running()
+    with pytest.raises(CancelledError):
+        job.result(timeout=0)
+    with pytest.raises(CancelledError):
+        job.exception(timeout=0)
+    release.set()
+
+    partial = job.partial()
+    assert len(partial) == 5
+    assert calculator.fit_stats["fits"] == 5
+    # Fits of the finished chunk are cached
+    cache = calculator.cache
+    assert len(cache) == 5
+    full = Calculator(screen, cache=cache)
+    full.calculate_absolute_ic50(*COLUMNS)
+    assert full.fit_stats["cache_hits"] == 5
+
+
+def test_failed_chunk_is_raised_by_result():
+    release = threading.Event()
+
+    def fit_chunk(chunk):
+        release.wait(10)
+        if chunk == "bad":
+            raise RuntimeError("fit failed")
+        return chunk
+
+    job = FitJob(2)
+    job._start(["good", "bad"], fit_chunk, build=list)
+    with pytest.raises(TimeoutError):
+        job.result(timeout=0.01)
+    release.set()
+
+    with pytest.raises(RuntimeError, match="fit failed"):
+        job.result(timeout=10)
+    assert isinstance(job.exception(), RuntimeError)
+    assert job.partial() == ["good"]
+    assert not job.cancel()
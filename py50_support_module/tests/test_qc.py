@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import make_screen
+from py50_streamlit_support import (
+    Calculator,
+    GroupedData,
+    normalize_plates,
+    outlier_mask,
+)
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+@pytest.fixture
+def clean():
+    """Screen in which outlier_mask() finds nothing"""
+    return make_screen(n_drugs=8, n_doses=10, replicates=3, seed=2)
+
+
+@pytest.fixture
+def spoiled(clean):
+    """The clean screen with one replicate outlier in D0002 and one spiked dose in D0005"""
+    data = clean.copy()
+    drug = data[data["compound"] == "D0002"]
+    data.loc[drug.index[4 * 3 + 1], "response"] += 60
+    drug = data[data["compound"] == "D0005"]
+    data.loc[drug.index[6 * 3 : 7 * 3], "response"] += 70
+    return data
+
+
+def test_outlier_mask_flags_the_bad_points(spoiled):
+    groups = GroupedData.from_frame(spoiled, *COLUMNS)
+    flags = outlier_mask(*groups.padded(), groups.padded_wells())
+
+    assert np.argwhere(flags["wells"]).tolist() == [[2, 4, 1]]
+    assert np.argwhere(flags["spikes"]).tolist() == [[5, 6]]
+
+    # Without wells only the spike check runs
+    spikes_only = outlier_mask(*groups.padded())
+    assert spikes_only["wells"] is None
+    assert np.argwhere(spikes_only["spikes"]).tolist() == [[5, 6]]
+
+
+def test_clean_curves_are_not_flagged(clean):
+    groups = GroupedData.from_frame(clean, *COLUMNS)
+    flags = outlier_mask(*groups.padded(), groups.padded_wells())
+
+    assert not flags["wells"].any()
+    assert not flags["spikes"].any()
+
+
+def test_only_monotone_curves_have_spikes():
+    doses = 10.0 ** np.arange(9)
+    rising = 100 / (1 + 10.0 ** ((4 - np.arange(9)) / 2))
+    rising[2] += 50
+    bell = 90 * np.exp(-((np.arange(9) - 4) ** 2) / 2)
+    frame = pd.DataFrame(
+        {
+            "compound": ["rising"] * 9 + ["bell"] * 9,
+            "concentration": np.tile(doses, 2),
+            "response": np.concatenate([rising, bell]),
+        }
+    )
+    groups = GroupedData.from_frame(frame, *COLUMNS)
+    spikes = outlier_mask(*groups.padded())["spikes"]
+
+    assert groups.names.tolist() == ["bell", "rising"]
+    assert np.argwhere(spikes).tolist() == [[1, 2]]
+
+
+def test_dropped_points_are_reported(spoiled):
+    calculator = Calculator(spoiled)
+    cleaned = calculator.calculate_absolute_ic50(*COLUMNS, drop_outliers=True)
+    report = calculator.dropped_points
+
+    assert report["compound_name"].tolist() == ["D0002", "D0005"]
+    assert report["reason"].tolist() == ["replicate outlier", "spike"]
+    # Only the drugs with dropped points change, apart from rounding in the replicate means
+    raw = Calculator(spoiled).calculate_absolute_ic50(*COLUMNS)
+    spoiled_rows = raw["compound_name"].isin(["D0002", "D0005"])
+    pd.testing.assert_frame_equal(
+        cleaned[~spoiled_rows], raw[~spoiled_rows], check_exact=False, rtol=1e-9
+    )
+    moved = ~np.isclose(
+        cleaned.select_dtypes("number"), raw.select_dtypes("number"), rtol=1e-3
+    )
+    assert moved.any(axis=1)[spoiled_rows].all()
+
+
+def plate_wells():
+    """
+    Plate A with low signals for full inhibition, plate B with high ones, and plate C without negative controls. The
+    sample well of A and B is at 50% inhibition
+    """
+    plate = ["A"] * 5 + ["B"] * 5 + ["C"] * 3
+    signal = [10, 12, 100, 98, 55, 200, 202, 20, 22, 111, 10, 12, 50]
+    positive = [1, 1, 0, 0, 0, 1, 1, 0, 0, 0, 1, 1, 0]
+    negative = [0, 0, 1, 1, 0, 0, 0, 1, 1, 0, 0, 0, 0]
+    return plate, signal, np.array(positive, bool), np.array(negative, bool)
+
+
+def test_normalize_plates():
+    plate, signal, positive, negative = plate_wells()
+    inhibition, stats = normalize_plates(plate, signal, positive, negative)
+
+    np.testing.assert_allclose(inhibition[[4, 9]], 50)
+    np.testing.assert_allclose(inhibition[positive][:4], 100, atol=1.2)
+    np.testing.assert_allclose(inhibition[negative], 0, atol=1.2)
+    assert np.isnan(inhibition[12])
+
+    assert stats["plate"].tolist() == ["A", "B", "C"]
+    spread = 3 * 2 * np.sqrt(2)
+    np.testing.assert_allclose(
+        stats["z_prime"][:2], [1 - spread / 88, 1 - spread / 180]
+    )
+    np.testing.assert_allclose(
+        stats["signal window"][:2],
+        [(88 - spread) / np.sqrt(2), (180 - spread) / np.sqrt(2)],
+    )
+    assert np.isnan(stats["z_prime"][2])
+
+
+def test_normalize_plates_rejects_bad_wells():
+    plate, signal, positive, negative = plate_wells()
+    with pytest.raises(ValueError, match="same length"):
+        normalize_plates(plate[:3], signal, positive, negative)
+    with pytest.raises(ValueError, match="both"):
+        normalize_plates(plate, signal, positive, positive)
+    with pytest.raises(ValueError, match="missing"):
+        normalize_plates([None] + plate[1:], signal, positive, negative)
+
+
+def test_from_plates_leaves_out_failed_plates():
+    plate, signal, positive, negative = plate_wells()
+    name = ["X"] * len(plate)
+    concentration = np.where(positive | negative, np.nan, 10.0)
+    columns = ["compound_name", "concentration", "response"]
+
+    calculator = Calculator.from_plates(
+        name, concentration, plate, signal, positive, negative
+    )
+    assert calculator.plate_stats["passed"].all()
+    # The sample of plate C has no inhibition, so only A and B are left
+    assert calculator._grouped(*columns).replicates.tolist() == [2]
+
+    strict = Calculator.from_plates(
+        name, concentration, plate, signal, positive, negative, min_z_prime=0.92
+    )
+    assert strict.plate_stats["passed"].tolist() == [False, True, False]
+    groups = strict._grouped(*columns)
+    np.testing.assert_allclose(groups.response, 50)
+    assert groups.replicates is None
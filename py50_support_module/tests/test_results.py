@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from py50_streamlit_support import Calculator, FitResults
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+@pytest.fixture
+def results(screen):
+    return Calculator(screen).calculate_absolute_ic50(*COLUMNS, as_frame=False)
+
+
+def test_results_match_the_frame(screen, results):
+    frame = Calculator(screen).calculate_absolute_ic50(*COLUMNS)
+
+    assert isinstance(results, FitResults)
+    assert len(results) == len(frame)
+    assert results.fields == list(frame.columns)
+    pd.testing.assert_frame_equal(results.to_pandas(), frame)
+    pd.testing.assert_frame_equal(FitResults.from_pandas(frame).to_pandas(), frame)
+
+
+def test_rows_and_lookup(results):
+    row = results.row("D0007")
+    assert row["compound_name"] == "D0007"
+    assert "hill_slope" in row
+    assert row.keys() == results.fields
+    assert row.to_dict()["maximum"] == results["maximum"][results.index("D0007")]
+    assert results[-1]["compound_name"] == results.names[-1]
+    assert [item["compound_name"] for item in results] == list(results.names)
+
+    with pytest.raises(KeyError):
+        results.row("missing")
+    with pytest.raises(IndexError):
+        results[len(results)]
+
+
+def test_take_and_concat(results):
+    first, rest = results.take(np.arange(5)), results.take(np.arange(5, len(results)))
+    joined = FitResults.concat([FitResults(), first, rest])
+    pd.testing.assert_frame_equal(joined.to_pandas(), results.to_pandas())
+
+    mask = results["hill_slope"] < 0
+    falling = results.take(mask)
+    assert len(falling) == mask.sum()
+    assert (falling["hill_slope"] < 0).all()
+    assert len(FitResults.concat([])) == 0
+
+
+def test_columns_must_match_the_drugs(results):
+    results["flag"] = np.ones(len(results), dtype=bool)
+    assert results.fields[-1] == "flag"
+    with pytest.raises(ValueError):
+        results["flag"] = [True]
+
+    # Renaming drugs rebuilds the name index
+    results.index("D0001")
+    results["compound_name"] = np.char.add("X", results.names.astype(str))
+    assert results.index("XD0001") == 1
+
+
+def test_parquet_round_trip(results, tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "results.parquet"
+    results.to_parquet(path)
+
+    pd.testing.assert_frame_equal(pd.read_parquet(path), results.to_pandas())
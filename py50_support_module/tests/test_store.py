@@ -0,0 +1,87 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from py50_streamlit_support import Calculator, FitResultStore
+
+COLUMNS = ["compound", "concentration", "response"]
+
+
+def test_fits_round_trip(tmp_path):
+    fit = {
+        "reverse": np.int64(1),
+        "params": np.array([100.0, 1.0, 30.0, 1.2]),
+        "status": "converged",
+        "nfev": np.int64(12),
+        "njev": np.int64(5),
+        "model": "4PL",
+        "asymmetry": np.float64(np.nan),
+    }
+    with FitResultStore(str(tmp_path / "fits.db")) as store:
+        store.put_many({"a": fit, "b": dict(fit, status="bounded")})
+        assert len(store) == 2
+
+    with FitResultStore(str(tmp_path / "fits.db")) as store:
+        found = store.get_many(["a", "b", "missing"])
+    assert sorted(found) == ["a", "b"]
+    assert found["b"]["status"] == "bounded"
+    for field, value in fit.items():
+        np.testing.assert_array_equal(found["a"][field], value)
+
+
+def test_stored_fits_are_reused(screen):
+    store = FitResultStore()
+    first = Calculator(screen)
+    expected = first.calculate_absolute_ic50(*COLUMNS, store=store)
+    assert first.fit_stats["store_hits"] == 0
+    assert len(store) == len(expected)
+
+    # A new session with an empty cache finds every fit in the store
+    second = Calculator(screen)
+    results = second.calculate_absolute_ic50(*COLUMNS, store=store)
+    assert second.fit_stats["store_hits"] == len(expected)
+    assert second.fit_stats["fits"] == 0
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_runs_and_history(screen):
+    store = FitResultStore()
+    first = Calculator(screen).calculate_absolute_ic50(*COLUMNS, store=store)
+    changed = screen.assign(response=screen["response"] * 1.05)
+    second = Calculator(changed).calculate_absolute_ic50(
+        *COLUMNS, input_units="µM", target=80, store=store
+    )
+
+    runs = store.runs()
+    assert runs["run"].tolist() == [1, 2]
+    assert runs["units"].tolist() == ["nM", "µM"]
+    assert runs["target"].tolist() == [50.0, 80.0]
+    assert json.loads(runs["options"][1])["input_units"] == "µM"
+
+    history = store.history("D0003")
+    assert history["run"].tolist() == [1, 2]
+    row = first.set_index("compound_name").loc["D0003"]
+    assert history["absolute_ic50"][0] == row["absolute ic50 (nM)"]
+    latest = store.latest(["D0003", "D0004"])
+    assert latest["run"].tolist() == [2, 2]
+    expected = second.set_index("compound_name")["absolute ic80 (µM)"]
+    assert latest["absolute_ic50"].tolist() == expected[["D0003", "D0004"]].tolist()
+
+    assert len(store.history(run=1)) == len(first)
+    assert store.history([]).empty
+
+
+def test_history_of_many_compounds(screen):
+    store = FitResultStore()
+    Calculator(screen).calculate_absolute_ic50(*COLUMNS, store=store)
+    names = [f"missing {i}" for i in range(1200)] + ["D0001", "D0000"]
+
+    history = store.history(names)
+    assert history["compound"].tolist() == ["D0000", "D0001"]
+
+
+def test_record_needs_ic50_columns(screen):
+    store = FitResultStore()
+    results = Calculator(screen).calculate_ic50(*COLUMNS, as_frame=False)
+    with pytest.raises(ValueError, match="absolute ic50"):
+        store.record(results, [""] * len(results))